@@ -0,0 +1,305 @@
+import numpy as np
+import importlib
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import subprocess
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+# Host-side inference benchmark. Runs the MNIST test set through every inference
+# path of the repo - Keras, the NumPy engine, the bit-exact HLS model, the
+# fixed-point engine and the board emulator over a pty - and records import time,
+# cold (first call) and warm single-image latency, throughput per batch size,
+# accuracy and peak RSS. Each engine runs in a freshly spawned process so imports
+# are cold and RSS is per engine. Results are written as JSON (and optionally CSV)
+# together with the commit they were measured on, and -compare checks them
+# against an earlier run.
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+PYTHON_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..', 'python'))
+REPO_DIR = os.path.normpath(os.path.join(BENCH_DIR, '..', '..'))
+if PYTHON_DIR not in sys.path:
+	sys.path.insert(0, PYTHON_DIR)
+
+ENGINES = ('keras', 'numpy', 'hls_sim', 'quantized', 'emulator')
+ENGINE_MODULES = {'keras': 'tensorflow', 'numpy': 'nn_engine', 'hls_sim': 'hls_sim', 'quantized': 'quantize', 'emulator': 'board_emulator'}
+BATCH_SIZES = (1, 4, 16, 64, 256, 1024, 4096)
+EMULATOR_MAX_BATCH = 256 # images per protocol frame
+SEED = 0
+
+# Metrics compared by -compare and whether larger is better
+COMPARED = {'import_s': False, 'cold_ms': False, 'warm_p50_ms': False, 'warm_p99_ms': False, 'peak_rss_mb': False, 'accuracy': True}
+
+
+class EmulatorEngine:
+	"""Framed board emulator behind a StreamClient, predict() streams a batch and waits for the results"""
+
+	def __init__(self, weights, baud=None):
+		import board_emulator
+		import protocol
+		import uart_stream
+		self.board = board_emulator.FramedBoard(weights=weights, baud=baud).start()
+		self.client = uart_stream.StreamClient(self.board.port, framed=protocol.FMT_UINT8)
+
+	def predict(self, images):
+		pred = np.empty(len(images), dtype=np.int64)
+
+		def on_reply(index, reply, latency):
+			pred[index] = reply[0]
+
+		batch = min(len(images), EMULATOR_MAX_BATCH)
+		self.client.stream(iter(images), 2 * batch, on_reply, batch)
+		return pred
+
+	def close(self):
+		self.client.close()
+		self.board.stop()
+
+
+def make_engine(name, weights, options):
+	"""Return (predict, close) for an engine, raises ImportError/OSError if it cannot run here"""
+	if name == 'keras':
+		import tensorflow as tf
+		if not os.path.exists(options['keras_model']):
+			raise FileNotFoundError("No Keras model at %s, run mnist_net.py first" % options['keras_model'])
+		model = tf.keras.models.load_model(options['keras_model'])
+		shape = (-1,) + tuple(model.input_shape[1:])
+		return (lambda x: np.argmax(model.predict_on_batch(x.reshape(shape)), axis=1)), None
+	if name == 'numpy':
+		import nn_engine
+		return nn_engine.NNEngine(weights).predict, None
+	if name == 'hls_sim':
+		import hls_sim
+		return (lambda x: hls_sim.nn_inference(x, weights)[0]), None
+	if name == 'quantized':
+		import quantize
+		W, I = options['fixed']
+		return quantize.FixedPointEngine(weights, W, I).predict, None
+	if name == 'emulator':
+		engine = EmulatorEngine(weights, options['baud'])
+		return engine.predict, engine.close
+	raise ValueError("Unknown engine " + name)
+
+
+def peak_rss_mb():
+	rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+	return rss / (1024.0 * 1024.0) if sys.platform == 'darwin' else rss / 1024.0 # bytes on macOS, KiB on Linux
+
+
+def percentiles_ms(seconds):
+	ms = np.asarray(seconds) * 1000
+	return {'p50': float(np.percentile(ms, 50)), 'p95': float(np.percentile(ms, 95)), 'p99': float(np.percentile(ms, 99)), 'mean': float(ms.mean())}
+
+
+def throughput(predict, images, batch, min_time):
+	"""Images/s pushing the test set through predict() `batch` at a time for at least min_time seconds"""
+	n_images = 0
+	start = 0
+	start_t = time.perf_counter()
+	while True:
+		if start + batch > len(images):
+			start = 0
+		predict(images[start:start + batch])
+		start += batch
+		n_images += batch
+		elapsed = time.perf_counter() - start_t
+		if elapsed >= min_time:
+			return n_images / elapsed
+
+
+def bench_engine(name, options):
+	"""Benchmark one engine, meant to run in a fresh process"""
+	result = {'engine': name}
+	try:
+		start_t = time.perf_counter() # first import in this process, numpy is already loaded
+		importlib.import_module(ENGINE_MODULES[name])
+		result['import_s'] = time.perf_counter() - start_t
+
+		import dataset
+		import nn_engine
+		images, labels = dataset.load_dataset('testing', options['dims'])
+		images = dataset.normalize(images).reshape(len(images), -1)
+		weights = nn_engine.load_weights_hpp(options['hpp'])
+
+		start_t = time.perf_counter()
+		predict, close = make_engine(name, weights, options)
+		result['setup_s'] = time.perf_counter() - start_t
+	except (ImportError, OSError) as e:
+		result['skipped'] = str(e)
+		return result
+
+	try:
+		rng = np.random.default_rng(SEED)
+		order = rng.permutation(len(images))
+
+		start_t = time.perf_counter()
+		predict(images[order[:1]])
+		result['cold_ms'] = (time.perf_counter() - start_t) * 1000
+
+		for i in order[1:11]: # warm up
+			predict(images[i:i + 1])
+		latencies = []
+		for i in order[11:11 + options['repeats']]:
+			start_t = time.perf_counter()
+			predict(images[i:i + 1])
+			latencies.append(time.perf_counter() - start_t)
+		warm = percentiles_ms(latencies)
+		result.update({'warm_%s_ms' % key: value for key, value in warm.items()})
+
+		batch_sizes = [b for b in options['batch_sizes'] if b <= len(images)]
+		result['images_per_s'] = {str(b): throughput(predict, images, b, options['min_time']) for b in batch_sizes}
+
+		largest = max(batch_sizes)
+		pred = np.concatenate([predict(images[i:i + largest]) for i in range(0, len(images), largest)])
+		result['accuracy'] = float(np.mean(pred == labels))
+		result['peak_rss_mb'] = peak_rss_mb()
+	finally:
+		if close:
+			close()
+	return result
+
+
+def git_revision():
+	"""Return (commit, dirty) of the working tree, (None, None) outside git"""
+	try:
+		commit = subprocess.check_output(['git', 'rev-parse', 'HEAD'], cwd=REPO_DIR, stderr=subprocess.DEVNULL).decode().strip()
+		dirty = bool(subprocess.check_output(['git', 'status', '--porcelain', '--untracked-files=no'], cwd=REPO_DIR).strip())
+		return commit, dirty
+	except (OSError, subprocess.CalledProcessError):
+		return None, None
+
+
+def environment():
+	commit, dirty = git_revision()
+	return {
+		'commit': commit,
+		'dirty': dirty,
+		'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+		'python': platform.python_version(),
+		'numpy': np.__version__,
+		'platform': platform.platform(),
+		'machine': platform.machine(),
+		'cpu_count': os.cpu_count(),
+	}
+
+
+def run(engines, options):
+	"""Benchmark every engine in its own spawned process, returns the results document"""
+	results = []
+	context = multiprocessing.get_context('spawn')
+	for name in engines:
+		print("Benchmarking", name, "...")
+		with ProcessPoolExecutor(max_workers=1, mp_context=context) as pool:
+			results.append(pool.submit(bench_engine, name, options).result())
+	return {'environment': environment(), 'options': options, 'results': results}
+
+
+def write_csv(doc, path):
+	"""One engine,metric,value row per measurement (throughput as images_per_s.<batch>)"""
+	import csv
+	with open(path, 'w', newline='') as f:
+		writer = csv.writer(f)
+		writer.writerow(['commit', 'engine', 'metric', 'value'])
+		for result in doc['results']:
+			for key, value in result.items():
+				if key == 'engine':
+					continue
+				if isinstance(value, dict):
+					for batch, v in value.items():
+						writer.writerow([doc['environment']['commit'], result['engine'], key + '.' + batch, v])
+				else:
+					writer.writerow([doc['environment']['commit'], result['engine'], key, value])
+
+
+def print_table(doc):
+	batch_sizes = [str(b) for b in doc['options']['batch_sizes']]
+	print("\n%-10s %9s %9s %9s %9s %8s %8s  images/s at batch %s" % ('engine', 'import ms', 'cold ms', 'p50 ms', 'p99 ms', 'RSS MB', 'acc', '/'.join(batch_sizes)))
+	for r in doc['results']:
+		if 'skipped' in r:
+			print("%-10s skipped: %s" % (r['engine'], r['skipped']))
+			continue
+		rates = ' '.join('%.0f' % r['images_per_s'][b] for b in batch_sizes if b in r['images_per_s'])
+		print("%-10s %9.2f %9.3f %9.3f %9.3f %8.1f %8.4f  %s" % (r['engine'], r['import_s'] * 1000, r['cold_ms'],
+			r['warm_p50_ms'], r['warm_p99_ms'], r['peak_rss_mb'], r['accuracy'], rates))
+
+
+def compare(doc, baseline, threshold):
+	"""Print changes against a baseline run, returns the list of regressions beyond threshold (fraction)"""
+	old = {r['engine']: r for r in baseline['results'] if 'skipped' not in r}
+	regressions = []
+	print("\nCompared with", baseline['environment'].get('commit'))
+	for r in doc['results']:
+		if 'skipped' in r or r['engine'] not in old:
+			continue
+		metrics = [(key, r[key], old[r['engine']].get(key), higher) for key, higher in COMPARED.items()]
+		metrics += [('images_per_s.' + b, v, old[r['engine']].get('images_per_s', {}).get(b), True) for b, v in r['images_per_s'].items()]
+		for key, new, prev, higher_is_better in metrics:
+			if not prev:
+				continue
+			change = (new - prev) / prev
+			worse = -change if higher_is_better else change
+			flag = "  REGRESSION" if worse > threshold else ""
+			if flag or abs(change) > threshold:
+				print("  %-10s %-22s %12.4g -> %-12.4g %+6.1f%%%s" % (r['engine'], key, prev, new, change * 100, flag))
+			if flag:
+				regressions.append((r['engine'], key))
+	if not regressions:
+		print("  No regressions beyond %.0f%%" % (threshold * 100))
+	return regressions
+
+
+def main():
+	## Benchmark all engines, e.g. python3 bench.py -out bench_results.json -compare baseline.json
+	import argparse
+	parser = argparse.ArgumentParser(description='Benchmark Keras, NumPy, HLS-model, fixed-point and emulated-board inference')
+	parser.add_argument('-engines', nargs='+', choices=ENGINES, default=list(ENGINES))
+	parser.add_argument('-batch_sizes', type=int, nargs='+', default=list(BATCH_SIZES))
+	parser.add_argument('-repeats', type=int, default=200, help='single-image calls for the warm latency percentiles')
+	parser.add_argument('-min_time', type=float, default=0.5, help='seconds per throughput measurement')
+	parser.add_argument('-keras_model', default=os.path.join(PYTHON_DIR, 'mnist_net.h5'), help='model saved by mnist_net.py')
+	parser.add_argument('-hpp', default=None, help='matmul.hpp to take the weights from (default src/hls/matmul.hpp)')
+	parser.add_argument('-fixed', type=int, nargs=2, default=[10, 5], metavar=('W', 'I'), help='ap_fixed format of the quantized engine')
+	parser.add_argument('-baud', type=int, default=None, help='emulated UART baud rate (default unlimited)')
+	parser.add_argument('-dims', type=int, nargs=2, default=[10, 10])
+	parser.add_argument('-out', default='bench_results.json')
+	parser.add_argument('-csv', default=None, help='also write flat engine,metric,value rows to this file')
+	parser.add_argument('-compare', default=None, help='earlier -out file to compare against')
+	parser.add_argument('-threshold', type=float, default=0.1, help='relative change reported as a regression')
+	args = parser.parse_args()
+
+	options = {
+		'batch_sizes': args.batch_sizes,
+		'repeats': args.repeats,
+		'min_time': args.min_time,
+		'keras_model': args.keras_model,
+		'hpp': args.hpp,
+		'fixed': args.fixed,
+		'baud': args.baud,
+		'dims': args.dims,
+	}
+	for b in args.batch_sizes:
+		if b > EMULATOR_MAX_BATCH and 'emulator' in args.engines:
+			print("Note: emulator batches above", EMULATOR_MAX_BATCH, "are sent as several frames")
+			break
+
+	doc = run(args.engines, options)
+	print_table(doc)
+	with open(args.out, 'w') as f:
+		json.dump(doc, f, indent=2)
+	print("\nWrote", args.out)
+	if args.csv:
+		write_csv(doc, args.csv)
+		print("Wrote", args.csv)
+	if args.compare:
+		with open(args.compare) as f:
+			baseline = json.load(f)
+		if compare(doc, baseline, args.threshold):
+			sys.exit(1)
+
+
+if __name__=="__main__":
+	main()
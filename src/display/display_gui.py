@@ -8,7 +8,10 @@ Can run on Zynq ARM processor or development PC
 import tkinter as tk
 from tkinter import ttk
 import numpy as np
-import time
+import metrics
+
+# '#rrggbb' fill for every 8-bit gray level, so redraws never format colors
+GRAY_COLORS = [f'#{g:02x}{g:02x}{g:02x}' for g in range(256)]
 
 class DigitRecognitionDisplay:
     def __init__(self, root):
@@ -16,6 +19,7 @@ class DigitRecognitionDisplay:
         self.root.title("MNIST Digit Recognition - FPGA Accelerator")
         self.root.geometry("800x600")
         self.root.configure(bg='#1E3A8A')
+        self._widget_state = {}  # last options applied per widget, see set_widget
         
         # Create main container
         self.create_header()
@@ -24,8 +28,24 @@ class DigitRecognitionDisplay:
         self.create_status_bar()
         
         # Statistics
-        self.total_processed = 0
-        self.correct_predictions = 0
+        self.metrics = metrics.MetricsCollector()
+        self.skipped = 0  # results drained together with a newer one, counted but not drawn
+        
+    @property
+    def total_processed(self):
+        return self.metrics.count
+        
+    @property
+    def correct_predictions(self):
+        return self.metrics.correct
+        
+    def set_widget(self, widget, **options):
+        """Configure widget only with the options whose value changed since the last call"""
+        last = self._widget_state.setdefault(str(widget), {})
+        changed = {key: value for key, value in options.items() if last.get(key) != value}
+        if changed:
+            widget.config(**changed)
+            last.update(changed)
         
     def create_header(self):
         """Create header bar"""
@@ -68,6 +88,14 @@ class DigitRecognitionDisplay:
         )
         self.image_canvas.pack(pady=10)
         
+        # Create the 10x10 pixel squares once, draw_image only recolors them
+        self.pixel_items = [
+            [self.image_canvas.create_rectangle(j * 20, i * 20, j * 20 + 20, i * 20 + 20, fill=GRAY_COLORS[0], outline='')
+             for j in range(10)]
+            for i in range(10)
+        ]
+        self.pixel_gray = np.zeros((10, 10), dtype=int)
+        
         # Right side - Prediction results
         right_frame = tk.Frame(main_frame, bg='#F3F4F6', relief=tk.RIDGE, borderwidth=2)
         right_frame.pack(side=tk.LEFT, padx=20, pady=20, fill=tk.BOTH, expand=True)
@@ -175,36 +203,17 @@ class DigitRecognitionDisplay:
         self.status_label.pack(pady=5)
         
     def draw_image(self, pixels):
-        """Draw 10x10 pixel array on canvas (scaled 20x)"""
-        self.image_canvas.delete("all")
-        
-        # Reshape to 10x10 if needed
-        if len(pixels) == 100:
-            pixels = np.array(pixels).reshape(10, 10)
-        
-        # Draw each pixel as a 20x20 square
-        for i in range(10):
-            for j in range(10):
-                # Convert pixel value (0-1) to grayscale
-                gray_value = int(pixels[i][j] * 255)
-                color = f'#{gray_value:02x}{gray_value:02x}{gray_value:02x}'
-                
-                x1 = j * 20
-                y1 = i * 20
-                x2 = x1 + 20
-                y2 = y1 + 20
-                
-                self.image_canvas.create_rectangle(
-                    x1, y1, x2, y2,
-                    fill=color,
-                    outline=''
-                )
+        """Draw 10x10 pixel array on canvas (scaled 20x), recoloring only changed pixels"""
+        # Convert pixel values (0-1) to grayscale levels
+        gray = (np.asarray(pixels, dtype=float).reshape(10, 10) * 255).astype(int)
+        gray = np.clip(gray, 0, 255)
+        
+        for i, j in zip(*np.nonzero(gray != self.pixel_gray)):
+            self.image_canvas.itemconfigure(self.pixel_items[i][j], fill=GRAY_COLORS[gray[i, j]])
+        self.pixel_gray = gray
     
     def update_prediction(self, prediction, confidence_scores, processing_time_ms, cycles):
-        """Update display with new prediction results"""
-        # Update predicted digit
-        self.pred_label.config(text=str(prediction))
-        
+        """Update display with new prediction results, touching only widgets whose value changed"""
         # Get confidence for predicted digit
         max_confidence = confidence_scores[prediction] * 100
         
@@ -216,92 +225,99 @@ class DigitRecognitionDisplay:
         else:
             color = '#EF4444'  # Red
         
-        self.pred_label.config(fg=color)
-        self.conf_label.config(text=f"Confidence: {max_confidence:.1f}%")
+        # Update predicted digit
+        self.set_widget(self.pred_label, text=str(prediction), fg=color)
+        self.set_widget(self.conf_label, text=f"Confidence: {max_confidence:.1f}%")
         
         # Update processing time
-        self.time_label.config(
+        self.set_widget(
+            self.time_label,
             text=f"Processing Time:\n{processing_time_ms:.3f} ms ({cycles:,} cycles)"
         )
         
         # Update confidence bars
         for digit in range(10):
-            conf_pct = confidence_scores[digit] * 100
-            self.confidence_bars[digit]['value'] = conf_pct
-            self.confidence_labels[digit].config(text=f"{conf_pct:.1f}%")
+            conf_pct = round(confidence_scores[digit] * 100, 1)
+            bar = self.confidence_bars[digit]
+            if self._widget_state.get(str(bar)) != conf_pct:
+                bar['value'] = conf_pct
+                self._widget_state[str(bar)] = conf_pct
             
             # Highlight predicted digit bar
             if digit == prediction:
-                self.confidence_labels[digit].config(fg='#10B981', font=('Arial', 10, 'bold'))
+                self.set_widget(self.confidence_labels[digit], text=f"{conf_pct:.1f}%", fg='#10B981', font=('Arial', 10, 'bold'))
             else:
-                self.confidence_labels[digit].config(fg='#6B7280', font=('Arial', 10))
-        
-        # Update statistics
-        self.total_processed += 1
-        
-    def update_status(self, status_text, correct=None):
-        """Update status bar"""
-        if correct is not None:
-            if correct:
-                self.correct_predictions += 1
+                self.set_widget(self.confidence_labels[digit], text=f"{conf_pct:.1f}%", fg='#6B7280', font=('Arial', 10))
         
+    def update_status(self, status_text, not_drawn=0):
+        """Update status bar from self.metrics; not_drawn: results counted but skipped by the UI"""
         accuracy = (self.correct_predictions / self.total_processed * 100) if self.total_processed > 0 else 0
+        skipped = f"  |  Not drawn: {not_drawn}" if not_drawn else ""
         
-        self.status_label.config(
-            text=f"Status: {status_text}  |  Images Processed: {self.total_processed}  |  Accuracy: {accuracy:.1f}%"
+        self.set_widget(
+            self.status_label,
+            text=f"Status: {status_text}  |  Images Processed: {self.total_processed}  |  Accuracy: {accuracy:.1f}%{skipped}"
+                 f"\n{self.metrics.status_line()}"
         )
 
-def demo_mode(display):
-    """Demo mode - simulate predictions for testing"""
-    # Example test data (from your testbench)
-    test_images = [
+# Example test data (from your testbench)
+DEMO_TEST_CASES = [
+    {
         # Test image 1 (digit 1)
-        [0.0, 0.0, 0.0, 0.0, 0.003921569, 0.003921569, 0.015686275, 0.019607844, 0.003921569, 0.0,
-         0.0, 0.0, 0.0, 0.003921569, 0.0, 0.02745098, 0.13725491, 0.015686275, 0.007843138, 0.0,
-         0.0, 0.0, 0.0, 0.003921569, 0.003921569, 0.34117648, 0.6, 0.015686275, 0.015686275, 0.0,
-         0.0, 0.0, 0.0, 0.011764706, 0.007843138, 0.60784316, 0.54509807, 0.015686275, 0.007843138, 0.0,
-         0.0, 0.0, 0.0, 0.007843138, 0.13725491, 0.9490196, 0.19607843, 0.019607844, 0.003921569, 0.0,
-         0.0, 0.0, 0.0, 0.007843138, 0.4627451, 0.627451, 0.019607844, 0.007843138, 0.007843138, 0.0,
-         0.0, 0.0, 0.0, 0.011764706, 0.68235296, 0.2901961, 0.0, 0.0, 0.0, 0.0,
-         0.0, 0.0, 0.0, 0.02745098, 0.7529412, 0.0627451, 0.0, 0.0, 0.0, 0.0,
-         0.0, 0.0, 0.0, 0.02745098, 0.6901961, 0.11372549, 0.0, 0.0, 0.0, 0.0,
-         0.0, 0.0, 0.0, 0.007843138, 0.015686275, 0.007843138, 0.0, 0.0, 0.0, 0.0],
-    ]
-    
-    test_labels = [1]
-    
-    # Simulate predictions
-    for idx, (image, true_label) in enumerate(zip(test_images, test_labels)):
-        display.update_status("Processing...")
-        display.draw_image(image)
-        display.root.update()
-        
-        time.sleep(0.5)  # Simulate processing time
-        
-        # Simulate confidence scores (softmax output)
-        confidence = np.random.rand(10)
-        confidence[true_label] = 0.95  # High confidence for correct digit
-        confidence = confidence / confidence.sum()  # Normalize
-        
-        # Simulate processing metrics
-        processing_time = 0.026  # ms
-        cycles = 3250
-        
-        display.update_prediction(true_label, confidence, processing_time, cycles)
-        display.update_status("Ready", correct=True)
-        display.root.update()
-        
-        time.sleep(2)  # Display result for 2 seconds
+        'image': [0.0, 0.0, 0.0, 0.0, 0.003921569, 0.003921569, 0.015686275, 0.019607844, 0.003921569, 0.0,
+                  0.0, 0.0, 0.0, 0.003921569, 0.0, 0.02745098, 0.13725491, 0.015686275, 0.007843138, 0.0,
+                  0.0, 0.0, 0.0, 0.003921569, 0.003921569, 0.34117648, 0.6, 0.015686275, 0.015686275, 0.0,
+                  0.0, 0.0, 0.0, 0.011764706, 0.007843138, 0.60784316, 0.54509807, 0.015686275, 0.007843138, 0.0,
+                  0.0, 0.0, 0.0, 0.007843138, 0.13725491, 0.9490196, 0.19607843, 0.019607844, 0.003921569, 0.0,
+                  0.0, 0.0, 0.0, 0.007843138, 0.4627451, 0.627451, 0.019607844, 0.007843138, 0.007843138, 0.0,
+                  0.0, 0.0, 0.0, 0.011764706, 0.68235296, 0.2901961, 0.0, 0.0, 0.0, 0.0,
+                  0.0, 0.0, 0.0, 0.02745098, 0.7529412, 0.0627451, 0.0, 0.0, 0.0, 0.0,
+                  0.0, 0.0, 0.0, 0.02745098, 0.6901961, 0.11372549, 0.0, 0.0, 0.0, 0.0,
+                  0.0, 0.0, 0.0, 0.007843138, 0.015686275, 0.007843138, 0.0, 0.0, 0.0, 0.0],
+        'label': 1
+    },
+]
+
+REFRESH_MS = 30  # UI tick that drains the result queue
+
+def show_results(display, reader):
+    """Drain the result queue on the Tk thread and render only the newest result"""
+    results = reader.drain()
+    if results:
+        # Every result was recorded in display.metrics by the reader, only the newest is drawn
+        display.skipped += len(results) - 1
+        result = results[-1]
+        display.draw_image(result['image'])
+        display.update_prediction(result['prediction'], result['confidence_scores'],
+                                  result['processing_time_ms'], result['cycles'])
+        display.update_status("Running" if reader.is_alive() else "Ready", reader.dropped + display.skipped)
+    elif reader.error is not None:
+        display.update_status(f"Error: {reader.error}", reader.dropped + display.skipped)
+        return
+    elif reader.finished():
+        display.update_status("Ready", reader.dropped + display.skipped)
+        return
+    display.root.after(REFRESH_MS, lambda: show_results(display, reader))
 
 def main():
     """Main entry point"""
+    import argparse
+    import result_source
+    parser = argparse.ArgumentParser(description='MNIST digit recognition display')
+    result_source.add_source_arguments(parser)
+    args = parser.parse_args()
+    
     root = tk.Tk()
     display = DigitRecognitionDisplay(root)
     
-    # Run demo mode after a short delay
-    root.after(1000, lambda: demo_mode(display))
+    # Acquire results in a background thread, the Tk thread only renders
+    reader = result_source.ResultReader(result_source.source_from_args(args, DEMO_TEST_CASES), metrics=display.metrics)
+    root.after(1000, reader.start)
+    root.after(1000, lambda: show_results(display, reader))
     
     root.mainloop()
+    if args.metrics:
+        display.metrics.write(args.metrics)
 
 if __name__ == "__main__":
     main()
@@ -8,82 +8,80 @@ Works on any system with Python - no GUI required
 import numpy as np
 import time
 import sys
+import metrics
+import result_source
+
+# Pixel value thresholds and the glyph drawn for each band (pixel < 0.1, < 0.3, < 0.6, else)
+GLYPH_THRESHOLDS = np.array([0.1, 0.3, 0.6])
+GLYPH_TABLE = np.array(["░░", "▒▒", "▓▓", "██"])
+
+BLANK_LINE = "║ " + " " * 69 + "║"
 
 class TerminalDisplay:
-    def __init__(self):
-        self.total_processed = 0
-        self.correct_predictions = 0
+    """Composes each frame into a list of lines and repaints only the lines that changed"""
+    
+    def __init__(self, out=None):
+        self.metrics = metrics.MetricsCollector()
+        self.not_drawn = 0  # results counted in self.metrics but skipped while rendering
+        self.out = out or sys.stdout
+        self.screen = []  # lines currently on the terminal
+        
+    @property
+    def total_processed(self):
+        return self.metrics.count
+        
+    @property
+    def correct_predictions(self):
+        return self.metrics.correct
         
     def clear_screen(self):
         """Clear terminal screen"""
-        print("\033[2J\033[H", end="")
+        self.out.write("\033[2J\033[H")
+        self.out.flush()
+        self.screen = []
         
     def draw_header(self):
-        """Draw header"""
-        print("╔" + "═" * 70 + "╗")
-        print("║" + " " * 5 + "MNIST Digit Recognition - FPGA Hardware Accelerator" + " " * 12 + "║")
-        print("╠" + "═" * 70 + "╣")
+        """Header lines"""
+        return [
+            "╔" + "═" * 70 + "╗",
+            "║" + " " * 5 + "MNIST Digit Recognition - FPGA Hardware Accelerator" + " " * 12 + "║",
+            "╠" + "═" * 70 + "╣",
+        ]
         
     def draw_image(self, pixels):
-        """Draw 10x10 image using ASCII characters"""
-        if len(pixels) == 100:
-            pixels = np.array(pixels).reshape(10, 10)
-        
-        print("║  Input Image (10x10):", " " * 47 + "║")
-        print("║", " " * 69 + "║")
-        
-        for row in pixels:
-            line = "║  "
-            for pixel in row:
-                # Convert pixel value to ASCII character
-                if pixel < 0.1:
-                    line += "░░"
-                elif pixel < 0.3:
-                    line += "▒▒"
-                elif pixel < 0.6:
-                    line += "▓▓"
-                else:
-                    line += "██"
-            line += " " * (67 - len(line) + 1) + "║"
-            print(line)
-        print("║", " " * 69 + "║")
+        """10x10 image as glyph lines, one table lookup for the whole array"""
+        pixels = np.asarray(pixels, dtype=float).reshape(10, 10)
+        glyphs = GLYPH_TABLE[np.digitize(pixels, GLYPH_THRESHOLDS)]
         
-    def draw_prediction(self, prediction, confidence, processing_time_ms, cycles):
-        """Draw prediction results"""
-        # Prediction
-        pred_line = f"║  Prediction: {prediction}"
-        pred_line += " " * (70 - len(pred_line)) + "║"
-        print(pred_line)
+        lines = ["║  Input Image (10x10): " + " " * 47 + "║", BLANK_LINE]
+        for row in glyphs:
+            line = "║  " + "".join(row)
+            lines.append(line + " " * (67 - len(line) + 1) + "║")
+        lines.append(BLANK_LINE)
+        return lines
         
+    def draw_prediction(self, prediction, confidence, processing_time_ms, cycles):
+        """Prediction result lines"""
         # Confidence with color coding
         conf_pct = confidence * 100
         if conf_pct > 90:
             status = "✓ High"
-            symbol = "✓"
         elif conf_pct > 70:
             status = "⚠ Medium"
-            symbol = "⚠"
         else:
             status = "✗ Low"
-            symbol = "✗"
-        
-        conf_line = f"║  Confidence: {conf_pct:.1f}% ({status})"
-        conf_line += " " * (70 - len(conf_line)) + "║"
-        print(conf_line)
-        
-        print("║", " " * 69 + "║")
         
-        # Processing time
-        time_line = f"║  Processing Time: {processing_time_ms:.3f} ms ({cycles:,} cycles)"
-        time_line += " " * (70 - len(time_line)) + "║"
-        print(time_line)
-        
-        print("║", " " * 69 + "║")
+        return [
+            self.pad(f"║  Prediction: {prediction}"),
+            self.pad(f"║  Confidence: {conf_pct:.1f}% ({status})"),
+            BLANK_LINE,
+            self.pad(f"║  Processing Time: {processing_time_ms:.3f} ms ({cycles:,} cycles)"),
+            BLANK_LINE,
+        ]
         
     def draw_confidence_bars(self, confidence_scores, prediction):
-        """Draw confidence distribution as text bars"""
-        print("║  Confidence Distribution:", " " * 45 + "║")
-        print("║", " " * 69 + "║")
+        """Confidence distribution as text bar lines"""
+        lines = ["║  Confidence Distribution: " + " " * 45 + "║", BLANK_LINE]
         
         for digit in range(10):
             conf_pct = confidence_scores[digit] * 100
@@ -92,55 +90,77 @@ class TerminalDisplay:
             
             # Mark prediction
             marker = " ← PRED" if digit == prediction else ""
-            
-            line = f"║  {digit}: {bar} {conf_pct:5.1f}%{marker}"
-            line += " " * (70 - len(line)) + "║"
-            print(line)
+            lines.append(self.pad(f"║  {digit}: {bar} {conf_pct:5.1f}%{marker}"))
         
-        print("║", " " * 69 + "║")
+        lines.append(BLANK_LINE)
+        return lines
         
     def draw_status(self):
-        """Draw status bar"""
+        """Status line"""
         accuracy = (self.correct_predictions / self.total_processed * 100) if self.total_processed > 0 else 0
-        
-        status_line = f"║  Images Processed: {self.total_processed}  |  Accuracy: {accuracy:.1f}%"
-        status_line += " " * (70 - len(status_line)) + "║"
-        print(status_line)
+        skipped = f"  |  Not drawn: {self.not_drawn}" if self.not_drawn else ""
+        return [
+            self.pad(f"║  Images Processed: {self.total_processed}  |  Accuracy: {accuracy:.1f}%{skipped}"),
+            self.pad(f"║  {self.metrics.status_line()}"),
+        ]
         
     def draw_footer(self):
-        """Draw footer"""
-        print("╚" + "═" * 70 + "╝")
+        """Footer line"""
+        return ["╚" + "═" * 70 + "╝"]
         
-    def display_result(self, image, prediction, confidence_scores, true_label=None, 
-                      processing_time_ms=0.026, cycles=3250):
-        """Display complete result"""
-        self.clear_screen()
-        self.draw_header()
-        self.draw_image(image)
+    @staticmethod
+    def pad(line):
+        """Pad a box line to the right border"""
+        return line + " " * (70 - len(line)) + "║"
+        
+    def render(self, lines):
+        """Write the frame with a single write, rewriting only lines that differ from the screen"""
+        if not self.screen:
+            buf = ["\033[2J\033[H", "\n".join(lines)]
+        else:
+            buf = []
+            for row, line in enumerate(lines):
+                if row >= len(self.screen) or self.screen[row] != line:
+                    buf.append(f"\033[{row + 1};1H{line}\033[K")  # cursor to row, write, clear rest
+            if len(lines) < len(self.screen):
+                buf.append(f"\033[{len(lines) + 1};1H\033[J")  # clear leftover lines below
+            buf.append(f"\033[{len(lines)};{len(lines[-1]) + 1}H")
+        self.screen = list(lines)
+        if buf:
+            self.out.write("".join(buf))
+            self.out.flush()
         
+    def display_result(self, image, prediction, confidence_scores, true_label=None, 
+                      processing_time_ms=0.026, cycles=3250, latency_ms=None, record=True):
+        """Display complete result, recording it in self.metrics unless record=False"""
         # Get confidence for predicted digit
         pred_confidence = confidence_scores[prediction]
         
-        self.draw_prediction(prediction, pred_confidence, processing_time_ms, cycles)
-        self.draw_confidence_bars(confidence_scores, prediction)
-        
         # Update statistics
-        self.total_processed += 1
-        if true_label is not None and prediction == true_label:
-            self.correct_predictions += 1
+        if record:
+            self.metrics.record_prediction(prediction, true_label, latency_ms, processing_time_ms)
             
-        self.draw_status()
-        self.draw_footer()
+        lines = (self.draw_header()
+                 + self.draw_image(image)
+                 + self.draw_prediction(prediction, pred_confidence, processing_time_ms, cycles)
+                 + self.draw_confidence_bars(confidence_scores, prediction)
+                 + self.draw_status()
+                 + self.draw_footer())
         
         # Show if correct
         if true_label is not None:
+            lines.append("")
             if prediction == true_label:
-                print(f"\n✓ Correct! (Expected: {true_label}, Got: {prediction})")
+                lines.append(f"✓ Correct! (Expected: {true_label}, Got: {prediction})")
             else:
-                print(f"\n✗ Incorrect (Expected: {true_label}, Got: {prediction})")
+                lines.append(f"✗ Incorrect (Expected: {true_label}, Got: {prediction})")
+        
+        self.render(lines)
 
-def demo():
-    """Demo mode with test images"""
+def demo(args=None):
+    """Demo mode with test images, or a live stream from the board/emulator"""
+    if args is None:
+        args = parse_args([])
     display = TerminalDisplay()
     
     # Test images from your testbench
@@ -193,36 +213,56 @@ def demo():
     print("\nPress Ctrl+C to exit\n")
     time.sleep(2)
     
+    # Results are acquired in a background thread; the terminal renders the newest one
+    reader = result_source.ResultReader(result_source.source_from_args(args, test_cases), metrics=display.metrics)
+    reader.start()
+    
+    skipped = 0  # drained together with a newer result, so not drawn
     try:
-        for test in test_cases:
-            # Simulate confidence scores (softmax output)
-            confidence = np.random.rand(10)
-            confidence[test['label']] = 0.95  # High confidence for correct digit
-            confidence = confidence / confidence.sum()  # Normalize to sum to 1
+        while not reader.finished():
+            results = reader.drain(timeout=0.1)
+            if not results:
+                continue
             
-            # Display result
+            # Every result was recorded in display.metrics by the reader, only the newest is drawn
+            skipped += len(results) - 1
+            display.not_drawn = reader.dropped + skipped
+            result = results[-1]
             display.display_result(
-                image=test['image'],
-                prediction=test['label'],
-                confidence_scores=confidence,
-                true_label=test['label'],
-                processing_time_ms=0.026,
-                cycles=3250
+                image=result['image'],
+                prediction=result['prediction'],
+                confidence_scores=result['confidence_scores'],
+                true_label=result['true_label'],
+                processing_time_ms=result['processing_time_ms'],
+                cycles=result['cycles'],
+                record=False
             )
-            
-            time.sleep(3)  # Display for 3 seconds
+        
+        if reader.error is not None:
+            print(f"\nResult source failed: {reader.error}")
             
         # Final summary
         print("\n" + "=" * 72)
         print(f"  Demo Complete!")
         print(f"  Total Images: {display.total_processed}")
         print(f"  Correct: {display.correct_predictions}")
-        print(f"  Accuracy: {(display.correct_predictions/display.total_processed*100):.1f}%")
+        print(f"  Accuracy: {(display.correct_predictions/max(display.total_processed, 1)*100):.1f}%")
+        print(f"  Not drawn (display behind, still counted): {display.not_drawn}")
+        print(f"  {display.metrics.status_line()}")
         print("=" * 72)
+        if args.metrics:
+            display.metrics.write(args.metrics)
+            print(f"  Metrics written to {args.metrics}")
         
     except KeyboardInterrupt:
         print("\n\nDemo interrupted by user")
         sys.exit(0)
 
+def parse_args(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description='MNIST digit recognition terminal display')
+    result_source.add_source_arguments(parser)
+    return parser.parse_args(argv)
+
 if __name__ == "__main__":
-    demo()
+    demo(parse_args())
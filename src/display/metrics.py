@@ -0,0 +1,224 @@
+#!/usr/bin/env python3
+"""
+Rolling performance metrics shared by the display front-ends
+Latency percentiles (HDR-style log-linear histogram), images/s over sliding
+windows and the 10x10 confusion matrix. Every update is O(1); percentiles and
+rates are computed when the display asks for them.
+"""
+
+import csv
+import json
+import threading
+import time
+
+import numpy as np
+
+THROUGHPUT_WINDOWS = (1, 10, 60)  # seconds
+PERCENTILES = (50, 95, 99)
+MIN_ELAPSED_S = 0.1  # keeps the rate of the first few events from blowing up
+
+
+class LatencyHistogram:
+    """Log-linear histogram of latencies in ms, like HdrHistogram
+
+    Values are counted in ticks of `resolution_ms`. Below 2*sub_buckets ticks
+    every tick has its own bucket; above, each power of two is split into
+    sub_buckets linear buckets, so the relative error stays below
+    1/sub_buckets (0.8% for 128) over the whole range.
+    """
+
+    def __init__(self, resolution_ms=0.001, highest_ms=60000.0, sub_buckets=128):
+        self.resolution_ms = resolution_ms
+        self.sub_bits = (2 * sub_buckets - 1).bit_length()
+        self.half = 1 << (self.sub_bits - 1)
+        self.highest = int(highest_ms / resolution_ms)
+        self.counts = [0] * (self.index(self.highest) + 1)
+        self.count = 0
+        self.total_ms = 0.0
+        self.min_ms = float('inf')
+        self.max_ms = 0.0
+
+    def index(self, ticks):
+        """Bucket of a value in ticks"""
+        shift = max(0, ticks.bit_length() - self.sub_bits)
+        return shift * self.half + (ticks >> shift)
+
+    def bucket_ms(self, index):
+        """Midpoint of a bucket in ms"""
+        shift = max(0, index // self.half - 1)
+        low = (index - shift * self.half) << shift
+        return (low + ((1 << shift) - 1) / 2.0) * self.resolution_ms
+
+    def record(self, ms):
+        ticks = min(max(int(ms / self.resolution_ms), 0), self.highest)
+        self.counts[self.index(ticks)] += 1
+        self.count += 1
+        self.total_ms += ms
+        self.min_ms = min(self.min_ms, ms)
+        self.max_ms = max(self.max_ms, ms)
+
+    def percentile(self, q):
+        """Latency in ms below which q percent of the recorded values fall (None if empty)"""
+        if not self.count:
+            return None
+        target = max(1, int(np.ceil(q / 100.0 * self.count)))
+        seen = 0
+        for index, n in enumerate(self.counts):
+            seen += n
+            if seen >= target:
+                return min(max(self.bucket_ms(index), self.min_ms), self.max_ms)
+        return self.max_ms
+
+    def mean(self):
+        return self.total_ms / self.count if self.count else None
+
+    def summary(self):
+        if not self.count:
+            return {'count': 0}
+        stats = {'count': self.count, 'mean': self.mean(), 'min': self.min_ms, 'max': self.max_ms}
+        for q in PERCENTILES:
+            stats['p%d' % q] = self.percentile(q)
+        return stats
+
+
+class ThroughputMeter:
+    """Events per second over sliding windows, kept as a ring of one-second slots"""
+
+    def __init__(self, windows=THROUGHPUT_WINDOWS):
+        self.windows = windows
+        self.slots = [0] * (max(windows) + 1)
+        self.second = None  # second of the newest slot
+        self.start_t = None
+
+    def _advance(self, second):
+        if self.second is None:
+            self.second = second
+            return
+        # Clear the slots of the seconds that passed without events (at most one full turn)
+        for s in range(self.second + 1, min(second, self.second + len(self.slots)) + 1):
+            self.slots[s % len(self.slots)] = 0
+        self.second = max(self.second, second)
+
+    def record(self, t=None, n=1):
+        t = time.perf_counter() if t is None else t
+        if self.start_t is None:
+            self.start_t = t
+        second = int(t)
+        self._advance(second)
+        self.slots[second % len(self.slots)] += n
+
+    def rate(self, window, t=None):
+        """Events per second over the last `window` seconds, counting the current partial second"""
+        if self.start_t is None:
+            return 0.0
+        t = time.perf_counter() if t is None else t
+        self._advance(int(t))
+        window = min(window, len(self.slots) - 1)
+        events = sum(self.slots[s % len(self.slots)] for s in range(self.second - window, self.second + 1))
+        elapsed = max(min(window + t - int(t), t - self.start_t), MIN_ELAPSED_S)
+        return events / elapsed
+
+
+class MetricsCollector:
+    """Per-result statistics for the displays: accuracy, latency, throughput and confusion matrix
+
+    latency_ms    : host round trip per image as measured by the link (uart_stream)
+    processing_ms : on-board inference time reported with the result (cycles / clock)
+
+    result_source.ResultReader records from its acquisition thread while the display
+    reads, so updates and summaries hold a lock.
+    """
+
+    def __init__(self, n_classes=10, windows=THROUGHPUT_WINDOWS):
+        self.lock = threading.RLock()
+        self.count = 0
+        self.correct = 0
+        self.latency = LatencyHistogram()
+        self.processing = LatencyHistogram()
+        self.throughput = ThroughputMeter(windows)
+        self.confusion = np.zeros((n_classes, n_classes), dtype=np.int64)
+
+    def record_prediction(self, prediction, true_label=None, latency_ms=None, processing_ms=None, t=None):
+        with self.lock:
+            self.count += 1
+            self.throughput.record(t)
+            if true_label is not None:
+                self.confusion[true_label, prediction] += 1
+                if prediction == true_label:
+                    self.correct += 1
+            if latency_ms is not None:
+                self.latency.record(latency_ms)
+            if processing_ms is not None:
+                self.processing.record(processing_ms)
+
+    def record(self, result):
+        """Record a result dict as produced by result_source"""
+        self.record_prediction(result['prediction'], result.get('true_label'), result.get('latency_ms'),
+                               result.get('processing_time_ms'), result.get('t'))
+
+    def accuracy(self):
+        labelled = int(self.confusion.sum())
+        return self.correct / labelled if labelled else 0.0
+
+    def per_class_recall(self):
+        """Fraction of each true digit that was predicted correctly (nan for unseen digits)"""
+        support = self.confusion.sum(axis=1)
+        with np.errstate(invalid='ignore', divide='ignore'):
+            return np.diag(self.confusion) / support
+
+    def snapshot(self):
+        """All metrics as a JSON-serialisable dict"""
+        with self.lock:
+            return self._snapshot()
+
+    def _snapshot(self):
+        return {
+            'images': self.count,
+            'correct': self.correct,
+            'accuracy': self.accuracy(),
+            'images_per_s': {'%ds' % w: self.throughput.rate(w) for w in self.throughput.windows},
+            'latency_ms': self.latency.summary(),
+            'processing_ms': self.processing.summary(),
+            'per_class_recall': [None if np.isnan(r) else float(r) for r in self.per_class_recall()],
+            'confusion': self.confusion.tolist(),
+        }
+
+    def status_line(self):
+        """One-line summary of tail latency and throughput for the status bars"""
+        with self.lock:
+            hist = self.latency if self.latency.count else self.processing
+            if not hist.count:
+                return f"{self.throughput.rate(10):.1f} img/s"
+            p50, p95, p99 = (hist.percentile(q) for q in PERCENTILES)
+            return f"p50/p95/p99 {p50:.2f}/{p95:.2f}/{p99:.2f} ms  |  {self.throughput.rate(10):.1f} img/s"
+
+    def write_json(self, path):
+        with open(path, 'w') as f:
+            json.dump(self.snapshot(), f, indent=2)
+
+    def write_csv(self, path):
+        """Flat metric,value rows (nested keys joined with '.', confusion as confusion.<true>.<pred>)"""
+        rows = []
+
+        def flatten(prefix, value):
+            if isinstance(value, dict):
+                for key, v in value.items():
+                    flatten(f"{prefix}.{key}" if prefix else key, v)
+            elif isinstance(value, list):
+                for i, v in enumerate(value):
+                    flatten(f"{prefix}.{i}", v)
+            else:
+                rows.append((prefix, value))
+
+        flatten('', self.snapshot())
+        with open(path, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['metric', 'value'])
+            writer.writerows(rows)
+
+    def write(self, path):
+        """Export to .csv or .json, chosen by the file extension"""
+        if path.endswith('.csv'):
+            self.write_csv(path)
+        else:
+            self.write_json(path)
@@ -0,0 +1,180 @@
+#!/usr/bin/env python3
+"""
+Background acquisition for the display front-ends
+A producer thread pulls results (demo data, the board over UART, or the board
+emulator) into a bounded queue; the display drains it at its own pace and only
+renders the newest result when it falls behind. Every result is recorded in
+the display's metrics as it is produced, drawn or not.
+"""
+
+import os
+import queue
+import sys
+import threading
+import time
+
+import numpy as np
+
+# Host-side modules (uart_stream, nn_engine, ...) live in src/python
+PYTHON_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'python')
+
+
+class ResultReader(threading.Thread):
+    """Runs produce(emit) in a daemon thread; emit() never blocks the producer
+
+    When the queue is full the oldest result is dropped from the queue (it is
+    never drawn), so acquisition throughput does not depend on how fast the
+    screen repaints. Results are recorded in `metrics` (a MetricsCollector)
+    before they are queued, so dropped ones still count.
+    """
+
+    def __init__(self, produce, maxsize=64, metrics=None):
+        super().__init__(daemon=True)
+        self.produce = produce
+        self.metrics = metrics
+        self.results = queue.Queue(maxsize=maxsize)
+        self.produced = 0
+        self.dropped = 0
+        self.error = None
+
+    def emit(self, result):
+        """Record and queue a result, discarding the oldest queued one if the queue is full
+
+        The result is stamped with its arrival time ('t') and recorded right away,
+        so throughput, latency and the confusion matrix reflect acquisition, not
+        what the display got to.
+        """
+        self.produced += 1
+        result.setdefault('t', time.perf_counter())
+        if self.metrics is not None:
+            self.metrics.record(result)
+        while True:
+            try:
+                self.results.put_nowait(result)
+                return
+            except queue.Full:
+                try:
+                    self.results.get_nowait()
+                    self.dropped += 1
+                except queue.Empty:
+                    pass
+
+    def run(self):
+        try:
+            self.produce(self.emit)
+        except Exception as e:  # reported by the display instead of killing it silently
+            self.error = e
+
+    def drain(self, timeout=None):
+        """Return every queued result (oldest first), waiting up to timeout for the first one"""
+        try:
+            results = [self.results.get(timeout=timeout) if timeout else self.results.get_nowait()]
+        except queue.Empty:
+            return []
+        while True:
+            try:
+                results.append(self.results.get_nowait())
+            except queue.Empty:
+                return results
+
+    def finished(self):
+        """True once the producer stopped and every result was drained"""
+        return not self.is_alive() and self.results.empty()
+
+
+def demo_source(test_cases, interval=3.0):
+    """Producer that replays test cases with simulated confidence scores every interval seconds"""
+    def produce(emit):
+        for test in test_cases:
+            # Simulate confidence scores (softmax output)
+            confidence = np.random.rand(10)
+            confidence[test['label']] = 0.95  # High confidence for correct digit
+            confidence = confidence / confidence.sum()  # Normalize to sum to 1
+
+            emit({
+                'image': test['image'],
+                'prediction': test['label'],
+                'confidence_scores': confidence,
+                'true_label': test['label'],
+                'processing_time_ms': 0.026,
+                'cycles': 3250,
+            })
+            time.sleep(interval)
+    return produce
+
+
+def board_source(port=None, count=1000, framed=None, window=1, batch=1, cache_path=None):
+    """Producer that streams test images to the board (or the board emulator if port is None)
+
+    The board only returns the prediction and cycle count, so the confidence
+    distribution comes from the NumPy reference engine on the host. With a
+    cache_path, images the board already answered are replayed from the
+    result cache instead of being sent again.
+    """
+    def produce(emit):
+        if PYTHON_DIR not in sys.path:
+            sys.path.insert(0, PYTHON_DIR)
+        import board_emulator
+        import hls_estimate
+        import nn_engine
+        import uart_stream
+
+        engine = nn_engine.NNEngine.from_hpp()
+        pairs = list(uart_stream.test_images(count))
+        board = None
+        port_name = port
+        if port_name is None:
+            board = board_emulator.FramedBoard() if framed is not None else board_emulator.EmulatedBoard()
+            board.start()
+            port_name = board.port
+        parser = None if framed is not None else uart_stream.ResultParser()
+        cache = uart_stream.open_board_cache(cache_path, framed=framed) if cache_path else None
+
+        def on_reply(index, reply, latency):
+            label, img = pairs[index]
+            prediction, cycles = reply
+            emit({
+                'image': img,
+                'prediction': int(prediction),
+                'confidence_scores': engine.predict_proba(img)[0],
+                'true_label': int(label),
+                'processing_time_ms': hls_estimate.cycles_to_ms(cycles),
+                'cycles': int(cycles),
+                'latency_ms': latency * 1000.0,
+            })
+
+        try:
+            with uart_stream.StreamClient(port_name, parser=parser, framed=framed) as client:
+                client.stream((img for label, img in pairs), window, on_reply, batch, cache)
+        finally:
+            if board:
+                board.stop()
+            if cache:
+                cache.close()
+    return produce
+
+
+def add_source_arguments(parser):
+    """Command-line options shared by display_gui.py and display_terminal.py"""
+    parser.add_argument('-source', choices=['demo', 'emulator', 'uart'], default='demo')
+    parser.add_argument('-port', default=None, help='serial port for -source uart (board app must reply RESULT lines or frames)')
+    parser.add_argument('-count', type=int, default=1000, help='test images to stream')
+    parser.add_argument('-framed', action='store_true', help='use the framed uint8 protocol')
+    parser.add_argument('-window', type=int, default=1)
+    parser.add_argument('-cache', nargs='?', const='default', default=None,
+                        help='replay board results of images already sent from the result cache (SQLite file)')
+    parser.add_argument('-metrics', default=None, help='write latency/throughput/confusion metrics to this .json or .csv file on exit')
+
+
+def source_from_args(args, test_cases):
+    if args.source == 'demo':
+        return demo_source(test_cases)
+    framed = 0 if args.framed else None  # protocol.FMT_UINT8
+    port = args.port if args.source == 'uart' else None
+    cache_path = None
+    if args.cache:
+        if PYTHON_DIR not in sys.path:
+            sys.path.insert(0, PYTHON_DIR)
+        import result_cache
+        cache_path = result_cache.DEFAULT_PATH if args.cache == 'default' else args.cache
+    return board_source(port, args.count, framed, args.window, cache_path=cache_path)
@@ -1,8 +1,48 @@
 #include <stdio.h>
+#include <string.h>
 #include <iostream>
+#include <vector>
 #include "matmul.hpp"
 
-int main() {
+/* Run every vector of a .bin written by src/python/generate_test_images.py.
+   Returns the number of predictions that differ from the expected ones, -1 without a file. */
+int run_test_vectors(const char *path) {
+	FILE *file = fopen(path, "rb");
+	if (!file)
+		return -1;
+
+	char magic[4];
+	unsigned int header[3]; // count, n_inputs, n_outputs
+	if (fread(magic, 1, 4, file) != 4 || memcmp(magic, "NNTV", 4) != 0 || fread(header, 4, 3, file) != 3
+			|| header[1] != n_inputs || header[2] != n_layer3) {
+		printf("%s is not a test vector file for this network\n", path);
+		fclose(file);
+		return -1;
+	}
+	unsigned int count = header[0];
+	std::vector<float> images(count * n_inputs);
+	std::vector<int> labels(count), expected(count);
+	if (fread(images.data(), 4, images.size(), file) != images.size() || fread(labels.data(), 4, count, file) != count
+			|| fread(expected.data(), 4, count, file) != count) {
+		printf("%s is truncated\n", path);
+		fclose(file);
+		return -1;
+	}
+	fclose(file);
+
+	int mismatches = 0, correct = 0;
+	for (unsigned int i = 0; i < count; i++) {
+		int pred = nn_inference(&images[i * n_inputs]);
+		if (pred != expected[i] && mismatches++ < 10)
+			printf("Vector %u: prediction %d, expected %d\n", i, pred, expected[i]);
+		if (pred == labels[i])
+			correct++;
+	}
+	printf("%s: %u vectors, %d mismatches, accuracy %.4f\n", path, count, mismatches, (float)correct / count);
+	return mismatches;
+}
+
+int main(int argc, char **argv) {
 
 float input_img[n_inputs] = {0.0, 0.0, 0.0, 0.0, 0.003921569, 0.003921569, 0.015686275, 0.019607844, 0.003921569, 0.0,
 		0.0, 0.0, 0.0, 0.003921569, 0.0, 0.02745098, 0.13725491, 0.015686275, 0.007843138, 0.0,
@@ -51,5 +91,7 @@ std::cout << std::endl;
 std::cout << "NN Prediction: " << pred2 << std::endl;
 std::cout << std::endl;
 
-return 0;
+// Test vectors: ./matmul_test [test_vectors.bin], skipped if the file does not exist
+int mismatches = run_test_vectors(argc > 1 ? argv[1] : "test_vectors.bin");
+return mismatches > 0 ? 1 : 0;
 }
@@ -16,6 +16,10 @@ add_files matmul.hpp
 
 # Add testbench files (not synthesized, only for verification)
 add_files -tb matmul_tb.cpp
+# Test vectors from src/python/generate_test_images.py -all, run by the testbench in C simulation
+if {[file exists test_vectors.bin]} {
+    add_files -tb test_vectors.bin
+}
 
 # Set top function
 set_top $top_function
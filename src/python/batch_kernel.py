@@ -0,0 +1,242 @@
+import numpy as np
+import os
+import dataset
+import generate_test_images
+import hls_estimate
+import nn_engine
+
+# Generator of a batch-mode variant of the nn_inference HLS kernel.
+#
+# nn_inference() in matmul.cpp classifies one image per ap_start, so the call
+# handshake and the input BRAM fill are paid for every image, and the layers run
+# one after the other. nn_inference_batch() takes BATCH images per call and runs
+# its image loop with DATAFLOW: every layer function becomes its own process,
+# connected by ping-pong buffers, so image b+1 goes through layer 1 while image b
+# is in layer 2. It reuses the hwmm_layerN / hw_act_layerN functions and weights of
+# matmul.cpp/matmul.hpp unchanged.
+#
+# Generated into src/hls (next to matmul.cpp):
+#   matmul_batch.hpp / .cpp  the kernel, top function nn_inference_batch
+#   matmul_batch_tb.cpp      testbench: runs the test vectors in batches, checks every
+#                            prediction against the expected one and against nn_inference()
+#   test_vectors_batch.h     test vectors with expected outputs from hls_sim.py
+#   run_hls_batch.tcl        csim + csynth of the variant
+#
+# throughput_model() is the host-side estimate of images/s versus BATCH, from the
+# per-layer cycle estimates of hls_estimate.py and an assumed per-call overhead.
+
+HLS_DIR = os.path.dirname(nn_engine.DEFAULT_HPP)
+DEFAULT_CALL_OVERHEAD = 200 # cycles per ap_start/ap_done round trip from the PS over AXI-Lite (assumed)
+WORDS_PER_CYCLE = 1 # input BRAM fill rate
+
+
+def stage_cycles(sizes):
+	"""Cycles of every DATAFLOW process for one image: read, hwmm/ReLU per layer, argmax"""
+	est = hls_estimate.estimate(sizes)
+	stages = [('read', -(-sizes[0] // WORDS_PER_CYCLE) + 1)]
+	for n, layer in enumerate(est.layers, 1):
+		stages.append(('hwmm_layer%d' % n, layer.cycles))
+		if n < len(est.layers):
+			stages.append(('hw_act_layer%d' % n, hls_estimate.relu_cycles(sizes[n])))
+	stages.append(('hw_act_layer%d' % len(est.layers), hls_estimate.argmax_cycles(sizes[-1])))
+	return stages
+
+
+def batch_cycles(sizes, batch, call_overhead=DEFAULT_CALL_OVERHEAD):
+	"""Cycles for one nn_inference_batch call: overhead + pipeline fill + (B - 1) * slowest stage"""
+	stages = [cycles for name, cycles in stage_cycles(sizes)]
+	return call_overhead + sum(stages) + (batch - 1) * max(stages)
+
+
+def single_cycles(sizes, call_overhead=DEFAULT_CALL_OVERHEAD):
+	"""Cycles per image with nn_inference: overhead + BRAM fill + the layers back to back"""
+	return call_overhead + -(-sizes[0] // WORDS_PER_CYCLE) + hls_estimate.nn_inference_cycles(sizes)
+
+
+def throughput_model(sizes, batches, call_overhead=DEFAULT_CALL_OVERHEAD, clock_mhz=hls_estimate.CLOCK_MHZ):
+	"""[(B, cycles per call, images/s, speedup over one nn_inference call per image)]"""
+	single = single_cycles(sizes, call_overhead)
+	rows = []
+	for batch in batches:
+		cycles = batch_cycles(sizes, batch, call_overhead)
+		rows.append((batch, cycles, batch * clock_mhz * 1e6 / cycles, batch * single / float(cycles)))
+	return rows
+
+
+def dataflow_resources(sizes):
+	"""DSP of the DATAFLOW variant: every layer process has its own fadd/fmul cores"""
+	est = hls_estimate.estimate(sizes)
+	fadd = sum(layer.fadd for layer in est.layers)
+	fmul = sum(layer.fmul for layer in est.layers)
+	return fadd * hls_estimate.FADD_RESOURCES['dsp'] + fmul * hls_estimate.FMUL_RESOURCES['dsp'], est.dsp
+
+
+def kernel_hpp(batch):
+	return '''#ifndef MATMUL_BATCH_HPP
+#define MATMUL_BATCH_HPP
+/* Generated by src/python/batch_kernel.py - do not edit by hand */
+#include "matmul.hpp"
+
+#define BATCH %d
+
+void nn_inference_batch(const float images[BATCH][n_inputs], int preds[BATCH]);
+
+#endif
+''' % batch
+
+
+def kernel_cpp(n_layers):
+	"""nn_inference_batch: the image loop is a DATAFLOW region of one process per layer function"""
+	names = ['n_inputs'] + ['n_layer%d' % n for n in range(1, n_layers + 1)]
+	lines = ['/* Generated by src/python/batch_kernel.py - do not edit by hand */',
+		'#include "matmul_batch.hpp"',
+		'',
+		'',
+		'/* Copy one image into the local buffer the layer 1 process reads */',
+		'static void read_image(const float image[n_inputs], float output[n_inputs]) {',
+		'\tread: for (int k = 0; k < n_inputs; k++){',
+		'#pragma HLS PIPELINE II=1',
+		'\t\toutput[k] = image[k];',
+		'\t}',
+		'}',
+		'',
+		'',
+		'/* BATCH images per call; consecutive images overlap in the layer processes */',
+		'void nn_inference_batch(const float images[BATCH][n_inputs], int preds[BATCH]){',
+		'',
+		'\timg: for (int b = 0; b < BATCH; b++){',
+		'#pragma HLS DATAFLOW',
+		'\t\tfloat input_img[n_inputs];']
+	for n in range(1, n_layers + 1):
+		lines.append('\t\tfloat mm_output%d[1][%s];' % (n, names[n]))
+		if n < n_layers:
+			lines.append('\t\tfloat act_output%d[1][%s];' % (n, names[n]))
+	lines += ['',
+		'\t\tread_image(images[b], input_img);',
+		'\t\thwmm_layer1(input_img, weights::layer1_weights, mm_output1);']
+	for n in range(1, n_layers):
+		lines.append('\t\thw_act_layer%d(mm_output%d, act_output%d);' % (n, n, n))
+		lines.append('\t\thwmm_layer%d(act_output%d, weights::layer%d_weights, mm_output%d);' % (n + 1, n, n + 1, n + 1))
+	lines += ['\t\thw_act_layer%d(mm_output%d, preds[b]);' % (n_layers, n_layers),
+		'\t}',
+		'}']
+	return '\n'.join(lines) + '\n'
+
+
+TESTBENCH = '''/* Generated by src/python/batch_kernel.py - do not edit by hand */
+#include <stdio.h>
+#include "matmul_batch.hpp"
+#include "test_vectors_batch.h"
+
+/* Runs the test vectors through nn_inference_batch, BATCH at a time (the last
+   call is padded with the first image), and checks every prediction against the
+   expected one from hls_sim.py and against the single-image nn_inference(). */
+int main() {
+	static float images[BATCH][n_inputs];
+	int preds[BATCH];
+	int mismatches = 0, correct = 0;
+
+	for (int start = 0; start < N_TEST_VECTORS; start += BATCH) {
+		for (int b = 0; b < BATCH; b++)
+			for (int k = 0; k < n_inputs; k++)
+				images[b][k] = test_images[start + b < N_TEST_VECTORS ? start + b : 0][k];
+
+		nn_inference_batch(images, preds);
+
+		for (int b = 0; b < BATCH && start + b < N_TEST_VECTORS; b++) {
+			int i = start + b;
+			int single = nn_inference(images[b]);
+			if (preds[b] != test_expected[i] || preds[b] != single) {
+				if (mismatches < 10)
+					printf("Vector %d: batch prediction %d, nn_inference %d, expected %d\\n", i, preds[b], single, test_expected[i]);
+				mismatches++;
+			}
+			if (preds[b] == test_labels[i])
+				correct++;
+		}
+	}
+	printf("BATCH=%d: %d vectors, %d mismatches, accuracy %.4f\\n", BATCH, N_TEST_VECTORS, mismatches, (float)correct / N_TEST_VECTORS);
+	return mismatches > 0 ? 1 : 0;
+}
+'''
+
+
+def run_hls_tcl(batch):
+	return '''# Generated by src/python/batch_kernel.py - C simulation and synthesis of nn_inference_batch (BATCH=%d)
+open_project -reset nn_inference_batch_hls
+add_files matmul.cpp
+add_files matmul_batch.cpp
+add_files -tb matmul_batch_tb.cpp
+add_files -tb test_vectors_batch.h
+set_top nn_inference_batch
+open_solution -reset solution1
+set_part {xc7z020clg484-1}
+create_clock -period 8 -name default
+config_compile -name_max_length 80
+config_schedule -effort high
+csim_design
+csynth_design
+exit
+''' % batch
+
+
+def generate(weights, batch, vectors, labels, indices, out_dir=HLS_DIR):
+	"""Write the kernel, testbench, test vectors and Tcl script, returns the file names"""
+	pred, logits = generate_test_images.expected_outputs(vectors, weights)
+	files = {
+		'matmul_batch.hpp': kernel_hpp(batch),
+		'matmul_batch.cpp': kernel_cpp(len(weights)),
+		'matmul_batch_tb.cpp': TESTBENCH,
+		'run_hls_batch.tcl': run_hls_tcl(batch),
+	}
+	for name, text in files.items():
+		with open(os.path.join(out_dir, name), 'w') as file:
+			file.write(text)
+	generate_test_images.write_header(os.path.join(out_dir, 'test_vectors_batch.h'), vectors, labels, pred, logits, indices)
+	return sorted(files) + ['test_vectors_batch.h']
+
+
+def main():
+	## e.g. python3 batch_kernel.py -batch 16 -per_class 10
+	##      then in src/hls: g++ -o matmul_batch_test matmul.cpp matmul_batch.cpp matmul_batch_tb.cpp -I. && ./matmul_batch_test
+	import argparse
+	parser = argparse.ArgumentParser(description='Generate a batch-mode DATAFLOW nn_inference kernel, its testbench and a throughput model')
+	parser.add_argument('-batch', type=int, default=16, help='images per nn_inference_batch call')
+	parser.add_argument('-per_class', type=int, default=10, help='test vectors per digit')
+	parser.add_argument('-selection', choices=generate_test_images.SELECTIONS, default='stratified')
+	parser.add_argument('-hpp', default=nn_engine.DEFAULT_HPP, help='matmul.hpp the kernel is built with')
+	parser.add_argument('-out_dir', default=HLS_DIR)
+	parser.add_argument('-model', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32, 64, 128], help='batch sizes for the throughput model')
+	parser.add_argument('-call_overhead', type=int, default=DEFAULT_CALL_OVERHEAD, help='cycles per kernel call (handshake)')
+	parser.add_argument('-clock', type=float, default=hls_estimate.CLOCK_MHZ, help='clock in MHz')
+	parser.add_argument('-dataset_dir', default=None)
+	args = parser.parse_args()
+
+	weights = nn_engine.load_weights_hpp(args.hpp)
+	sizes = [weights[0].shape[0]] + [w.shape[1] for w in weights]
+	side = int(round(np.sqrt(sizes[0])))
+	images, labels = dataset.load_dataset('testing', (side, side), dataset_dir=args.dataset_dir)
+	indices = generate_test_images.select(labels, args.per_class, args.selection)
+	vectors = dataset.normalize(images[indices]).reshape(len(indices), -1)
+
+	files = generate(weights, args.batch, vectors, labels[indices].astype(np.int32), indices, args.out_dir)
+	print("Wrote %s to %s (BATCH=%d, %d test vectors)" % (', '.join(files), args.out_dir, args.batch, len(indices)))
+
+	print("\nDATAFLOW processes per image (cycles):")
+	for name, cycles in stage_cycles(sizes):
+		print("  %-14s %6d" % (name, cycles))
+	name, cycles = max(stage_cycles(sizes), key=lambda stage: stage[1])
+	print("Steady state: one image every %d cycles, set by %s (see hls_estimate.py -search for faster configurations)" % (cycles, name))
+	dsp_dataflow, dsp_single = dataflow_resources(sizes)
+	print("DSP: %d for the DATAFLOW variant (one set of float cores per layer) vs %d shared in nn_inference"
+		% (dsp_dataflow, dsp_single), "" if dsp_dataflow <= hls_estimate.XC7Z020['dsp'] else "- does NOT fit the xc7z020")
+
+	print("\nThroughput model at %d MHz, %d cycles call overhead (single-image nn_inference: %d cycles per image)"
+		% (args.clock, args.call_overhead, single_cycles(sizes, args.call_overhead)))
+	print("%6s %12s %14s %10s" % ('BATCH', 'cycles/call', 'images/s', 'speedup'))
+	for batch, cycles, rate, speedup in throughput_model(sizes, args.model, args.call_overhead, args.clock):
+		print("%6d %12d %14.0f %9.2fx" % (batch, cycles, rate, speedup))
+
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,208 @@
+import numpy as np
+import os
+import pty
+import random
+import select
+import threading
+import time
+import tty
+
+# Pseudo-terminal stand-in for the Pynq-Z2 running src/vitis/helloworld.c, so the
+# host scripts can be exercised without a board. Open .port with pyserial like a
+# real serial device.
+#
+# FakeBoard only echoes what it received, like helloworld.c. EmulatedBoard also runs
+# the network bit-exactly (hls_sim.py) and replies "RESULT:<prediction>,<cycles>"
+# with the cycle count from the HLS latency model, paced like a real link.
+# FramedBoard speaks the framed, batched protocol of protocol.py instead.
+
+NUM_INPUTS = 100
+BYTES_PR_INPUT = 4
+
+
+class FakeBoard:
+	"""Mirror of helloworld.c's receive loop on a pty
+
+	Reads NUM_INPUTS*BYTES_PR_INPUT bytes per frame and, like the Vitis app, prints
+	every received value back as "BRAM[i]:<value>" lines.
+	"""
+
+	def __init__(self, n_inputs=NUM_INPUTS, bytes_pr_input=BYTES_PR_INPUT):
+		self.n_inputs = n_inputs
+		self.frame_bytes = n_inputs * bytes_pr_input
+		self.master, self.slave = pty.openpty()
+		tty.setraw(self.slave) # no echo or newline translation, bytes pass through untouched
+		self.port = os.ttyname(self.slave)
+		self.frames = 0
+		self._running = False
+		self._thread = None
+
+	def start(self):
+		self._running = True
+		self._thread = threading.Thread(target=self._run, daemon=True)
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self._running = False
+		if self._thread:
+			self._thread.join()
+		os.close(self.master)
+		os.close(self.slave)
+
+	def __enter__(self):
+		return self.start()
+
+	def __exit__(self, *exc):
+		self.stop()
+
+	def _read_frame(self):
+		"""Block until a whole frame arrived, returns (frame, time of first byte) or None when stopped"""
+		buf = bytearray()
+		first_t = None
+		while len(buf) < self.frame_bytes:
+			if not self._running:
+				return None
+			ready, _, _ = select.select([self.master], [], [], 0.05)
+			if ready:
+				buf += os.read(self.master, self.frame_bytes - len(buf))
+				first_t = first_t or time.perf_counter()
+		return bytes(buf), first_t
+
+	def _write(self, text):
+		data = text.encode()
+		while data:
+			data = data[os.write(self.master, data):]
+
+	def handle_frame(self, frame):
+		"""Return the reply to one received frame"""
+		values = np.frombuffer(frame, dtype='<f4')
+		return ''.join("BRAM[%d]:%f\n\r" % (i, v) for i, v in enumerate(values))
+
+	def pace(self, frame_t, reply_bytes):
+		"""Wait as long as the real board would before replying, no pacing here"""
+		return
+
+	def _run(self):
+		self._write("\n\rInitializing..\n\r")
+		self._write("\n\rReady for weights transfer\n\r")
+		while self._running:
+			received = self._read_frame()
+			if received is None:
+				break
+			frame, frame_t = received
+			self.frames += 1
+			reply = self.handle_frame(frame)
+			self.pace(frame_t, len(reply))
+			self._write(reply)
+
+
+class EmulatedBoard(FakeBoard):
+	"""Board that classifies every frame and replies with the prediction and cycle count
+
+	baud     : emulate 8N1 wire time at this rate for frames and replies (None = unlimited)
+	max_fps  : upper bound on replies per second (None = unlimited)
+	jitter_ms: standard deviation of random extra latency per frame
+	echo     : also print the BRAM[i] lines like helloworld.c before the result
+	"""
+
+	def __init__(self, weights=None, baud=None, max_fps=None, jitter_ms=0.0, echo=False, clock_mhz=None):
+		import hls_estimate
+		import nn_engine
+		self.weights = weights or nn_engine.load_weights_hpp()
+		super().__init__(n_inputs=self.weights[0].shape[0])
+		self.baud = baud
+		self.max_fps = max_fps
+		self.jitter_ms = jitter_ms
+		self.echo = echo
+		sizes = [self.weights[0].shape[0]] + [w.shape[1] for w in self.weights]
+		self.cycles = hls_estimate.nn_inference_cycles(sizes)
+		self.compute_s = hls_estimate.cycles_to_ms(self.cycles, clock_mhz or hls_estimate.CLOCK_MHZ) / 1000.0
+		self._rx_done_t = 0.0
+		self._tx_free_t = 0.0
+		self._last_reply_t = 0.0
+
+	def wire_time(self, n_bytes):
+		"""Seconds to move n_bytes over an 8N1 UART (10 bits per byte)"""
+		return n_bytes * 10.0 / self.baud if self.baud else 0.0
+
+	def handle_frame(self, frame):
+		import hls_sim
+		pixels = np.frombuffer(frame, dtype='<f4').reshape(1, -1)
+		pred, _ = hls_sim.nn_inference(pixels, self.weights)
+		reply = "RESULT:%d,%d\n\r" % (pred[0], self.cycles)
+		if self.echo:
+			reply = super().handle_frame(frame) + reply
+		return reply
+
+	def pace(self, frame_t, reply_bytes, frame_bytes=None, images=1):
+		## The frame is complete once its last byte crossed the wire after the previous one
+		self._rx_done_t = max(frame_t, self._rx_done_t) + self.wire_time(frame_bytes or self.frame_bytes)
+		ready_t = self._rx_done_t + images * self.compute_s + max(0.0, random.gauss(0.0, self.jitter_ms / 1000.0))
+		if self.max_fps:
+			ready_t = max(ready_t, self._last_reply_t + 1.0 / self.max_fps)
+		ready_t = max(ready_t, self._tx_free_t)
+		delay = ready_t - time.perf_counter()
+		if delay > 0:
+			time.sleep(delay)
+		self._last_reply_t = ready_t
+		self._tx_free_t = ready_t + self.wire_time(reply_bytes)
+
+
+class FramedBoard(EmulatedBoard):
+	"""Emulated board speaking protocol.py: batches of images in, results frames out"""
+
+	def __init__(self, **kwargs):
+		import protocol
+		super().__init__(**kwargs)
+		self.decoder = protocol.FrameDecoder()
+
+	def _run(self):
+		import hls_sim
+		import protocol
+		while self._running:
+			ready, _, _ = select.select([self.master], [], [], 0.05)
+			if not ready:
+				continue
+			frame_t = time.perf_counter()
+			for frame in self.decoder.feed(os.read(self.master, 65536)):
+				if frame.type != protocol.TYPE_IMAGES or frame.n_inputs != self.n_inputs:
+					continue
+				self.frames += 1
+				pred, _ = hls_sim.nn_inference(protocol.decode_pixels(frame), self.weights)
+				reply = protocol.encode_results(pred, self.cycles, frame.seq)
+				frame_bytes = len(protocol.SYNC) + protocol.HEADER.size + len(frame.payload) + protocol.CRC_SIZE
+				self.pace(frame_t, len(reply), frame_bytes, frame.count)
+				os.write(self.master, reply)
+
+
+def main():
+	## Run an emulated board until Ctrl+C, e.g. python3 board_emulator.py -baud 115200
+	## then python3 uart_stream.py -port <printed port> -reply result
+	import argparse
+	parser = argparse.ArgumentParser(description='Emulate the Pynq-Z2 UART application on a pseudo-terminal')
+	parser.add_argument('-echo_only', action='store_true', help='only echo BRAM values like helloworld.c')
+	parser.add_argument('-echo', action='store_true', help='print BRAM values before each result')
+	parser.add_argument('-framed', action='store_true', help='speak the framed protocol of protocol.py')
+	parser.add_argument('-baud', type=int, default=None, help='emulated baud rate (default unlimited)')
+	parser.add_argument('-fps', type=float, default=None, help='maximum frames per second')
+	parser.add_argument('-jitter_ms', type=float, default=0.0)
+	args = parser.parse_args()
+
+	if args.echo_only:
+		board = FakeBoard()
+	elif args.framed:
+		board = FramedBoard(baud=args.baud, max_fps=args.fps, jitter_ms=args.jitter_ms)
+	else:
+		board = EmulatedBoard(baud=args.baud, max_fps=args.fps, jitter_ms=args.jitter_ms, echo=args.echo)
+	board.start()
+	print("Board emulator listening on", board.port)
+	try:
+		threading.Event().wait()
+	except KeyboardInterrupt:
+		print("\nReceived ", board.frames, " frames")
+		board.stop()
+
+
+if __name__=="__main__":
+	main()
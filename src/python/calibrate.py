@@ -0,0 +1,223 @@
+import numpy as np
+import json
+import os
+import time
+import nn_engine
+import quantize
+
+# Activation-range calibration for an ap_fixed port of hwmm_layer1/2/3. Runs the
+# float network over a sample of the training set in batches and reduces every
+# tensor as it goes (no activations are kept): min, max, mean/std and a
+# log2-magnitude histogram with SUB_BUCKETS buckets per octave, from which
+# percentiles of |x| are read with ~9% resolution, rounded up.
+#
+# Per dense layer it records the weights, the hwmm output before ReLU (what the
+# output array holds), after ReLU, and the largest sum of |x| * |w| products, which
+# bounds every partial sum of the accumulator. From those it recommends
+#   weights : ap_fixed<W,I> holding every weight
+#   output  : ap_fixed<W,I> holding the pre-ReLU outputs up to -percentile
+#   acc_t   : an accumulator that cannot overflow for the calibrated inputs
+# with I the integer bits incl. sign (range [-2^(I-1), 2^(I-1))) and F = W - I.
+# The JSON file is read by `quantize.py -calibration calib.json`.
+
+SUB_BUCKETS = 8 # histogram buckets per octave
+MIN_EXP = -24 # magnitudes below 2^MIN_EXP count as zero
+MAX_EXP = 24
+PERCENTILES = (50, 90, 99, 99.9, 99.99) # of |x| in the JSON, plus the one the formats are sized from
+
+
+class RangeStats:
+	"""Streaming reducer of one tensor: extrema, moments and a log2 histogram of |x|"""
+
+	def __init__(self):
+		self.count = 0
+		self.zeros = 0
+		self.min = np.inf
+		self.max = -np.inf
+		self.sum = 0.0
+		self.sumsq = 0.0
+		self.buckets = np.zeros((MAX_EXP - MIN_EXP) * SUB_BUCKETS, dtype=np.int64)
+
+	def update(self, values):
+		x = np.asarray(values, dtype=np.float64).ravel()
+		if not len(x):
+			return
+		self.count += len(x)
+		self.min = min(self.min, float(x.min()))
+		self.max = max(self.max, float(x.max()))
+		self.sum += float(x.sum())
+		self.sumsq += float(np.dot(x, x))
+		mag = np.abs(x)
+		nonzero = mag >= 2.0 ** MIN_EXP
+		self.zeros += int(len(x) - nonzero.sum())
+		index = np.floor((np.log2(mag[nonzero]) - MIN_EXP) * SUB_BUCKETS).astype(np.int64)
+		self.buckets += np.bincount(np.clip(index, 0, len(self.buckets) - 1), minlength=len(self.buckets))
+
+	def abs_max(self):
+		return max(abs(self.min), abs(self.max)) if self.count else 0.0
+
+	def abs_percentile(self, p):
+		"""Upper edge of the histogram bucket holding the p-th percentile of |x| (p = 100: exact max)"""
+		if p >= 100 or not self.count:
+			return self.abs_max()
+		rank = p / 100.0 * self.count
+		if rank <= self.zeros:
+			return 0.0
+		index = int(np.searchsorted(np.cumsum(self.buckets), rank - self.zeros))
+		return min(2.0 ** (MIN_EXP + (index + 1) / SUB_BUCKETS), self.abs_max())
+
+	def summary(self, percentiles=PERCENTILES):
+		mean = self.sum / self.count if self.count else 0.0
+		used = np.flatnonzero(self.buckets)
+		edges = []
+		if len(used):
+			edges = (2.0 ** (MIN_EXP + np.arange(used[0], used[-1] + 2) / SUB_BUCKETS)).tolist()
+		return {
+			'count': self.count,
+			'min': self.min,
+			'max': self.max,
+			'mean': mean,
+			'std': float(np.sqrt(max(0.0, self.sumsq / self.count - mean * mean))) if self.count else 0.0,
+			'zero_fraction': self.zeros / self.count if self.count else 0.0,
+			'abs_percentiles': {'%g' % p: self.abs_percentile(p) for p in percentiles},
+			'histogram': { # |x| buckets, edges[i] <= |x| < edges[i + 1]
+				'zeros': self.zeros,
+				'edges': edges,
+				'counts': self.buckets[used[0]:used[-1] + 1].tolist() if len(used) else [],
+			},
+		}
+
+
+def integer_bits(abs_max):
+	"""Integer bits incl. sign so that ap_fixed<W,I> holds +-abs_max: abs_max < 2^(I-1)"""
+	if abs_max <= 0:
+		return 1
+	return max(1, int(np.floor(np.log2(abs_max))) + 2)
+
+
+def ap_fixed(abs_max, W):
+	return [W, min(W, integer_bits(abs_max))]
+
+
+class Calibrator:
+	"""Collects RangeStats for the input and every dense layer of a bias-free network"""
+
+	def __init__(self, weights):
+		self.weights = [np.asarray(w, dtype=np.float32) for w in weights]
+		self.input = RangeStats()
+		self.layers = []
+		for w in self.weights:
+			layer = {'weights': RangeStats(), 'pre_relu': RangeStats(), 'post_relu': RangeStats(), 'abs_sum_max': 0.0}
+			layer['weights'].update(w)
+			self.layers.append(layer)
+
+	def update(self, images):
+		"""Run one batch of N flattened images through the network and reduce every tensor"""
+		x = np.asarray(images, dtype=np.float32).reshape(-1, self.weights[0].shape[0])
+		self.input.update(x)
+		for n, (w, layer) in enumerate(zip(self.weights, self.layers)):
+			pre = x @ w
+			layer['pre_relu'].update(pre)
+			layer['abs_sum_max'] = max(layer['abs_sum_max'], float((np.abs(x) @ np.abs(w)).max()))
+			if n < len(self.weights) - 1:
+				x = np.maximum(pre, 0) # ReLU
+				layer['post_relu'].update(x)
+
+	def recommend(self, W=16, percentile=100.0):
+		"""ap_fixed formats for the input and every layer, [W, I] lists"""
+		input_format = ap_fixed(self.input.abs_max(), W)
+		formats = []
+		in_frac = input_format[0] - input_format[1]
+		for layer in self.layers:
+			weights_format = ap_fixed(layer['weights'].abs_max(), W)
+			output_format = ap_fixed(layer['pre_relu'].abs_percentile(percentile), W)
+			acc_frac = in_frac + weights_format[0] - weights_format[1]
+			acc_int = integer_bits(layer['abs_sum_max'])
+			formats.append({'weights': weights_format, 'output': output_format, 'acc_t': [acc_int + acc_frac, acc_int]})
+			in_frac = output_format[0] - output_format[1]
+		return input_format, formats
+
+	def to_json(self, W=16, percentile=100.0, **meta):
+		input_format, formats = self.recommend(W, percentile)
+		percentiles = sorted(set(PERCENTILES) | {percentile})
+		layers = []
+		for n, (layer, fmt) in enumerate(zip(self.layers, formats)):
+			entry = {
+				'name': 'hwmm_layer%d' % (n + 1),
+				'shape': list(self.weights[n].shape),
+				'weights': layer['weights'].summary(percentiles),
+				'pre_relu': layer['pre_relu'].summary(percentiles),
+				'abs_sum_max': layer['abs_sum_max'],
+			}
+			if layer['post_relu'].count:
+				entry['post_relu'] = layer['post_relu'].summary(percentiles)
+			entry['ap_fixed'] = fmt
+			layers.append(entry)
+		calibration = dict(meta)
+		calibration.update({'word_bits': W, 'percentile': percentile,
+			'input': dict(self.input.summary(percentiles), ap_fixed=input_format), 'layers': layers})
+		return calibration
+
+
+def load_formats(path):
+	"""(input (W, I), [(weights (W, I), output (W, I))], [acc_t (W, I)]) of a calibration file, for quantize.FixedPointEngine"""
+	with open(path) as f:
+		calibration = json.load(f)
+	formats = [(tuple(layer['ap_fixed']['weights']), tuple(layer['ap_fixed']['output'])) for layer in calibration['layers']]
+	accs = [tuple(layer['ap_fixed']['acc_t']) for layer in calibration['layers']]
+	return tuple(calibration['input']['ap_fixed']), formats, accs
+
+
+def describe(calibration):
+	lines = ["input        |x| max %9.4f  -> ap_fixed<%d,%d>" % (max(abs(calibration['input']['min']), abs(calibration['input']['max'])),
+		*calibration['input']['ap_fixed'])]
+	percentile = calibration['percentile']
+	for layer in calibration['layers']:
+		fmt = layer['ap_fixed']
+		pre = layer['pre_relu']
+		lines.append("%s  weights |w| max %7.4f -> ap_fixed<%d,%d>   pre-ReLU [%9.4f, %9.4f] p%g |x| %8.4f -> ap_fixed<%d,%d>   acc_t ap_fixed<%d,%d> (|x||w| sum max %.2f)"
+			% (layer['name'], max(abs(layer['weights']['min']), abs(layer['weights']['max'])), *fmt['weights'],
+			pre['min'], pre['max'], percentile, pre['abs_percentiles']['%g' % percentile], *fmt['output'], *fmt['acc_t'], layer['abs_sum_max']))
+	return "\n".join(lines)
+
+
+def main():
+	## e.g. python3 calibrate.py -samples 10000 -W 16 -out calib.json
+	##      python3 quantize.py -calibration calib.json
+	import argparse
+	import dataset
+	parser = argparse.ArgumentParser(description='Profile per-layer activation ranges and recommend ap_fixed formats')
+	parser.add_argument('-weights_dir', default=None, help='directory with layer_N_weights.txt files')
+	parser.add_argument('-keras_model', default=None, help='model saved by mnist_net.py instead of the text files')
+	parser.add_argument('-samples', type=int, default=10000, help='training images to calibrate on (0 = all)')
+	parser.add_argument('-batch_size', type=int, default=1000)
+	parser.add_argument('-W', type=int, default=16, help='word width of the recommended formats')
+	parser.add_argument('-percentile', type=float, default=100.0, help='|pre-ReLU| percentile the output formats must hold, the rest saturates')
+	parser.add_argument('-seed', type=int, default=0)
+	parser.add_argument('-dataset_dir', default=None)
+	parser.add_argument('-dims', type=int, nargs=2, default=[10, 10])
+	parser.add_argument('-out', default='calib.json')
+	args = parser.parse_args()
+
+	weights = quantize.load_keras_weights(args.keras_model) if args.keras_model else nn_engine.load_weights_txt(args.weights_dir)
+	images, labels = dataset.load_dataset('training', args.dims, dataset_dir=args.dataset_dir)
+	order = np.random.default_rng(args.seed).permutation(len(images))
+	if args.samples:
+		order = np.sort(order[:args.samples]) # sorted: sequential reads from the memory-mapped cache
+
+	calibrator = Calibrator(weights)
+	start_t = time.time()
+	for start in range(0, len(order), args.batch_size):
+		calibrator.update(dataset.normalize(images[order[start:start + args.batch_size]]).reshape(-1, weights[0].shape[0]))
+	print("Calibrated on %d training images in %.2f s" % (len(order), time.time() - start_t))
+
+	calibration = calibrator.to_json(args.W, args.percentile, samples=len(order), dims=args.dims,
+		weights=args.keras_model or os.path.abspath(args.weights_dir or nn_engine.DEFAULT_WEIGHTS_DIR))
+	print(describe(calibration))
+	with open(args.out, 'w') as f:
+		json.dump(calibration, f, indent=1)
+	print("Wrote", args.out)
+
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,203 @@
+import numpy as np
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+# Shared MNIST JPG loader. Images are decoded and resized once per (split, dims,
+# interpolation) with a process pool and stored as uint8 .npy files which later
+# runs open memory-mapped, so startup no longer pays for decoding ~70k JPGs.
+
+DEFAULT_DATASET_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'MNIST_Dataset_JPG'))
+DEFAULT_CACHE_DIR = os.path.join(DEFAULT_DATASET_DIR, 'cache')
+
+SPLITS = {'training': 'MNIST_JPG_training', 'testing': 'MNIST_JPG_testing'}
+
+## cv2 resize flag per interpolation (cv2 is only imported when JPGs are decoded)
+INTERPOLATIONS = {
+	'area': 'INTER_AREA',
+	'linear': 'INTER_LINEAR',
+	'nearest': 'INTER_NEAREST',
+	'cubic': 'INTER_CUBIC',
+}
+
+## tf.image.resize method per interpolation, for tf_dataset(source='jpg')
+TF_RESIZE = {'area': 'area', 'linear': 'bilinear', 'nearest': 'nearest', 'cubic': 'bicubic'}
+
+CHUNK_SIZE = 1000 # files per worker task
+
+
+def load_image(path, dims=(10,10), interpolation='area'):
+	"""Read one JPG as grayscale and resize it to dims, returns uint8 array"""
+	import cv2
+	img = cv2.imread(path, 0) # read img as grayscale
+	if img is None:
+		return None
+	return cv2.resize(img, dims, interpolation = getattr(cv2, INTERPOLATIONS[interpolation])) # resize img to fit dims
+
+
+def list_split(dataset_dir, split):
+	"""Return sorted (paths, labels) of every JPG in a split"""
+	paths = []
+	labels = []
+	for i in range(10): # 0 to 9
+		read_folder = os.path.join(dataset_dir, SPLITS[split], str(i))
+		for filename in sorted(os.listdir(read_folder)):
+			paths.append(os.path.join(read_folder, filename))
+			labels.append(i)
+	return paths, np.asarray(labels, dtype=np.uint8)
+
+
+def _decode_chunk(job):
+	paths, dims, interpolation = job
+	out = np.zeros((len(paths), dims[1], dims[0]), dtype=np.uint8)
+	ok = np.zeros(len(paths), dtype=bool)
+	for n, path in enumerate(paths):
+		img = load_image(path, dims, interpolation)
+		if img is not None:
+			out[n] = img
+			ok[n] = True
+	return out, ok
+
+
+def cache_paths(cache_dir, split, dims, interpolation):
+	"""Return the (images, labels) cache filenames for a dataset setting"""
+	key = '%s_%dx%d_%s' % (split, dims[0], dims[1], interpolation)
+	return (os.path.join(cache_dir, key + '_images.npy'),
+			os.path.join(cache_dir, key + '_labels.npy'))
+
+
+def build_cache(dataset_dir, cache_dir, split, dims=(10,10), interpolation='area', workers=None):
+	"""Decode a split with a process pool and write it to the uint8 .npy cache"""
+	images_file, labels_file = cache_paths(cache_dir, split, dims, interpolation)
+	os.makedirs(cache_dir, exist_ok=True)
+
+	paths, labels = list_split(dataset_dir, split)
+	jobs = [(paths[i:i + CHUNK_SIZE], dims, interpolation) for i in range(0, len(paths), CHUNK_SIZE)]
+
+	## Decode straight into a memory-mapped file, then rename so readers never see a partial cache
+	tmp_images = images_file + '.tmp.npy'
+	images = np.lib.format.open_memmap(tmp_images, mode='w+', dtype=np.uint8, shape=(len(paths), dims[1], dims[0]))
+	keep = np.zeros(len(paths), dtype=bool)
+	with ProcessPoolExecutor(max_workers=workers) as pool:
+		offset = 0
+		for chunk, ok in pool.map(_decode_chunk, jobs):
+			images[offset:offset + len(chunk)] = chunk
+			keep[offset:offset + len(chunk)] = ok
+			offset += len(chunk)
+
+	if not keep.all(): # drop unreadable files
+		kept = np.asarray(images[keep])
+		del images
+		os.remove(tmp_images)
+		images = np.lib.format.open_memmap(tmp_images, mode='w+', dtype=np.uint8, shape=kept.shape)
+		images[:] = kept
+		labels = labels[keep]
+	images.flush()
+	del images
+
+	np.save(labels_file + '.tmp.npy', labels)
+	os.replace(labels_file + '.tmp.npy', labels_file)
+	os.replace(tmp_images, images_file)
+
+
+def load_dataset(split, dims=(10,10), interpolation='area', dataset_dir=None, cache_dir=None, workers=None):
+	"""Return (images, labels) for a split as uint8 arrays of shape NxHxW and N
+
+	Images are memory-mapped read-only from the cache, which is built on first use.
+	"""
+	dataset_dir = dataset_dir or DEFAULT_DATASET_DIR
+	cache_dir = cache_dir or os.path.join(dataset_dir, 'cache')
+	dims = tuple(dims)
+	images_file, labels_file = cache_paths(cache_dir, split, dims, interpolation)
+	if not (os.path.exists(images_file) and os.path.exists(labels_file)):
+		print("Decoding", split, "set at", dims, "into", cache_dir)
+		build_cache(dataset_dir, cache_dir, split, dims, interpolation, workers)
+	return np.load(images_file, mmap_mode='r'), np.load(labels_file)
+
+
+def normalize(images):
+	"""Scale uint8 pixels to float32 in 0 - 1"""
+	return np.asarray(images, dtype=np.float32) / np.float32(255)
+
+
+def split_indices(n, validation_split=0.0, seed=0):
+	"""Return (train, validation) index arrays of a seeded random hold-out"""
+	order = np.random.default_rng(seed).permutation(n)
+	n_val = int(n * validation_split)
+	return np.sort(order[n_val:]), np.sort(order[:n_val])
+
+
+def tf_dataset(split, dims=(10,10), batch_size=2000, source='cache', shuffle_buffer=10000, validation_split=0.0,
+		seed=0, interpolation='area', dataset_dir=None, cache_dir=None):
+	"""Return a batched, prefetched tf.data pipeline of (float32 images 0 - 1, labels) for a split
+
+	source='cache' reads batches from the memory-mapped uint8 cache (built on first use),
+	source='jpg' decodes and resizes the JPGs in parallel on the fly (TensorFlow's area
+	resize, close to but not bit-identical with cv2.INTER_AREA). Only a shuffle buffer
+	and a few batches are in memory at any time, whatever the image size.
+	With validation_split > 0 returns (train, validation) pipelines, else one pipeline.
+	"""
+	import tensorflow as tf
+	AUTOTUNE = tf.data.AUTOTUNE
+	dataset_dir = dataset_dir or DEFAULT_DATASET_DIR
+	dims = tuple(dims)
+	shape = (dims[1], dims[0])
+
+	if source == 'cache':
+		images, labels = load_dataset(split, dims, interpolation, dataset_dir, cache_dir)
+
+		def gather(index):
+			index = np.sort(index) # sequential reads from the memmap
+			return np.asarray(images[index]), labels[index].astype(np.int32)
+
+		def make(indices, shuffle):
+			ds = tf.data.Dataset.from_tensor_slices(indices.astype(np.int64))
+			if shuffle:
+				ds = ds.shuffle(min(shuffle_buffer, len(indices)) if shuffle_buffer else len(indices), seed=seed, reshuffle_each_iteration=True)
+			ds = ds.batch(batch_size)
+			ds = ds.map(lambda index: tf.numpy_function(gather, [index], (tf.uint8, tf.int32)), num_parallel_calls=AUTOTUNE)
+			ds = ds.map(lambda x, y: (tf.ensure_shape(tf.cast(x, tf.float32) / 255.0, (None,) + shape), tf.ensure_shape(y, (None,))))
+			return ds.prefetch(AUTOTUNE)
+		n = len(labels)
+	elif source == 'jpg':
+		paths, labels = list_split(dataset_dir, split)
+		paths = np.asarray(paths)
+
+		def load(path, label):
+			img = tf.io.decode_jpeg(tf.io.read_file(path), channels=1)
+			img = tf.image.resize(img, shape, method=TF_RESIZE[interpolation])
+			return tf.reshape(img, shape) / 255.0, tf.cast(label, tf.int32)
+
+		def make(indices, shuffle):
+			ds = tf.data.Dataset.from_tensor_slices((paths[indices], labels[indices]))
+			if shuffle:
+				ds = ds.shuffle(min(shuffle_buffer, len(indices)) if shuffle_buffer else len(indices), seed=seed, reshuffle_each_iteration=True)
+			ds = ds.map(load, num_parallel_calls=AUTOTUNE)
+			return ds.batch(batch_size).prefetch(AUTOTUNE)
+		n = len(labels)
+	else:
+		raise ValueError("Unknown source " + source)
+
+	if validation_split > 0:
+		train, val = split_indices(n, validation_split, seed)
+		return make(train, split == 'training'), make(val, False)
+	return make(np.arange(n), split == 'training')
+
+
+def main():
+	## Pre-build the cache, e.g. python3 dataset.py -dataset_dir <PATH_TO_DATASET> -dims 10 10
+	import argparse
+	parser = argparse.ArgumentParser(description='Decode the MNIST JPG dataset into the .npy cache')
+	parser.add_argument('-dataset_dir', default=DEFAULT_DATASET_DIR)
+	parser.add_argument('-cache_dir', default=None)
+	parser.add_argument('-dims', type=int, nargs=2, default=[10, 10])
+	parser.add_argument('-interpolation', choices=sorted(INTERPOLATIONS), default='area')
+	parser.add_argument('-workers', type=int, default=None)
+	args = parser.parse_args()
+
+	for split in SPLITS:
+		images, labels = load_dataset(split, args.dims, args.interpolation, args.dataset_dir, args.cache_dir, args.workers)
+		print(split, ":", images.shape, images.dtype, "labels:", np.bincount(labels, minlength=10))
+
+
+if __name__=="__main__":
+	main()
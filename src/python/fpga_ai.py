@@ -0,0 +1,71 @@
+import importlib
+import os
+import sys
+import time
+
+# Single entry point for the host scripts. Each subcommand runs the main() of the
+# script that implements it with the remaining arguments, and only that script
+# is imported, so `send` or `display` start without paying for TensorFlow (only
+# `train` and Keras-based options import it, inside the code that needs it).
+#
+#   python3 fpga_ai.py train -pipeline cache
+#   python3 fpga_ai.py export -bin weights.nnw
+#   python3 fpga_ai.py send -port /dev/ttyUSB1
+#   python3 fpga_ai.py bench -engines numpy hls_sim
+#
+# `python3 fpga_ai.py <command> -h` shows the options of a command, -time prints
+# the startup time (imports and argument parsing) before the command runs.
+
+SRC_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+## command: (directory under src, module, description)
+COMMANDS = {
+	'train': ('python', 'mnist_net', 'train the network and export its weights'),
+	'export': ('python', 'weight_export', 'write weights.nnw, matmul.hpp and nn_config.h from trained weights'),
+	'send': ('python', 'uart_test_nn', 'send one random test image to the board over UART'),
+	'stream': ('python', 'uart_stream', 'stream test images to the board and report throughput and latency'),
+	'serve': ('python', 'nn_daemon', 'serve inference from several boards with CPU fallback over a local socket'),
+	'eval': ('python', 'hil_eval', 'hardware-in-the-loop accuracy check over the whole test set'),
+	'bench': ('bench', 'bench', 'benchmark the inference engines'),
+	'display': ('display', 'display_terminal', 'terminal display of the predictions'),
+}
+
+
+def load_command(name):
+	"""Import the module of a command from its source directory"""
+	directory, module, description = COMMANDS[name]
+	path = os.path.join(SRC_DIR, directory)
+	if path not in sys.path:
+		sys.path.insert(0, path)
+	return importlib.import_module(module)
+
+
+def run(name, argv):
+	"""Run a command's main() as if its script had been started with argv"""
+	module = load_command(name)
+	sys.argv = [module.__file__] + list(argv)
+	if name == 'display':
+		return module.demo(module.parse_args())
+	return module.main()
+
+
+def main():
+	start_t = time.perf_counter()
+	import argparse
+	parser = argparse.ArgumentParser(description='FPGA_AI host tools',
+		epilog='options after the command are passed to it, see <command> -h')
+	parser.add_argument('-time', action='store_true', help='print the startup time of the command')
+	parser.add_argument('command', choices=sorted(COMMANDS), metavar='command',
+		help=', '.join('%s: %s' % (name, COMMANDS[name][2]) for name in COMMANDS))
+	parser.add_argument('args', nargs=argparse.REMAINDER)
+	args = parser.parse_args()
+
+	load_command(args.command)
+	if args.time:
+		print("%s started in %.3f s (%s)" % (args.command, time.perf_counter() - start_t,
+			'TensorFlow loaded' if 'tensorflow' in sys.modules else 'no TensorFlow'))
+	return run(args.command, args.args)
+
+
+if __name__=="__main__":
+	sys.exit(main())
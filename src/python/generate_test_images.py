@@ -1,60 +1,143 @@
 import numpy as np
-import cv2
 import os
+import struct
+import dataset
+import hls_sim
+import nn_engine
+
+# Generates test vectors for matmul_tb.cpp from the decoded test set cache.
+# Every vector carries the image, its true label and the expected output of
+# nn_inference: the prediction and the output layer values (logits) computed in
+# the kernel's float32 order (hls_sim.py), from the weights in matmul.hpp or a
+# saved Keras model.
+#
+#   header : test_vectors.h with the arrays as C initialisers, for a few images
+#            compiled into the testbench
+#   bin    : test_vectors.bin read by matmul_tb.cpp at run time, for thousands of
+#            images (-all covers the whole test set in C simulation)
+#
+# .bin layout (little-endian): magic b'NNTV', uint32 count, uint32 n_inputs,
+# uint32 n_outputs, then float32 images[count][n_inputs], int32 labels[count],
+# int32 expected[count], float32 logits[count][n_outputs].
+
+MAGIC = b'NNTV'
+HEADER = struct.Struct('<4sIII')
+SELECTIONS = ('first', 'random', 'stratified')
+
+
+def select(labels, per_class, selection='first', seed=0):
+	"""Indices of per_class test images of every digit
+
+	first     : the first per_class images of each class folder
+	random    : per_class images drawn at random from each class
+	stratified: per_class images evenly spaced over each class
+	"""
+	rng = np.random.default_rng(seed)
+	indices = []
+	for digit in range(10):
+		members = np.flatnonzero(labels == digit)
+		n = min(per_class, len(members))
+		if selection == 'first':
+			chosen = members[:n]
+		elif selection == 'random':
+			chosen = np.sort(rng.choice(members, n, replace=False))
+		elif selection == 'stratified':
+			chosen = members[np.linspace(0, len(members) - 1, n).round().astype(int)]
+		else:
+			raise ValueError("Unknown selection " + selection)
+		indices.append(chosen)
+	return np.concatenate(indices)
+
+
+def expected_outputs(images, weights):
+	"""(predictions, logits) of nn_inference for N flattened images"""
+	pred, logits = hls_sim.nn_inference(images, weights)
+	return pred.astype(np.int32), logits.astype(np.float32)
+
+
+def _c_rows(file, name, values, fmt):
+	"""Write a 1D or 2D array as a C initialiser with one vectorised savetxt call"""
+	file.write('%s = {\n' % name)
+	if values.ndim == 1:
+		np.savetxt(file, values[None], fmt='\t' + ', '.join([fmt] * len(values)))
+	else:
+		np.savetxt(file, values, fmt='\t{' + ', '.join([fmt] * values.shape[1]) + '},')
+	file.write('};\n\n')
+
+
+def write_header(filename, images, labels, pred, logits, indices):
+	with open(filename, 'w') as file:
+		file.write('// Generated by generate_test_images.py, test set indices: %s\n' % ' '.join(str(i) for i in indices))
+		file.write('#define N_TEST_VECTORS %d\n\n' % len(images))
+		_c_rows(file, 'const float test_images[N_TEST_VECTORS][n_inputs]', images, '%.9g')
+		_c_rows(file, 'const int test_labels[N_TEST_VECTORS]', labels, '%d')
+		_c_rows(file, 'const int test_expected[N_TEST_VECTORS]', pred, '%d')
+		_c_rows(file, 'const float test_logits[N_TEST_VECTORS][n_layer3]', logits, '%.9g')
+
+
+def write_bin(filename, images, labels, pred, logits):
+	with open(filename, 'wb') as file:
+		file.write(HEADER.pack(MAGIC, len(images), images.shape[1], logits.shape[1]))
+		for array, dtype in ((images, '<f4'), (labels, '<i4'), (pred, '<i4'), (logits, '<f4')):
+			np.ascontiguousarray(array, dtype=dtype).tofile(file)
+
+
+def read_bin(filename):
+	"""Return (images, labels, expected, logits) of a .bin written by write_bin"""
+	with open(filename, 'rb') as file:
+		data = file.read()
+	magic, count, n_inputs, n_outputs = HEADER.unpack_from(data)
+	if magic != MAGIC:
+		raise ValueError(filename + " is not a test vector file")
+	offset = HEADER.size
+	arrays = []
+	for dtype, shape in (('<f4', (count, n_inputs)), ('<i4', (count,)), ('<i4', (count,)), ('<f4', (count, n_outputs))):
+		size = int(np.prod(shape))
+		arrays.append(np.frombuffer(data, dtype=dtype, count=size, offset=offset).reshape(shape))
+		offset += size * 4
+	return tuple(arrays)
+
+
+def main():
+	## e.g. python3 generate_test_images.py -per_class 1 -format header -out ../hls/test_vectors.h
+	##      python3 generate_test_images.py -all -out ../hls/test_vectors.bin
+	import argparse
+	parser = argparse.ArgumentParser(description='Generate matmul_tb.cpp test vectors with expected predictions and logits')
+	parser.add_argument('-per_class', type=int, default=1, help='images per digit')
+	parser.add_argument('-selection', choices=SELECTIONS, default='first')
+	parser.add_argument('-all', action='store_true', help='the whole test set instead of per_class images per digit')
+	parser.add_argument('-seed', type=int, default=0)
+	parser.add_argument('-format', choices=['header', 'bin'], default=None, help='default from the -out extension')
+	parser.add_argument('-out', default=None, help='default ../hls/test_vectors.h, or .bin with -all')
+	parser.add_argument('-hpp', default=nn_engine.DEFAULT_HPP, help='matmul.hpp with the weights the expected outputs are computed with')
+	parser.add_argument('-keras_model', default=None, help='model saved by mnist_net.py to take the weights from instead')
+	parser.add_argument('-dataset_dir', default=None)
+	args = parser.parse_args()
+
+	hls_dir = os.path.dirname(nn_engine.DEFAULT_HPP)
+	out = args.out or os.path.join(hls_dir, 'test_vectors.bin' if args.all else 'test_vectors.h')
+	format = args.format or ('bin' if out.endswith('.bin') else 'header')
+
+	if args.keras_model:
+		import quantize
+		weights = quantize.load_keras_weights(args.keras_model)
+	else:
+		weights = nn_engine.load_weights_hpp(args.hpp)
+	n_inputs = weights[0].shape[0]
+	side = int(round(np.sqrt(n_inputs)))
+	images, labels = dataset.load_dataset('testing', (side, side), dataset_dir=args.dataset_dir)
+
+	indices = np.arange(len(labels)) if args.all else select(labels, args.per_class, args.selection, args.seed)
+	vectors = dataset.normalize(images[indices]).reshape(len(indices), -1)
+	true_labels = labels[indices].astype(np.int32)
+	pred, logits = expected_outputs(vectors, weights)
+
+	if format == 'header':
+		write_header(out, vectors, true_labels, pred, logits, indices)
+	else:
+		write_bin(out, vectors, true_labels, pred, logits)
+	print("Wrote %d test vectors to %s (expected accuracy %.4f)" % (len(indices), out, np.mean(pred == true_labels)))
 
-# Script to generate C++ test image arrays from MNIST dataset
-# Output can be copied into matmul_tb.cpp for hardware testing
-
-def generate_test_images(num_images=10):
-    """Generate test images in C++ array format"""
-    
-    dims = (10, 10)  # 10x10 images
-    dataset_dir = '/Users/siwartaouih/FPGA_AI/MNIST_Dataset_JPG'
-    
-    print("Generating C++ test image arrays from MNIST dataset...\n")
-    print("=" * 70)
-    
-    # Load test images for each digit (0-9)
-    for digit in range(10):
-        read_folder = dataset_dir + '/MNIST_JPG_testing/' + str(digit) + '/'
-        
-        # Get first image of this digit
-        image_files = os.listdir(read_folder)
-        if not image_files:
-            print(f"No images found for digit {digit}")
-            continue
-            
-        # Read and process the first image
-        img_path = os.path.join(read_folder, image_files[0])
-        img = cv2.imread(img_path, 0)  # grayscale
-        img = cv2.resize(img, dims, interpolation=cv2.INTER_AREA)
-        img = img / 255.0  # normalize to 0-1
-        
-        # Flatten to 1D array (100 pixels)
-        img_flat = img.flatten()
-        
-        # Generate C++ array format
-        print(f"\n// Test image for digit: {digit}")
-        print(f"// Source: {image_files[0]}")
-        print(f"float input_img_{digit}[n_inputs] = {{", end="")
-        
-        # Print 10 values per line for readability
-        for i in range(len(img_flat)):
-            if i % 10 == 0:
-                print("\n\t\t", end="")
-            print(f"{img_flat[i]}", end="")
-            if i < len(img_flat) - 1:
-                print(", ", end="")
-        
-        print("}}; // {}\n".format(digit))
-        
-        # Generate the inference call
-        print(f"int pred_{digit} = nn_inference(input_img_{digit});")
-        print(f'std::cout << "NN Prediction for digit {digit}: " << pred_{digit} << std::endl;')
-        print("=" * 70)
-
-    print("\n\nCopy the arrays above into matmul_tb.cpp to test more digits!")
-    print("Each array represents a real MNIST handwritten digit image.")
 
 if __name__ == "__main__":
-    generate_test_images()
+	main()
@@ -0,0 +1,216 @@
+import numpy as np
+import json
+import os
+import sys
+import time
+import dataset
+import hls_sim
+import nn_engine
+import result_cache
+import uart_stream
+
+# Hardware-in-the-loop evaluation: streams the whole MNIST_JPG_testing set (in
+# dataset order) to a board or the board emulator and compares its predictions
+# with the bit-exact model of matmul.cpp (hls_sim.py), the NumPy engine and,
+# optionally, Keras. This is the check to pass before deploying a new
+# nn_inference IP: with the same weights the board must agree with hls_sim on
+# every image (-max_disagree).
+#
+# The board has to reply with predictions (framed protocol, or RESULT lines with
+# -framed none); helloworld.c only echoes the pixels. Progress is checkpointed
+# to an .npz every `block` images, so after a serial disconnect (or Ctrl+C) the
+# same command resumes where it stopped. The checkpoint records the weights
+# digest and image count and is ignored if they changed.
+
+DEFAULT_CHECKPOINT = 'hil_checkpoint.npz'
+DEFAULT_REPORT = 'hil_report.json'
+NOT_DONE = -1
+
+
+def load_checkpoint(path, digest, count):
+	"""(predictions, cycles, stream_s) from a checkpoint of the same run, None if there is none"""
+	if not path or not os.path.exists(path):
+		return None
+	with np.load(path) as data:
+		if str(data['digest']) != digest or len(data['predictions']) != count:
+			print("Ignoring checkpoint %s: different weights or test set" % path)
+			return None
+		return data['predictions'].copy(), data['cycles'].copy(), float(data['stream_s'])
+
+
+def save_checkpoint(path, digest, predictions, cycles, stream_s):
+	"""Write the checkpoint atomically, a disconnect while saving never corrupts it"""
+	tmp = path + '.tmp.npz'
+	np.savez(tmp, digest=digest, predictions=predictions, cycles=cycles, stream_s=stream_s)
+	os.replace(tmp, path)
+
+
+def stream_blocks(connect, images, predictions, cycles, block, window, batch, on_block):
+	"""Stream every image whose prediction is NOT_DONE, block by block, returns seconds spent streaming
+
+	connect() opens a StreamClient; on_block(stream_s) is called after every block.
+	Exceptions (disconnects, timeouts) propagate after the finished blocks were reported.
+	"""
+	todo = np.flatnonzero(predictions == NOT_DONE)
+	stream_s = 0.0
+	with connect() as client:
+		for start in range(0, len(todo), block):
+			indices = todo[start:start + block]
+			def on_reply(index, reply, latency, indices=indices):
+				predictions[indices[index]], cycles[indices[index]] = reply
+			start_t = time.perf_counter()
+			client.stream(images[indices], window, on_reply, batch)
+			stream_s += time.perf_counter() - start_t
+			on_block(stream_s)
+	return stream_s
+
+
+def references(images, weights, keras_model=None, cache=None):
+	"""Predictions of the reference models, by name"""
+	refs = {
+		'hls_sim': hls_sim.nn_inference(images, weights)[0],
+		'numpy': nn_engine.NNEngine(weights).predict(images),
+	}
+	if keras_model:
+		refs['keras'] = hls_sim.keras_reference(keras_model, images, cache)[0]
+	return refs
+
+
+def report(predictions, cycles, labels, refs, stream_s):
+	"""Accuracy, agreement with every reference, the disagreement list and sustained throughput"""
+	result = {
+		'images': len(predictions),
+		'accuracy': float(np.mean(predictions == labels)),
+		'images_per_s': len(predictions) / stream_s if stream_s else None,
+		'stream_s': stream_s,
+		'cycles_mean': float(np.mean(cycles)),
+		'references': {},
+		'disagreements': [],
+	}
+	disagree = np.zeros(len(predictions), dtype=bool)
+	for name, ref in refs.items():
+		differs = predictions != ref
+		disagree |= differs
+		result['references'][name] = {'accuracy': float(np.mean(ref == labels)), 'disagreements': int(differs.sum())}
+	for i in np.flatnonzero(disagree):
+		entry = {'index': int(i), 'label': int(labels[i]), 'board': int(predictions[i])}
+		entry.update((name, int(ref[i])) for name, ref in refs.items())
+		result['disagreements'].append(entry)
+	return result
+
+
+def print_report(result):
+	print("Board accuracy: %.4f over %d images" % (result['accuracy'], result['images']))
+	if result['images_per_s']:
+		print("Sustained: %.1f images/s (%.1f s streaming), mean %.0f cycles per image" % (result['images_per_s'], result['stream_s'], result['cycles_mean']))
+	for name, ref in result['references'].items():
+		print("  %-8s acc %.4f  disagreements with board: %d" % (name, ref['accuracy'], ref['disagreements']))
+	names = list(result['references'])
+	if result['disagreements']:
+		print("\n%7s %6s %6s " % ('index', 'label', 'board') + ' '.join('%8s' % name for name in names))
+		for entry in result['disagreements']:
+			print("%7d %6d %6d " % (entry['index'], entry['label'], entry['board']) + ' '.join('%8d' % entry[name] for name in names))
+
+
+def main():
+	## e.g. python3 hil_eval.py -port /dev/ttyUSB1 -keras_model mnist_net.h5
+	##      python3 hil_eval.py -emulate            (no board, exercises the runner)
+	import argparse
+	parser = argparse.ArgumentParser(description='Stream the whole test set to the board and compare with the reference models')
+	parser.add_argument('-port', default=None, help='serial port of the board')
+	parser.add_argument('-emulate', action='store_true', help='use board_emulator.py instead of a board')
+	parser.add_argument('-baud', type=int, default=uart_stream.BAUD_RATE)
+	parser.add_argument('-framed', choices=sorted(uart_stream.FORMATS) + ['none'], default='uint8',
+		help='pixel format of protocol.py frames, none: raw float32 images answered by RESULT lines')
+	parser.add_argument('-window', type=int, default=8, help='images in flight')
+	parser.add_argument('-batch', type=int, default=8, help='images per frame')
+	parser.add_argument('-timeout', type=float, default=5.0)
+	parser.add_argument('-block', type=int, default=500, help='images between checkpoints')
+	parser.add_argument('-checkpoint', default=DEFAULT_CHECKPOINT)
+	parser.add_argument('-restart', action='store_true', help='ignore an existing checkpoint')
+	parser.add_argument('-retries', type=int, default=5, help='reconnect attempts after a disconnect')
+	parser.add_argument('-retry_wait', type=float, default=2.0, help='seconds between reconnect attempts')
+	parser.add_argument('-count', type=int, default=None, help='only the first COUNT test images')
+	parser.add_argument('-hpp', default=nn_engine.DEFAULT_HPP, help='matmul.hpp of the bitstream, for the reference models')
+	parser.add_argument('-keras_model', default=None, help='also compare with the Keras model saved by mnist_net.py')
+	parser.add_argument('-cache', nargs='?', const=result_cache.DEFAULT_PATH, default=None, help='result cache for the Keras reference')
+	parser.add_argument('-dataset_dir', default=None)
+	parser.add_argument('-report', default=DEFAULT_REPORT, help='JSON report')
+	parser.add_argument('-max_disagree', type=int, default=0, help='exit 1 if the board disagrees with hls_sim on more images')
+	args = parser.parse_args()
+	if not args.port and not args.emulate:
+		sys.exit("Give -port or -emulate")
+
+	weights = nn_engine.load_weights_hpp(args.hpp)
+	side = int(round(np.sqrt(weights[0].shape[0])))
+	images, labels = dataset.load_dataset('testing', (side, side), dataset_dir=args.dataset_dir)
+	images = dataset.normalize(images[:args.count]).reshape(-1, weights[0].shape[0])
+	labels = labels[:args.count].astype(np.int64)
+	digest = result_cache.weights_digest(weights)
+
+	state = None if args.restart else load_checkpoint(args.checkpoint, digest, len(labels))
+	if state:
+		predictions, cycles, stream_s = state
+		print("Resuming from %s: %d of %d images done" % (args.checkpoint, np.sum(predictions != NOT_DONE), len(labels)))
+	else:
+		predictions = np.full(len(labels), NOT_DONE, dtype=np.int64)
+		cycles = np.zeros(len(labels), dtype=np.int64)
+		stream_s = 0.0
+
+	board = None
+	port = args.port
+	framed = None if args.framed == 'none' else uart_stream.FORMATS[args.framed]
+	if args.emulate:
+		import board_emulator
+		board = board_emulator.FramedBoard(baud=args.baud) if framed is not None else board_emulator.EmulatedBoard(baud=args.baud)
+		port = board.start().port
+
+	def connect():
+		parser = None if framed is not None else uart_stream.ResultParser()
+		return uart_stream.StreamClient(port, args.baud, parser, args.timeout, framed)
+
+	progress = {'saved_s': stream_s} # streaming time up to the last checkpoint
+	def on_block(block_s, base_s):
+		progress['saved_s'] = base_s + block_s
+		save_checkpoint(args.checkpoint, digest, predictions, cycles, progress['saved_s'])
+		print("\r%d / %d images" % (np.sum(predictions != NOT_DONE), len(labels)), end='', flush=True)
+
+	try:
+		attempt = 0
+		while np.any(predictions == NOT_DONE):
+			base_s = progress['saved_s']
+			try:
+				stream_blocks(connect, images, predictions, cycles, args.block, args.window, args.batch,
+					lambda block_s: on_block(block_s, base_s))
+			except (OSError, TimeoutError) as e: # serial.SerialException is an OSError
+				attempt += 1
+				if attempt > args.retries:
+					sys.exit("\n%s\nGiving up after %d reconnects, rerun the same command to resume from %s"
+						% (e, args.retries, args.checkpoint))
+				print("\n%s, reconnecting in %.0f s (%d/%d)" % (e, args.retry_wait, attempt, args.retries))
+				time.sleep(args.retry_wait)
+	except KeyboardInterrupt:
+		sys.exit("\nInterrupted, rerun the same command to resume from " + args.checkpoint)
+	finally:
+		if board:
+			board.stop()
+	print()
+
+	cache = None
+	if args.keras_model and args.cache:
+		cache = result_cache.ResultCache('keras:' + result_cache.file_digest(args.keras_model), args.cache)
+	result = report(predictions, cycles, labels, references(images, weights, args.keras_model, cache), progress['saved_s'])
+	if cache:
+		cache.close()
+	print_report(result)
+	with open(args.report, 'w') as f:
+		json.dump(result, f, indent=2)
+	print("Wrote", args.report)
+
+	if result['references']['hls_sim']['disagreements'] > args.max_disagree:
+		sys.exit("FAIL: the board disagrees with the bit-exact model on %d images" % result['references']['hls_sim']['disagreements'])
+	print("PASS")
+
+
+if __name__=="__main__":
+	main()
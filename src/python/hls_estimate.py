@@ -0,0 +1,210 @@
+import collections
+import itertools
+import sys
+
+# Latency and resource model of the nn_inference HLS kernel in src/hls/matmul.cpp.
+# Operator latencies are those of the floating-point cores Vitis HLS instantiated
+# in nn_inference/hdl/ip (fadd 5 cycles, fmul 4 cycles, fcmp 2 cycles).
+#
+# Every dot product is `sum += input[k] * weights[k][j]` on a float sum, which HLS
+# may not reassociate, so each output needs n_in back-to-back fadds. Per dense
+# layer the model takes a LayerConfig:
+#   col_unroll : #pragma HLS UNROLL factor on the col loop (None = fully)
+#   pipeline   : #pragma HLS PIPELINE on the col loop, which fully unrolls the prod
+#                loop; otherwise HLS pipelines prod at II = fadd latency
+#   partition  : weight array banks (ARRAY_PARTITION cyclic factor), None = as many
+#                as the loop needs to read its weights without stalling
+# The layers run one after the other, so HLS shares the float operators between
+# them and the kernel needs as many as the widest layer.
+#
+# The exported IP (layer 1 col/prod pipelined, layer 2/3 col pipelined) is
+# estimated at 16505 cycles; its component.xml reports 19643.
+
+FADD_LATENCY = 5
+FMUL_LATENCY = 4
+FCMP_LATENCY = 2
+CLOCK_MHZ = 125 # create_clock -period 8 in run_hls.tcl
+
+## Resources of one operator core on 7-series (fadd full_dsp, fmul max_dsp as in nn_inference/hdl/ip)
+FADD_RESOURCES = {'dsp': 2, 'lut': 203, 'ff': 205}
+FMUL_RESOURCES = {'dsp': 3, 'lut': 321, 'ff': 143}
+BRAM18_WORDS = 512 # 32-bit words per BRAM18 (512 x 36)
+LUTROM_MAX_WORDS = 64 # smaller banks are built from LUTs, 32 LUTs per 64 words
+
+## set_part {xc7z020clg484-1} in run_hls.tcl
+XC7Z020 = {'dsp': 220, 'bram18': 280, 'lut': 53200, 'ff': 106400}
+
+LayerConfig = collections.namedtuple('LayerConfig', 'col_unroll pipeline partition', defaults=(1, False, None))
+LayerEstimate = collections.namedtuple('LayerEstimate', 'cycles ii fadd fmul banks bram18 lut')
+Estimate = collections.namedtuple('Estimate', 'cycles dsp bram18 lut ff fadd fmul layers configs')
+
+## Column-loop unroll factor per dense layer, as in matmul.cpp (#pragma HLS UNROLL on hwmm_layer1's col loop only)
+DEFAULT_UNROLL = {1: None, 2: 1, 3: 1} # None = fully unrolled
+
+
+def _ports_ii(reads, banks):
+	"""Cycles to read `reads` weights from `banks` dual-port memories"""
+	return -(-reads // (2 * banks))
+
+
+def dense_layer(n_in, n_out, config=LayerConfig()):
+	"""LayerEstimate of hwmm_layerN under a LayerConfig"""
+	unroll = n_out if config.col_unroll is None else min(config.col_unroll, n_out)
+	passes = -(-n_out // unroll) # ceil
+	if config.pipeline:
+		reads = n_in * unroll # one col iteration reads a weight column block per cycle
+		banks = config.partition or -(-reads // 2)
+		ii = _ports_ii(reads, banks)
+		depth = n_in * FADD_LATENCY + FMUL_LATENCY + 1
+		cycles = (passes - 1) * ii + depth
+		fadd = fmul = -(-reads // ii)
+	else:
+		banks = config.partition or -(-unroll // (2 * FADD_LATENCY))
+		ii = max(FADD_LATENCY, _ports_ii(unroll, banks)) # unroll weights per prod iteration
+		cycles = passes * (n_in * ii + FMUL_LATENCY + 1)
+		fadd = fmul = unroll
+	bank_words = -(-n_in * n_out // banks)
+	if bank_words <= LUTROM_MAX_WORDS:
+		bram18, lut = 0, banks * 32 * -(-bank_words // 64)
+	else:
+		bram18, lut = banks * -(-bank_words // BRAM18_WORDS), 0
+	return LayerEstimate(cycles, ii, fadd, fmul, banks, bram18, lut)
+
+
+def dense_cycles(n_in, n_out, unroll=1):
+	"""Cycles for hwmm_layerN with the column loop unrolled by `unroll` (None = fully)"""
+	return dense_layer(n_in, n_out, LayerConfig(unroll)).cycles
+
+
+def relu_cycles(n):
+	"""hw_act_layer1/2: one compare and store per element"""
+	return n + 1
+
+
+def argmax_cycles(n):
+	"""hw_act_layer3: running max with a 2-cycle fcmp per element"""
+	return n * FCMP_LATENCY + 1
+
+
+def estimate(sizes, configs=None):
+	"""Estimate of nn_inference for layer sizes [n_inputs, n_layer1, ...] and one LayerConfig per dense layer"""
+	n_layers = len(sizes) - 1
+	configs = configs or [LayerConfig(DEFAULT_UNROLL.get(n, 1)) for n in range(1, n_layers + 1)]
+	layers = [dense_layer(sizes[n], sizes[n + 1], configs[n]) for n in range(n_layers)]
+	cycles = sum(layer.cycles for layer in layers)
+	cycles += sum(relu_cycles(n) for n in sizes[1:-1]) + argmax_cycles(sizes[-1])
+	fadd = max(layer.fadd for layer in layers)
+	fmul = max(layer.fmul for layer in layers)
+	return Estimate(
+		cycles=cycles,
+		dsp=fadd * FADD_RESOURCES['dsp'] + fmul * FMUL_RESOURCES['dsp'],
+		bram18=sum(layer.bram18 for layer in layers),
+		lut=fadd * FADD_RESOURCES['lut'] + fmul * FMUL_RESOURCES['lut'] + sum(layer.lut for layer in layers),
+		ff=fadd * FADD_RESOURCES['ff'] + fmul * FMUL_RESOURCES['ff'],
+		fadd=fadd, fmul=fmul, layers=layers, configs=list(configs))
+
+
+def nn_inference_cycles(sizes, unroll=None):
+	"""Estimated latency in cycles of nn_inference for layer sizes [n_inputs, n_layer1, ...]"""
+	unroll = DEFAULT_UNROLL if unroll is None else unroll
+	return estimate(sizes, [LayerConfig(unroll.get(n, 1)) for n in range(1, len(sizes))]).cycles
+
+
+def cycles_to_ms(cycles, clock_mhz=CLOCK_MHZ):
+	return cycles / (clock_mhz * 1000.0)
+
+
+def fits(est, device=XC7Z020, max_util=1.0):
+	return all(getattr(est, key) <= max_util * available for key, available in device.items())
+
+
+def layer_candidates(n_in, n_out):
+	"""Unroll factors 1, 2, 4, ... and full, each with and without col pipelining"""
+	unrolls = sorted({min(1 << i, n_out) for i in range(n_out.bit_length() + 1)})
+	return [LayerConfig(u, pipeline) for u in unrolls for pipeline in (False, True)]
+
+
+def search(sizes, device=XC7Z020, max_util=1.0, top=10):
+	"""Lowest-latency configurations that fit the device, ties broken by DSP count"""
+	candidates = [layer_candidates(sizes[n], sizes[n + 1]) for n in range(len(sizes) - 1)]
+	results = []
+	for configs in itertools.product(*candidates):
+		est = estimate(sizes, configs)
+		if fits(est, device, max_util):
+			results.append(est)
+	results.sort(key=lambda est: (est.cycles, est.dsp, est.lut))
+	return results[:top]
+
+
+def pragmas(est):
+	"""The matmul.cpp pragmas of an estimate's configuration, one line per layer"""
+	lines = []
+	for n, (config, layer) in enumerate(zip(est.configs, est.layers), 1):
+		parts = []
+		if config.pipeline:
+			parts.append("col: PIPELINE II=%d" % layer.ii)
+		if config.col_unroll != 1:
+			parts.append("col: UNROLL" + ("" if config.col_unroll is None else " factor=%d" % config.col_unroll))
+		if layer.banks > 1:
+			parts.append("ARRAY_PARTITION weights cyclic factor=%d" % layer.banks)
+		lines.append("hwmm_layer%d: %s" % (n, ", ".join(parts) or "no pragmas"))
+	return lines
+
+
+def describe(est, clock_mhz=CLOCK_MHZ, device=XC7Z020):
+	return ("%6d cycles (%.3f ms)  DSP %3d/%d  BRAM18 %3d/%d  LUT %5d/%d  FF %5d/%d  fadd %d fmul %d"
+		% (est.cycles, cycles_to_ms(est.cycles, clock_mhz), est.dsp, device['dsp'], est.bram18, device['bram18'],
+		est.lut, device['lut'], est.ff, device['ff'], est.fadd, est.fmul))
+
+
+def main():
+	## e.g. python3 hls_estimate.py              (matmul.cpp as it is, sizes from matmul.hpp)
+	##      python3 hls_estimate.py -search -max_util 0.8
+	##      python3 hls_estimate.py 100 32 16 10 -config 32:0 1:1 1:1
+	import argparse
+	parser = argparse.ArgumentParser(description='Estimate latency and resources of the nn_inference HLS kernel')
+	parser.add_argument('sizes', type=int, nargs='*', help='layer sizes, default from matmul.hpp')
+	parser.add_argument('-hpp', default=None, help='matmul.hpp to take the layer sizes from')
+	parser.add_argument('-config', nargs='+', default=None, metavar='UNROLL:PIPELINE[:BANKS]',
+		help='per dense layer, unroll 0 = fully, e.g. 0:0 1:1 1:1')
+	parser.add_argument('-search', action='store_true', help='search unroll/pipeline configurations that fit the xc7z020')
+	parser.add_argument('-max_util', type=float, default=1.0, help='fraction of each xc7z020 resource the kernel may use')
+	parser.add_argument('-top', type=int, default=10)
+	parser.add_argument('-clock', type=float, default=CLOCK_MHZ, help='clock in MHz')
+	args = parser.parse_args()
+
+	sizes = args.sizes
+	if not sizes:
+		import nn_engine
+		weights = nn_engine.load_weights_hpp(args.hpp)
+		sizes = [weights[0].shape[0]] + [w.shape[1] for w in weights]
+	print("Layer sizes: ", sizes)
+
+	if args.search:
+		results = search(sizes, XC7Z020, args.max_util, args.top)
+		if not results:
+			sys.exit("No configuration fits within %.0f%% of the xc7z020" % (args.max_util * 100))
+		for rank, est in enumerate(results, 1):
+			print("\n#%d %s" % (rank, describe(est, args.clock)))
+			for line in pragmas(est):
+				print("    " + line)
+		return
+
+	configs = None
+	if args.config:
+		configs = []
+		for spec in args.config:
+			fields = [int(f) for f in spec.split(':')]
+			configs.append(LayerConfig(fields[0] or None, bool(fields[1]) if len(fields) > 1 else False,
+				fields[2] if len(fields) > 2 else None))
+		if len(configs) != len(sizes) - 1:
+			sys.exit("Need one -config per dense layer (%d)" % (len(sizes) - 1))
+	est = estimate(sizes, configs)
+	print("Estimated latency: %d cycles (%.3f ms at %d MHz)" % (est.cycles, cycles_to_ms(est.cycles, args.clock), args.clock))
+	print(describe(est, args.clock), "fits" if fits(est) else "does NOT fit", "the xc7z020")
+	for n, layer in enumerate(est.layers, 1):
+		print("  layer %d: %5d cycles, II %d, %2d fadd/fmul, %2d weight banks, %d BRAM18" % (n, layer.cycles, layer.ii, layer.fadd, layer.banks, layer.bram18))
+
+
+if __name__=="__main__":
+	main()
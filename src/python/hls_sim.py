@@ -0,0 +1,114 @@
+import numpy as np
+import sys
+import time
+import nn_engine
+
+# Bit-exact NumPy mirror of nn_inference() in src/hls/matmul.cpp. Every image of a
+# batch is processed at once, but each dot product is accumulated in the same
+# order as the HLS loops: sum = 0; for k: sum += input[k] * weights[k][j], with
+# the float32 product rounded before the float32 add (separate fmul/fadd cores).
+
+ARGMAX_INIT = np.float32(-999.9) # float max_val = -999.9; in hw_act_layer3
+
+
+def hwmm_layer(inputs, weights):
+	"""hwmm_layer1/2/3: sequential float32 multiply-accumulate over k"""
+	inputs = np.asarray(inputs, dtype=np.float32)
+	weights = np.asarray(weights, dtype=np.float32)
+	acc = np.zeros((inputs.shape[0], weights.shape[1]), dtype=np.float32)
+	for k in range(weights.shape[0]):
+		prod = inputs[:, k:k + 1] * weights[k] # rounded float32 product
+		acc = acc + prod # rounded float32 sum
+	return acc
+
+
+def hw_act_relu(inputs):
+	"""hw_act_layer1/2: if (input < 0.0) output = 0.0; else output = input"""
+	return np.where(inputs < 0, np.float32(0), inputs)
+
+
+def hw_act_argmax(inputs):
+	"""hw_act_layer3: first index with input > running max, -1 if none beat -999.9"""
+	pred = np.full(inputs.shape[0], -1, dtype=np.int32)
+	max_val = np.full(inputs.shape[0], ARGMAX_INIT, dtype=np.float32)
+	for i in range(inputs.shape[1]):
+		better = inputs[:, i] > max_val
+		pred[better] = i
+		max_val[better] = inputs[better, i]
+	return pred
+
+
+def nn_inference(images, weights):
+	"""Return (predictions, output layer values) for N images as matmul.cpp computes them"""
+	x = np.asarray(images, dtype=np.float32).reshape(-1, weights[0].shape[0])
+	for w in weights[:-1]:
+		x = hw_act_relu(hwmm_layer(x, w))
+	out = hwmm_layer(x, weights[-1])
+	return hw_act_argmax(out), out
+
+
+def keras_reference(model_path, images, cache=None):
+	"""Return Keras (predictions, softmax) for a model saved by mnist_net.py
+
+	With a result_cache.ResultCache only the images it does not hold are run
+	through Keras, and TensorFlow is not even imported when it holds them all.
+	"""
+	def predict(x):
+		import tensorflow as tf
+		model = tf.keras.models.load_model(model_path)
+		return model.predict(x.reshape((-1,) + tuple(model.input_shape[1:])), batch_size=4096, verbose=0)
+	scores = cache.predict_proba(images, predict) if cache else predict(images)
+	return np.argmax(scores, axis=1), scores
+
+
+def compare(hw_pred, ref_pred, labels):
+	"""Return indices of images where the hardware-order prediction differs from the reference"""
+	diff = np.flatnonzero(hw_pred != ref_pred)
+	print("Images: ", len(hw_pred))
+	print("HW-order acc: ", np.mean(hw_pred == labels), " reference acc: ", np.mean(ref_pred == labels))
+	print("Mismatches: ", len(diff))
+	for i in diff:
+		print("  index %d: hw %d, reference %d, label %d" % (i, hw_pred[i], ref_pred[i], labels[i]))
+	return diff
+
+
+def main():
+	## Regression test matmul.cpp order against Keras (or the NumPy engine) on the test set
+	import argparse
+	import dataset
+	parser = argparse.ArgumentParser(description='Compare HLS-order float32 inference against a reference on the MNIST test set')
+	parser.add_argument('-hpp', default=nn_engine.DEFAULT_HPP, help='matmul.hpp to take the hardware weights from')
+	parser.add_argument('-keras_model', default=None, help='model saved by mnist_net.py, default compares against nn_engine')
+	parser.add_argument('-cache', nargs='?', const='default', default=None,
+		help='keep Keras results in the result cache (SQLite file) so reruns skip the forward pass')
+	parser.add_argument('-dataset_dir', default=None)
+	parser.add_argument('-dims', type=int, nargs=2, default=[10, 10])
+	args = parser.parse_args()
+
+	weights = nn_engine.load_weights_hpp(args.hpp)
+	test_images, test_labels = dataset.load_dataset('testing', args.dims, dataset_dir=args.dataset_dir)
+	test_images = dataset.normalize(test_images)
+
+	start_t = time.time()
+	hw_pred, _ = nn_inference(test_images, weights)
+	print("HLS-order simulation time for ", len(test_images), " test images: ", time.time() - start_t, " seconds")
+
+	if args.keras_model:
+		cache = None
+		if args.cache:
+			import result_cache
+			cache = result_cache.ResultCache('keras:' + result_cache.file_digest(args.keras_model),
+				result_cache.DEFAULT_PATH if args.cache == 'default' else args.cache)
+		ref_pred, _ = keras_reference(args.keras_model, test_images, cache)
+		if cache:
+			print(cache.summary())
+			cache.close()
+	else:
+		ref_pred = nn_engine.NNEngine(weights).predict(test_images)
+
+	diff = compare(hw_pred, ref_pred, test_labels)
+	sys.exit(1 if len(diff) else 0)
+
+
+if __name__=="__main__":
+	main()
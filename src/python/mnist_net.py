@@ -1,112 +1,108 @@
 import numpy as np
-import cv2
 import os
 import time
-import tensorflow as tf
-import struct
-from tensorflow.keras.models import Sequential
-from tensorflow.keras.layers import Flatten, Dense, Activation
-from sklearn.utils import shuffle
-import sys
+import dataset
+import nn_engine
+import weight_export
+
+def build_model(dims=(10,10), hidden=(32,16), n_classes=10):
+	"""Bias-free dense network: Flatten, ReLU hidden layers, softmax output layer"""
+	from tensorflow.keras.models import Sequential # TensorFlow only when a model is built
+	from tensorflow.keras.layers import Flatten, Dense
+	model = Sequential(
+		[Flatten(input_shape=dims)] +		# reshape e.g. 10x10 to 100, layer 0
+		[Dense(n, activation='relu', use_bias=False) for n in hidden] +	# dense layers 1 .. N-1
+		[Dense(n_classes, activation='softmax', use_bias=False)])	# output layer
+
+	model.compile(optimizer='adam',
+				  loss='sparse_categorical_crossentropy',
+				  metrics=['accuracy'])
+	return model
+
 
 def main():
-	args = sys.argv[1:]
-	if len(args) == 2 and args[0] == '-dataset_dir':
-		dataset_dir = str(args[1])	
+	## e.g. python3 mnist_net.py -dataset_dir <PATH_TO_DATASET> -pipeline cache
+	import argparse
+	parser = argparse.ArgumentParser(description='Train the network and export its weights')
+	parser.add_argument('-dataset_dir', default=None, help='defaults to MNIST_Dataset_JPG in the repository root')
+	parser.add_argument('-pipeline', choices=['memory', 'cache', 'jpg'], default='memory',
+		help='memory: whole set as one float32 array, cache/jpg: streaming tf.data pipeline over the uint8 cache or the JPG files')
+	parser.add_argument('-shuffle_buffer', type=int, default=10000, help='tf.data shuffle buffer in images (0 = whole set)')
+	args = parser.parse_args()
+	dataset_dir = args.dataset_dir
 
 	## Use CPU only
 	os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
 
-	## Load MNIST dataset
-	print("Loading dataset")
-	train_images = []
-	train_labels = []
-	test_images = []
-	test_labels = []
-
 	dims = (10,10) # dimensions of images to train/test with
-
-	dataset_dir = '/Users/siwartaouih/FPGA_AI/MNIST_Dataset_JPG'
-
-	for j in range(2): # train and test	
-		for i in range(10): # 0 to 9
-			if j == 0:
-				read_folder = dataset_dir + '/MNIST_JPG_training/' + str(i) + '/'
-			if j == 1:
-				read_folder = dataset_dir + '/MNIST_JPG_testing/' + str(i) + '/'
-			for filename in os.listdir(read_folder):
-				img = cv2.imread(os.path.join(read_folder,filename),0) # read img as grayscale
-				img = cv2.resize(img, dims, interpolation = cv2.INTER_AREA)	# resize img to fit dims
-				if img is not None:
-					if j == 0:
-						train_images.append(img / 255) # normalize pixel vals to be between 0 - 1
-						train_labels.append(i)
-					if j == 1:
-						test_images.append(img / 255)
-						test_labels.append(i)
-
-	## Convert to numpy arrays, flatten images - change dimensions from Nx10x10 to Nx100
-	train_images = np.asarray(train_images).astype('float32')
-	test_images = np.asarray(test_images).astype('float32')
-	train_labels = np.asarray(train_labels).astype('uint8')
-	test_labels = np.asarray(test_labels).astype('uint8')
-
-	## Shuffle dataset
-	train_images, train_labels = shuffle(train_images, train_labels)
-	test_images, test_labels = shuffle(test_images, test_labels)
+	hidden = (32, 16) # neurons of dense layers 1 and 2, layer 3 has the 10 outputs
+	epochs = 50
+	batch_size = 2000
+
+	if args.pipeline == 'memory':
+		## Load MNIST dataset (decoded once into a uint8 cache, see dataset.py)
+		print("Loading dataset")
+		train_images, train_labels = dataset.load_dataset('training', dims, dataset_dir=dataset_dir)
+		test_images, test_labels = dataset.load_dataset('testing', dims, dataset_dir=dataset_dir)
+
+		## Normalize pixel vals to be between 0 - 1 as float32
+		train_images = dataset.normalize(train_images)
+		test_images = dataset.normalize(test_images)
+
+		## Shuffle dataset
+		order = np.random.permutation(len(train_labels))
+		train_images, train_labels = train_images[order], train_labels[order]
+		order = np.random.permutation(len(test_labels))
+		test_images, test_labels = test_images[order], test_labels[order]
+	else:
+		## Stream batches through tf.data: parallel decode/normalize, shuffle buffer and prefetch,
+		## memory stays flat whatever dims is
+		train_ds, val_ds = dataset.tf_dataset('training', dims, batch_size, args.pipeline, args.shuffle_buffer,
+			validation_split=0.1, dataset_dir=dataset_dir)
+		test_ds = dataset.tf_dataset('testing', dims, batch_size, args.pipeline, dataset_dir=dataset_dir)
 
 	## Define network structure
-	model = Sequential([
-		Flatten(input_shape=dims),		# reshape 10x10 to 100, layer 0
-		Dense(32, activation='relu', use_bias=False),	# dense layer 1
-		Dense(16, activation='relu', use_bias=False),	# dense layer 2
-		Dense(10, activation='softmax', use_bias=False),	# dense layer 3
-	])
-
-	model.compile(optimizer='adam',
-				  loss='sparse_categorical_crossentropy',
-				  metrics=['accuracy'])
+	model = build_model(dims, hidden)
 
 
 	## Train network  
-	model.fit(train_images, train_labels, epochs=50, batch_size=2000, validation_split = 0.1)
+	if args.pipeline == 'memory':
+		model.fit(train_images, train_labels, epochs=epochs, batch_size=batch_size, validation_split = 0.1)
+	else:
+		model.fit(train_ds, epochs=epochs, validation_data=val_ds)
 
 	model.summary()
 
+	if args.pipeline == 'memory':
+		n_test = len(test_labels)
+	else:
+		n_test = len(dataset.list_split(dataset_dir or dataset.DEFAULT_DATASET_DIR, 'testing')[1])
 	start_t = time.time()
-	results = model.evaluate(test_images, test_labels, verbose=0)
+	if args.pipeline == 'memory':
+		results = model.evaluate(test_images, test_labels, verbose=0)
+	else:
+		results = model.evaluate(test_ds, verbose=0)
 	totalt_t = time.time() - start_t
-	print("Inference time for ", len(test_images), " test image: " , totalt_t, " seconds")
+	print("Inference time for ", n_test, " test image: " , totalt_t, " seconds")
+	if args.pipeline != 'memory':
+		test_images, test_labels = [t.numpy() for t in next(iter(test_ds))] # first batch for the example below
 
 
 	print("test loss, test acc: ", results)
 
-	#print(model.layers[1].weights[0].numpy().shape)
-	#print(model.layers[2].weights[0].numpy().shape)
-	#print(model.layers[3].weights[0].numpy().shape)
+	## Save trained model so hls_sim.py etc. can compare against Keras without retraining
+	model.save("mnist_net.h5")
 
 	## Retrieve network weights after training. Skip layer 0 (input layer)
-	for w in range(1, len(model.layers)):
-		weight_filename = "layer_" + str(w) + "_weights.txt" 
-		open(weight_filename, 'w').close() # clear file
-		file = open(weight_filename,"a") 
-		file.write('{')
-		for i in range(model.layers[w].weights[0].numpy().shape[0]):
-			file.write('{')
-			for j in range(model.layers[w].weights[0].numpy().shape[1]):
-				file.write(str(model.layers[w].weights[0].numpy()[i][j]))
-				if j != model.layers[w].weights[0].numpy().shape[1]-1:
-					file.write(', ')
-			file.write('}')
-			if i != model.layers[w].weights[0].numpy().shape[0]-1:
-				file.write(', \n')
-		file.write('}')
-		file.close()
-
-	network_weights = model.layers[1].weights
-	#print(network_weights)
-	layer_1_W = network_weights[0].numpy()
-	#print(layer_1_W)
+	weights = [model.layers[w].weights[0].numpy() for w in range(1, len(model.layers))]
+
+	## Save as .txt (C initialiser) files, the binary weights.nnw, and regenerate
+	## matmul.hpp and the Vitis nn_config.h so they cannot drift out of sync
+	for w in range(len(weights)):
+		with open("layer_" + str(w + 1) + "_weights.txt", 'w') as file:
+			file.write(nn_engine.format_weight_text(weights[w]))
+	weight_export.export(weights, "weights.nnw",
+		os.path.join(weight_export.HLS_DIR, 'matmul.hpp'), weight_export.DEFAULT_VITIS_HEADER)
 
 
 	print("test_image[0] label: ", test_labels[0])
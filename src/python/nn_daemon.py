@@ -0,0 +1,431 @@
+import numpy as np
+import os
+import queue
+import socket
+import socketserver
+import sys
+import threading
+import time
+from concurrent.futures import Future
+import protocol
+
+# Long-running host service that owns several boards (serial ports running the
+# framed protocol of protocol.py, or emulated boards) and serves inference to
+# local clients over a Unix socket.
+#
+# Clients speak the same framed protocol as the boards: they send images frames
+# and get one results frame per request back with the same seq, so any number of
+# requests can be in flight on one connection. Every request is split into chunks
+# of `chunk` images and each chunk goes to the healthy board with the fewest
+# images outstanding. When every board is over max_outstanding (busy) or has
+# failed within the last `cooldown` seconds (unhealthy), chunks run on the CPU
+# with the bit-exact NumPy model (hls_sim.py) instead; their cycle count is 0.
+# A chunk a board fails on is retried on the CPU, or on another board without
+# fallback. A request the service cannot serve gets an empty results frame.
+
+DEFAULT_SOCKET = '/tmp/fpga_ai.sock'
+DEFAULT_CHUNK = 64 # images per scheduling unit
+DEFAULT_MAX_OUTSTANDING = 256 # images queued on one board before it counts as busy
+DEFAULT_COOLDOWN_S = 5.0
+
+
+class Job:
+	"""A chunk of a request: images and the offset of its first image in the request"""
+
+	def __init__(self, request, offset, images):
+		self.request = request
+		self.offset = offset
+		self.images = images
+		self.attempts = 0
+
+
+class Request:
+	"""Collects the chunks of one submitted batch into a Future of (predictions, cycles)"""
+
+	def __init__(self, n):
+		self.future = Future()
+		self.predictions = np.zeros(n, dtype=np.uint8)
+		self.cycles = np.zeros(n, dtype=np.uint32)
+		self.remaining = n
+		self.lock = threading.Lock()
+		if not n:
+			self.future.set_result((self.predictions, self.cycles))
+
+	def chunk_done(self, job, predictions, cycles):
+		end = job.offset + len(job.images)
+		self.predictions[job.offset:end] = predictions
+		self.cycles[job.offset:end] = cycles
+		with self.lock:
+			self.remaining -= len(job.images)
+			finished = self.remaining == 0
+		if finished:
+			self.future.set_result((self.predictions, self.cycles))
+
+	def fail(self, error):
+		with self.lock:
+			if not self.future.done():
+				self.future.set_exception(error)
+
+
+class Backend:
+	"""Runs jobs from its own queue in a worker thread; infer() is defined by subclasses"""
+
+	def __init__(self, name):
+		self.name = name
+		self.jobs = queue.Queue()
+		self.lock = threading.Lock()
+		self.outstanding = 0 # images queued or in flight
+		self.images = 0
+		self.errors = 0
+		self.busy_s = 0.0
+		self.on_failure = None # set by the Scheduler
+		self._thread = threading.Thread(target=self._run, daemon=True)
+
+	def start(self):
+		self._thread.start()
+		return self
+
+	def stop(self):
+		self.jobs.put(None)
+		self._thread.join()
+
+	def healthy(self):
+		return True
+
+	def submit(self, job):
+		with self.lock:
+			self.outstanding += len(job.images)
+		self.jobs.put(job)
+
+	def _run(self):
+		while True:
+			job = self.jobs.get()
+			if job is None:
+				break
+			start_t = time.perf_counter()
+			try:
+				predictions, cycles = self.infer(job.images)
+			except Exception as e:
+				self.errors += 1
+				self.on_failure(self, job, e)
+			else:
+				self.images += len(job.images)
+				job.request.chunk_done(job, predictions, cycles)
+			finally:
+				self.busy_s += time.perf_counter() - start_t
+				with self.lock:
+					self.outstanding -= len(job.images)
+
+	def summary(self):
+		return "%-24s %8d images  %6.1f images/s busy  %d errors%s" % (self.name, self.images,
+			self.images / self.busy_s if self.busy_s else 0.0, self.errors, '' if self.healthy() else '  UNHEALTHY')
+
+
+class CpuBackend(Backend):
+	"""Bit-exact NumPy model of the kernel on the host (hls_sim.py), cycles reported as 0"""
+
+	def __init__(self, weights):
+		super().__init__('cpu')
+		self.weights = weights
+
+	def infer(self, images):
+		import hls_sim
+		predictions, _ = hls_sim.nn_inference(images, self.weights)
+		return predictions, 0
+
+
+class BoardBackend(Backend):
+	"""A board on a serial port speaking the framed protocol
+
+	The port is opened on first use and reopened after a failure; the board is
+	unhealthy for `cooldown` seconds after it failed a job.
+	"""
+
+	def __init__(self, port, format=protocol.FMT_UINT8, window=32, batch=8, timeout=2.0, cooldown=DEFAULT_COOLDOWN_S, name=None):
+		super().__init__(name or port)
+		self.port = port
+		self.format = format
+		self.window = window
+		self.batch = batch
+		self.timeout = timeout
+		self.cooldown = cooldown
+		self.client = None
+		self.retry_t = 0.0
+
+	def healthy(self):
+		return time.perf_counter() >= self.retry_t
+
+	def infer(self, images):
+		import uart_stream
+		try:
+			if self.client is None:
+				self.client = uart_stream.StreamClient(self.port, timeout=self.timeout, framed=self.format)
+			predictions = np.zeros(len(images), dtype=np.uint8)
+			cycles = np.zeros(len(images), dtype=np.uint32)
+			def on_reply(index, reply, latency):
+				predictions[index], cycles[index] = reply
+			stats = self.client.stream(images, self.window, on_reply, self.batch)
+			if stats.count != len(images):
+				raise IOError("%s answered %d of %d images" % (self.name, stats.count, len(images)))
+			return predictions, cycles
+		except Exception:
+			self.retry_t = time.perf_counter() + self.cooldown
+			if self.client is not None:
+				self.client.close()
+				self.client = None
+			raise
+
+	def stop(self):
+		super().stop()
+		if self.client is not None:
+			self.client.close()
+
+
+class Scheduler:
+	"""Least-outstanding-requests balancing over boards with CPU fallback"""
+
+	def __init__(self, boards, cpu=None, chunk=DEFAULT_CHUNK, max_outstanding=DEFAULT_MAX_OUTSTANDING):
+		self.boards = list(boards)
+		self.cpu = cpu
+		self.chunk = chunk
+		self.max_outstanding = max_outstanding
+		self.lock = threading.Lock()
+		for backend in self.backends():
+			backend.on_failure = self.failed
+
+	def backends(self):
+		return self.boards + ([self.cpu] if self.cpu else [])
+
+	def start(self):
+		for backend in self.backends():
+			backend.start()
+		return self
+
+	def stop(self):
+		for backend in self.backends():
+			backend.stop()
+
+	def pick(self, n):
+		"""Backend for a job of n images, called with the lock held"""
+		healthy = [b for b in self.boards if b.healthy()]
+		free = [b for b in healthy if b.outstanding + n <= self.max_outstanding]
+		if free:
+			return min(free, key=lambda b: b.outstanding)
+		if self.cpu:
+			return self.cpu
+		if healthy:
+			return min(healthy, key=lambda b: b.outstanding) # queue on the least loaded board
+		return min(self.boards, key=lambda b: b.retry_t) # none healthy: the one that recovers first
+
+	def dispatch(self, job):
+		with self.lock:
+			backend = self.pick(len(job.images))
+			backend.submit(job)
+
+	def submit(self, images):
+		"""Schedule N images, returns a Future of (predictions, cycles)"""
+		images = np.asarray(images)
+		images = images.reshape(len(images), -1) if images.ndim > 1 else images.reshape(1, -1)
+		request = Request(len(images))
+		for offset in range(0, len(images), self.chunk):
+			self.dispatch(Job(request, offset, images[offset:offset + self.chunk]))
+		return request.future
+
+	def failed(self, backend, job, error):
+		"""A backend could not run a job: retry it on the CPU, or on another board"""
+		job.attempts += 1
+		if backend is not self.cpu and self.cpu:
+			self.cpu.submit(job)
+		elif backend is not self.cpu and job.attempts < len(self.boards):
+			self.dispatch(job)
+		else:
+			job.request.fail(error)
+
+	def summary(self):
+		return "\n".join(backend.summary() for backend in self.backends())
+
+
+class RequestHandler(socketserver.BaseRequestHandler):
+	"""One client connection: images frames in, results frames out (in completion order)"""
+
+	def handle(self):
+		scheduler = self.server.scheduler
+		decoder = protocol.FrameDecoder()
+		write_lock = threading.Lock()
+
+		def reply(seq, future):
+			try:
+				predictions, cycles = future.result()
+			except Exception:
+				predictions, cycles = [], [] # empty results frame: request failed
+			with write_lock:
+				try:
+					self.request.sendall(protocol.encode_results(predictions, cycles, seq))
+				except OSError:
+					pass # client went away
+
+		while True:
+			data = self.request.recv(65536)
+			if not data:
+				break
+			for frame in decoder.feed(data):
+				if frame.type == protocol.TYPE_IMAGES:
+					future = scheduler.submit(protocol.decode_pixels(frame))
+					future.add_done_callback(lambda future, seq=frame.seq: reply(seq, future))
+
+
+class Server(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+	daemon_threads = True
+
+	def __init__(self, path, scheduler):
+		if os.path.exists(path):
+			os.unlink(path)
+		super().__init__(path, RequestHandler)
+		self.scheduler = scheduler
+
+	def server_close(self):
+		super().server_close()
+		if os.path.exists(self.server_address):
+			os.unlink(self.server_address)
+
+
+class DaemonClient:
+	"""Blocking client of the service: infer() sends one images frame and waits for its results"""
+
+	def __init__(self, path=DEFAULT_SOCKET, format=protocol.FMT_UINT8, timeout=30.0):
+		self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+		self.sock.settimeout(timeout)
+		self.sock.connect(path)
+		self.format = format
+		self.decoder = protocol.FrameDecoder()
+		self.seq = 0
+
+	def close(self):
+		self.sock.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def infer(self, images):
+		"""Return (predictions, cycles) for N images, cycles 0 where the CPU answered"""
+		images = np.asarray(images)
+		n = len(images) if images.ndim > 1 else 1
+		seq = self.seq
+		self.seq = (self.seq + 1) & 0xFFFF
+		self.sock.sendall(protocol.encode_images(images, seq, self.format))
+		while True:
+			data = self.sock.recv(65536)
+			if not data:
+				raise ConnectionError("Daemon closed the connection")
+			for frame in self.decoder.feed(data):
+				if frame.type == protocol.TYPE_RESULTS and frame.seq == seq:
+					if frame.count != n:
+						raise RuntimeError("Daemon could not serve the request")
+					return protocol.decode_results(frame)
+
+
+def benchmark(path, count, batch, clients, format=protocol.FMT_UINT8):
+	"""Send count test images from `clients` connections in batches, returns (images/s, accuracy)
+
+	Raises RuntimeError if a client connection fails, the remaining clients stop early.
+	"""
+	import uart_stream
+	pairs = list(uart_stream.test_images(count))
+	count = len(pairs)
+	labels = np.array([label for label, img in pairs])
+	images = np.array([img for label, img in pairs])
+	predictions = np.zeros(count, dtype=np.int64)
+	batches = queue.Queue()
+	for offset in range(0, count, batch):
+		batches.put(offset)
+
+	errors = []
+	def run_client():
+		try:
+			with DaemonClient(path, format) as client:
+				while not errors:
+					try:
+						offset = batches.get_nowait()
+					except queue.Empty:
+						return
+					predictions[offset:offset + batch], _ = client.infer(images[offset:offset + batch])
+		except Exception as e:
+			errors.append(e)
+
+	threads = [threading.Thread(target=run_client) for n in range(clients)]
+	start_t = time.perf_counter()
+	for thread in threads:
+		thread.start()
+	for thread in threads:
+		thread.join()
+	if errors:
+		raise RuntimeError("%d of %d benchmark clients failed, first error: %s" % (len(errors), clients, errors[0]))
+	return count / (time.perf_counter() - start_t), np.mean(predictions == labels)
+
+
+def main():
+	## e.g. python3 nn_daemon.py -ports /dev/ttyUSB1 /dev/ttyUSB3
+	##      python3 nn_daemon.py -emulate 4 -baud 921600 -bench 5000
+	import argparse
+	import nn_engine
+	import uart_stream
+	parser = argparse.ArgumentParser(description='Serve inference from several boards over a local socket')
+	parser.add_argument('-ports', nargs='+', default=[], help='serial ports of boards running the framed protocol')
+	parser.add_argument('-emulate', type=int, default=0, help='add this many emulated boards (board_emulator.FramedBoard)')
+	parser.add_argument('-baud', type=int, default=None, help='emulated baud rate of the emulated boards')
+	parser.add_argument('-socket', default=DEFAULT_SOCKET)
+	parser.add_argument('-framed', choices=sorted(uart_stream.FORMATS), default='uint8', help='pixel format on the serial links')
+	parser.add_argument('-window', type=int, default=32, help='images in flight per board')
+	parser.add_argument('-batch', type=int, default=8, help='images per frame to a board')
+	parser.add_argument('-chunk', type=int, default=DEFAULT_CHUNK, help='images per scheduling unit')
+	parser.add_argument('-max_outstanding', type=int, default=DEFAULT_MAX_OUTSTANDING, help='images queued per board before it counts as busy')
+	parser.add_argument('-timeout', type=float, default=2.0, help='seconds without a reply before a board counts as failed')
+	parser.add_argument('-cooldown', type=float, default=DEFAULT_COOLDOWN_S, help='seconds a failed board is left alone')
+	parser.add_argument('-no_fallback', action='store_true', help='never run on the CPU, wait for a board instead')
+	parser.add_argument('-hpp', default=None, help='matmul.hpp with the weights of the CPU fallback')
+	parser.add_argument('-bench', type=int, default=0, metavar='COUNT', help='send COUNT test images through the socket, print the throughput and exit')
+	parser.add_argument('-clients', type=int, default=4, help='client connections for -bench')
+	parser.add_argument('-bench_batch', type=int, default=64, help='images per request for -bench')
+	args = parser.parse_args()
+
+	if not args.ports and not args.emulate and args.no_fallback:
+		sys.exit("No boards and no CPU fallback")
+	format = uart_stream.FORMATS[args.framed]
+	emulated = []
+	if args.emulate:
+		import board_emulator
+		emulated = [board_emulator.FramedBoard(baud=args.baud).start() for n in range(args.emulate)]
+	ports = [(port, port) for port in args.ports] + [(board.port, 'emulated %d' % n) for n, board in enumerate(emulated)]
+	boards = [BoardBackend(port, format, args.window, args.batch, args.timeout, args.cooldown, name) for port, name in ports]
+	cpu = None if args.no_fallback else CpuBackend(nn_engine.load_weights_hpp(args.hpp))
+	scheduler = Scheduler(boards, cpu, args.chunk, args.max_outstanding).start()
+
+	server = Server(args.socket, scheduler)
+	thread = threading.Thread(target=server.serve_forever, daemon=True)
+	thread.start()
+	print("Serving %d board(s)%s on %s" % (len(boards), '' if cpu is None else ' + CPU fallback', args.socket))
+	try:
+		if args.bench:
+			try:
+				rate, accuracy = benchmark(args.socket, args.bench, args.bench_batch, args.clients, format)
+			except RuntimeError as e:
+				sys.exit(e)
+			print("%d images: %.1f images/s, accuracy %.4f" % (args.bench, rate, accuracy))
+		else:
+			threading.Event().wait()
+	except KeyboardInterrupt:
+		print()
+	finally:
+		server.shutdown()
+		server.server_close()
+		scheduler.stop()
+		for board in emulated:
+			board.stop()
+		print(scheduler.summary())
+
+
+if __name__=="__main__":
+	main()
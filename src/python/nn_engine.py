@@ -0,0 +1,236 @@
+import numpy as np
+import glob
+import hashlib
+import os
+import re
+import struct
+import time
+
+# Lightweight NumPy inference engine for the bias-free dense network trained by
+# mnist_net.py. Loads the exported layer_N_weights.txt files (or the weight arrays
+# in matmul.hpp) and runs batched float32 inference without TensorFlow.
+# Weight files are parsed with shape checks and cached by modification time, so
+# only the first load after an edit pays for parsing the text.
+
+REPO_DIR = os.path.normpath(os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..'))
+DEFAULT_WEIGHTS_DIR = REPO_DIR
+DEFAULT_HPP = os.path.join(REPO_DIR, 'src', 'hls', 'matmul.hpp')
+CACHE_DIR = os.path.join(REPO_DIR, '.cache', 'weights') # parsed weight files, see _cached()
+
+_ROW = re.compile(r'\{([^{}]*)\}')
+_BETWEEN = re.compile(r'[\s,{}]*')
+_parsed = {}
+
+
+def parse_weight_text(text, source='weights'):
+	"""Parse a C initialiser {{a, b, ...}, {...}} into a 2D float32 array
+
+	A single regex split yields the innermost {...} rows and the text between them,
+	all values are then converted in one call. Ragged rows, unbalanced braces, values
+	outside a row and malformed numbers raise ValueError naming source.
+	"""
+	parts = _ROW.split(text)
+	rows, between = parts[1::2], ''.join(parts[0::2])
+	if not rows:
+		raise ValueError("%s: no {...} rows" % source)
+	if not _BETWEEN.fullmatch(between):
+		raise ValueError("%s: values outside the {...} rows" % source)
+	if between.count('{') != between.count('}'):
+		raise ValueError("%s: unbalanced braces" % source)
+	lengths = [row.count(',') + 1 for row in rows]
+	for n, length in enumerate(lengths):
+		if length != lengths[0]:
+			raise ValueError("%s: ragged rows, row %d has %d values, row 1 has %d" % (source, n + 1, length, lengths[0]))
+	try:
+		values = np.array(','.join(rows).split(','), dtype=np.float32)
+	except ValueError as e:
+		raise ValueError("%s: %s" % (source, e)) from None
+	return values.reshape(len(rows), lengths[0])
+
+
+def format_weight_text(weights, fmt=None):
+	"""Format a 2D array as the brace-delimited C initialiser written by mnist_net.py"""
+	fmt = fmt or (lambda v: str(v))
+	rows = ['{' + ', '.join(fmt(v) for v in row) + '}' for row in weights]
+	return '{' + ', \n'.join(rows) + '}'
+
+
+def hpp_layer_sizes(hpp_path=None):
+	"""[n_inputs, n_layer1, n_layer2, ...] from the #defines of matmul.hpp"""
+	with open(hpp_path or DEFAULT_HPP) as file:
+		return _define_sizes(file.read(), hpp_path or DEFAULT_HPP)
+
+
+def _define_sizes(text, source):
+	defines = dict(re.findall(r'#define\s+(n_inputs|n_layer\d+)\s+(\d+)', text))
+	if 'n_inputs' not in defines:
+		raise ValueError("No #define n_inputs in " + source)
+	sizes = [int(defines['n_inputs'])]
+	while 'n_layer%d' % len(sizes) in defines:
+		sizes.append(int(defines['n_layer%d' % len(sizes)]))
+	return sizes
+
+
+def check_shapes(weights, sizes, source='weights'):
+	"""Raise ValueError unless weights are [n_inputs x n_layer1, n_layer1 x n_layer2, ...] of sizes"""
+	expected = list(zip(sizes, sizes[1:]))
+	if len(weights) != len(expected):
+		raise ValueError("%s: %d layers, the header declares %d" % (source, len(weights), len(expected)))
+	for n, (w, shape) in enumerate(zip(weights, expected)):
+		if w.shape != shape:
+			raise ValueError("%s: layer %d is %dx%d, the header declares %dx%d" % ((source, n + 1) + w.shape + shape))
+
+
+def _cached(path, parse, cache=True):
+	"""parse(text) of the file at path, cached in memory and as .nnw in CACHE_DIR by mtime and size
+
+	Repeated loads in one process and later runs of any tool reuse the parsed arrays
+	until the file changes. A new cache file is read back and must equal the parsed
+	arrays exactly. The disk cache is best effort (read-only checkouts still work).
+	"""
+	if not cache:
+		with open(path) as file:
+			return parse(file.read())
+	import weight_export # imports this module, so not at the top
+	key = os.path.abspath(path)
+	st = os.stat(key)
+	stamp = (st.st_mtime_ns, st.st_size)
+	hit = _parsed.get(key)
+	if hit is not None and hit[0] == stamp:
+		return [w.copy() for w in hit[1]]
+	name = hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+	cache_file = os.path.join(CACHE_DIR, '%s-%d-%d.nnw' % ((name,) + stamp))
+	weights = None
+	if os.path.exists(cache_file):
+		try:
+			weights = weight_export.read_weights_bin(cache_file)
+		except (OSError, ValueError, struct.error):
+			pass
+	if weights is None:
+		with open(key) as file:
+			weights = parse(file.read())
+		try:
+			os.makedirs(CACHE_DIR, exist_ok=True)
+			for stale in glob.glob(os.path.join(CACHE_DIR, name + '-*.nnw')):
+				os.remove(stale)
+			tmp = '%s.%d.tmp' % (cache_file, os.getpid())
+			weight_export.write_weights_bin(tmp, weights)
+			if not all(np.array_equal(a, b) for a, b in zip(weight_export.read_weights_bin(tmp), weights)):
+				os.remove(tmp)
+				raise ValueError("%s: the .nnw round trip of the parsed weights differs" % path)
+			os.replace(tmp, cache_file)
+		except OSError:
+			pass
+	_parsed[key] = (stamp, weights)
+	return [w.copy() for w in weights]
+
+
+def load_weights_txt(weights_dir=None, hpp_path=None, cache=True):
+	"""Load layer_1_weights.txt, layer_2_weights.txt, ... in layer order
+
+	With hpp_path the shapes are checked against the n_inputs/n_layerN #defines of that header.
+	"""
+	weights_dir = weights_dir or DEFAULT_WEIGHTS_DIR
+	weights = []
+	w = 1
+	while os.path.exists(os.path.join(weights_dir, "layer_" + str(w) + "_weights.txt")):
+		filename = os.path.join(weights_dir, "layer_" + str(w) + "_weights.txt")
+		weights += _cached(filename, lambda text: [parse_weight_text(text, filename)], cache)
+		w += 1
+	if not weights:
+		raise FileNotFoundError("No layer_N_weights.txt files in " + weights_dir)
+	if hpp_path:
+		check_shapes(weights, hpp_layer_sizes(hpp_path), weights_dir)
+	return weights
+
+
+def _parse_hpp(text, source):
+	arrays = {}
+	for m in re.finditer(r'layer(\d+)_weights\s*\[\w+\]\s*\[\w+\]\s*=\s*(\{.*?\})\s*;', text, re.S):
+		arrays[int(m.group(1))] = parse_weight_text(m.group(2), "%s layer%s_weights" % (source, m.group(1)))
+	if not arrays:
+		raise ValueError("No layerN_weights arrays found in " + source)
+	if sorted(arrays) != list(range(1, len(arrays) + 1)):
+		raise ValueError("%s: layerN_weights arrays %s are not numbered 1..N" % (source, sorted(arrays)))
+	weights = [arrays[n] for n in sorted(arrays)]
+	check_shapes(weights, _define_sizes(text, source), source)
+	return weights
+
+
+def load_weights_hpp(hpp_path=None, cache=True):
+	"""Load the layerN_weights arrays from the weights namespace in matmul.hpp, checked against its #defines"""
+	hpp_path = hpp_path or DEFAULT_HPP
+	return _cached(hpp_path, lambda text: _parse_hpp(text, hpp_path), cache)
+
+
+def softmax(logits):
+	"""Row-wise softmax of an NxK array"""
+	e = np.exp(logits - logits.max(axis=1, keepdims=True))
+	return e / e.sum(axis=1, keepdims=True)
+
+
+class NNEngine:
+	"""Dense network with ReLU hidden layers and a softmax/argmax output layer"""
+
+	def __init__(self, weights):
+		self.weights = [np.ascontiguousarray(w, dtype=np.float32) for w in weights]
+		for a, b in zip(self.weights, self.weights[1:]):
+			if a.shape[1] != b.shape[0]:
+				raise ValueError("Layer shapes do not chain: %s -> %s" % (a.shape, b.shape))
+		self.n_inputs = self.weights[0].shape[0]
+		self.n_outputs = self.weights[-1].shape[1]
+
+	@classmethod
+	def from_txt(cls, weights_dir=None):
+		return cls(load_weights_txt(weights_dir))
+
+	@classmethod
+	def from_hpp(cls, hpp_path=None):
+		return cls(load_weights_hpp(hpp_path))
+
+	def layer_sizes(self):
+		"""Return [n_inputs, n_layer1, n_layer2, ...]"""
+		return [self.n_inputs] + [w.shape[1] for w in self.weights]
+
+	def forward(self, images):
+		"""Return the output layer pre-activations (logits) for N images"""
+		x = np.asarray(images, dtype=np.float32).reshape(-1, self.n_inputs)
+		for w in self.weights[:-1]:
+			x = np.maximum(x @ w, 0) # ReLU
+		return x @ self.weights[-1]
+
+	def predict_proba(self, images):
+		"""Return Nx10 softmax scores"""
+		return softmax(self.forward(images))
+
+	def predict(self, images):
+		"""Return the predicted digit for each image"""
+		return np.argmax(self.forward(images), axis=1)
+
+
+def main():
+	## Evaluate the exported weights on the test set, e.g. python3 nn_engine.py -hpp
+	import argparse
+	import dataset
+	parser = argparse.ArgumentParser(description='Run the exported network with NumPy on the MNIST test set')
+	parser.add_argument('-weights_dir', default=None, help='directory with layer_N_weights.txt files')
+	parser.add_argument('-hpp', nargs='?', const=DEFAULT_HPP, default=None, help='load weights from matmul.hpp instead')
+	parser.add_argument('-dataset_dir', default=None)
+	parser.add_argument('-dims', type=int, nargs=2, default=[10, 10])
+	args = parser.parse_args()
+
+	engine = NNEngine.from_hpp(args.hpp) if args.hpp else NNEngine.from_txt(args.weights_dir)
+	print("Layer sizes: ", engine.layer_sizes())
+
+	test_images, test_labels = dataset.load_dataset('testing', args.dims, dataset_dir=args.dataset_dir)
+	test_images = dataset.normalize(test_images)
+
+	start_t = time.time()
+	pred = engine.predict(test_images)
+	totalt_t = time.time() - start_t
+	print("Inference time for ", len(test_images), " test images: ", totalt_t, " seconds")
+	print("test acc: ", np.mean(pred == test_labels))
+
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,159 @@
+import numpy as np
+import binascii
+import collections
+import struct
+import sys
+
+# Framed host <-> board protocol (reference C implementation in src/vitis/nn_protocol.c).
+#
+# Frame layout, little-endian:
+#   sync     2 bytes  0xA5 0x5A
+#   version  uint8    PROTOCOL_VERSION
+#   type     uint8    TYPE_IMAGES (host -> board) or TYPE_RESULTS (board -> host)
+#   seq      uint16   sequence number, echoed in the results frame
+#   count    uint16   number of images in the batch
+#   format   uint8    pixel format of an images frame, 0 in a results frame
+#   n_inputs uint16   pixels per image, 0 in a results frame
+#   payload           images: count * n_inputs pixels
+#                     results: count * (uint8 prediction, uint32 cycles)
+#   crc      uint16   CRC-16/CCITT-FALSE over version..payload
+#
+# A corrupted or dropped byte only costs the frame it hit: the decoder rejects the
+# CRC and resynchronises on the next sync word.
+
+SYNC = b'\xa5\x5a'
+PROTOCOL_VERSION = 1
+TYPE_IMAGES = 0x01
+TYPE_RESULTS = 0x81
+
+FMT_UINT8 = 0	# pixel * 255, board divides by 255
+FMT_Q15 = 1		# pixel * 2^15 as uint16
+FMT_FLOAT32 = 2	# raw float32, like the original link
+PIXEL_DTYPES = {FMT_UINT8: np.dtype('u1'), FMT_Q15: np.dtype('<u2'), FMT_FLOAT32: np.dtype('<f4')}
+PIXEL_SCALE = {FMT_UINT8: 255.0, FMT_Q15: 32768.0, FMT_FLOAT32: 1.0}
+
+HEADER = struct.Struct('<BBHHBH')
+RESULT_DTYPE = np.dtype([('prediction', 'u1'), ('cycles', '<u4')])
+CRC_SIZE = 2
+MAX_PAYLOAD = 1 << 20
+
+Frame = collections.namedtuple('Frame', 'type seq count format n_inputs payload')
+
+
+def crc16(data):
+	"""CRC-16/CCITT-FALSE (poly 0x1021, init 0xFFFF)"""
+	return binascii.crc_hqx(data, 0xFFFF)
+
+
+def payload_size(type, count, format, n_inputs):
+	if type == TYPE_IMAGES:
+		return count * n_inputs * PIXEL_DTYPES[format].itemsize
+	return count * RESULT_DTYPE.itemsize
+
+
+def _frame(type, seq, count, format, n_inputs, payload):
+	body = HEADER.pack(PROTOCOL_VERSION, type, seq & 0xFFFF, count, format, n_inputs) + payload
+	return SYNC + body + struct.pack('<H', crc16(body))
+
+
+def encode_images(images, seq=0, format=FMT_UINT8):
+	"""Return one frame carrying a batch of images (N x n_inputs, floats 0 - 1 or uint8)"""
+	images = np.asarray(images)
+	images = images.reshape(len(images), -1) if images.ndim > 1 else images.reshape(1, -1)
+	if format == FMT_UINT8 and images.dtype == np.uint8:
+		pixels = images
+	elif format == FMT_FLOAT32:
+		pixels = images.astype('<f4')
+	else:
+		if images.dtype == np.uint8:
+			images = images / 255.0
+		scale = PIXEL_SCALE[format]
+		pixels = np.clip(np.rint(images * scale), 0, np.iinfo(PIXEL_DTYPES[format]).max).astype(PIXEL_DTYPES[format])
+	return _frame(TYPE_IMAGES, seq, len(pixels), format, pixels.shape[1], pixels.tobytes())
+
+
+def encode_results(predictions, cycles, seq=0):
+	"""Return a results frame with one (prediction, cycles) entry per image"""
+	results = np.zeros(len(predictions), dtype=RESULT_DTYPE)
+	results['prediction'] = predictions
+	results['cycles'] = cycles
+	return _frame(TYPE_RESULTS, seq, len(results), 0, 0, results.tobytes())
+
+
+def decode_pixels(frame):
+	"""Return the images of an images frame as float32 N x n_inputs in 0 - 1"""
+	pixels = np.frombuffer(frame.payload, dtype=PIXEL_DTYPES[frame.format]).reshape(frame.count, frame.n_inputs)
+	if frame.format == FMT_FLOAT32:
+		return pixels
+	return pixels.astype(np.float32) / np.float32(PIXEL_SCALE[frame.format])
+
+
+def decode_results(frame):
+	"""Return (predictions, cycles) arrays of a results frame"""
+	results = np.frombuffer(frame.payload, dtype=RESULT_DTYPE)
+	return results['prediction'], results['cycles']
+
+
+class FrameDecoder:
+	"""Incremental decoder: feed() raw bytes, get back every complete, CRC-checked frame"""
+
+	def __init__(self):
+		self.buf = bytearray()
+		self.crc_errors = 0
+		self.dropped_bytes = 0
+
+	def feed(self, data):
+		self.buf += data
+		frames = []
+		while True:
+			start = self.buf.find(SYNC)
+			if start < 0:
+				keep = 1 if self.buf[-1:] == SYNC[:1] else 0 # sync word may be split across reads
+				self.dropped_bytes += len(self.buf) - keep
+				del self.buf[:len(self.buf) - keep]
+				return frames
+			if start:
+				self.dropped_bytes += start
+				del self.buf[:start]
+			if len(self.buf) < len(SYNC) + HEADER.size:
+				return frames
+			version, type, seq, count, format, n_inputs = HEADER.unpack_from(self.buf, len(SYNC))
+			if version != PROTOCOL_VERSION or type not in (TYPE_IMAGES, TYPE_RESULTS) or \
+					(type == TYPE_IMAGES and format not in PIXEL_DTYPES):
+				self._skip()
+				continue
+			size = payload_size(type, count, format, n_inputs)
+			if size > MAX_PAYLOAD:
+				self._skip()
+				continue
+			end = len(SYNC) + HEADER.size + size + CRC_SIZE
+			if len(self.buf) < end:
+				return frames
+			body = bytes(self.buf[len(SYNC):end - CRC_SIZE])
+			crc, = struct.unpack_from('<H', self.buf, end - CRC_SIZE)
+			if crc != crc16(body):
+				self.crc_errors += 1
+				self._skip()
+				continue
+			frames.append(Frame(type, seq, count, format, n_inputs, body[HEADER.size:]))
+			del self.buf[:end]
+
+	def _skip(self):
+		"""Drop the current sync word and look for the next one"""
+		self.dropped_bytes += 1
+		del self.buf[:1]
+
+
+def main():
+	## Print the wire size of one image per pixel format, e.g. python3 protocol.py 100
+	n_inputs = int(sys.argv[1]) if len(sys.argv) > 1 else 100
+	img = np.zeros((1, n_inputs), dtype=np.float32)
+	raw = n_inputs * 4
+	print("Raw float32 image (helloworld.c): %d bytes" % raw)
+	for name, format in (('uint8', FMT_UINT8), ('q15', FMT_Q15), ('float32', FMT_FLOAT32)):
+		size = len(encode_images(img, format=format))
+		print("Framed %-7s image: %4d bytes, %.1f images/s at 115200 baud" % (name, size, 11520.0 / size))
+
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,267 @@
+import numpy as np
+import os
+import sys
+import time
+import hls_estimate
+import nn_engine
+import weight_export
+
+# Magnitude pruning of the dense layers and sparse (CSC) weight export.
+#
+# Each layer keeps its largest-magnitude weights and zeroes the rest to reach the
+# target sparsity. With TensorFlow available the network is then fine-tuned for a
+# few epochs while the sparsity ramps up (polynomial schedule) and the mask is
+# re-applied after every batch, so pruned weights stay zero.
+#
+# The survivors are stored per output column (CSC), which is the order a
+# sparsity-aware hwmm_layerN would consume them in: output j accumulates
+# values[colptr[j]:colptr[j+1]] * input[rowidx[...]], so its fadd chain is only
+# as long as the column's non-zero count.
+
+SPARSE_HPP = 'matmul_sparse.hpp'
+
+
+class CSCMatrix:
+	"""Compressed sparse column weights of one layer (n_in x n_out)"""
+
+	def __init__(self, colptr, rowidx, values, shape):
+		self.colptr = np.asarray(colptr, dtype=np.int32)
+		self.rowidx = np.asarray(rowidx, dtype=np.int32)
+		self.values = np.asarray(values, dtype=np.float32)
+		self.shape = tuple(shape)
+
+	@classmethod
+	def from_dense(cls, weights):
+		weights = np.asarray(weights, dtype=np.float32)
+		cols = weights.T # column j of the layer is row j of the transpose
+		mask = cols != 0
+		colptr = np.concatenate([[0], np.cumsum(mask.sum(axis=1))])
+		rowidx = np.nonzero(mask)[1] # row-major nonzero of the transpose: grouped by column, rows ascending
+		return cls(colptr, rowidx, cols[mask], weights.shape)
+
+	@property
+	def nnz(self):
+		return len(self.values)
+
+	def column_nnz(self):
+		return np.diff(self.colptr)
+
+	def to_dense(self):
+		dense = np.zeros(self.shape, dtype=np.float32)
+		cols = np.repeat(np.arange(self.shape[1]), self.column_nnz())
+		dense[self.rowidx, cols] = self.values
+		return dense
+
+	def matmul(self, x):
+		"""x (N x n_in) times this matrix, summing each column's products in rowidx order"""
+		out = np.zeros((x.shape[0], self.shape[1]), dtype=np.float32)
+		if not self.nnz:
+			return out
+		products = x[:, self.rowidx] * self.values
+		nonempty = np.flatnonzero(self.column_nnz())
+		out[:, nonempty] = np.add.reduceat(products, self.colptr[nonempty], axis=1)
+		return out
+
+
+class SparseEngine:
+	"""NumPy reference of the pruned network computed from the CSC weights only"""
+
+	def __init__(self, layers):
+		self.layers = layers
+		self.n_inputs = layers[0].shape[0]
+
+	@classmethod
+	def from_dense(cls, weights):
+		return cls([CSCMatrix.from_dense(w) for w in weights])
+
+	def forward(self, images):
+		x = np.asarray(images, dtype=np.float32).reshape(-1, self.n_inputs)
+		for layer in self.layers[:-1]:
+			x = np.maximum(layer.matmul(x), 0) # ReLU
+		return self.layers[-1].matmul(x)
+
+	def predict(self, images):
+		return np.argmax(self.forward(images), axis=1)
+
+	def macs(self):
+		return sum(layer.nnz for layer in self.layers)
+
+
+def prune_mask(weights, sparsity):
+	"""Keep-mask zeroing the `sparsity` fraction of smallest-magnitude weights of one layer"""
+	n_prune = int(round(sparsity * weights.size))
+	if n_prune <= 0:
+		return np.ones(weights.shape, dtype=bool)
+	order = np.argsort(np.abs(weights), axis=None, kind='stable')
+	mask = np.ones(weights.size, dtype=bool)
+	mask[order[:n_prune]] = False
+	return mask.reshape(weights.shape)
+
+
+def prune(weights, sparsity):
+	"""One-shot magnitude pruning, sparsity is one fraction or one per layer"""
+	sparsity = np.broadcast_to(sparsity, len(weights))
+	return [np.where(prune_mask(w, s), w, 0).astype(np.float32) for w, s in zip(weights, sparsity)]
+
+
+def polynomial_sparsity(target, step, steps, power=3):
+	"""Sparsity at fine-tune step `step` of `steps`, ramping from 0 to target"""
+	progress = min(1.0, (step + 1) / float(steps))
+	return target * (1.0 - (1.0 - progress) ** power)
+
+
+def fine_tune(weights, sparsity, epochs=5, batch_size=2000, dataset_dir=None):
+	"""Prune gradually while retraining with Keras, returns the pruned weights"""
+	os.environ['CUDA_VISIBLE_DEVICES'] = '-1'
+	import tensorflow as tf
+	import dataset
+	import mnist_net
+	n_inputs = weights[0].shape[0]
+	side = int(round(np.sqrt(n_inputs)))
+	dims = (side, side)
+	images, labels = dataset.load_dataset('training', dims, dataset_dir=dataset_dir)
+	images = dataset.normalize(images)
+
+	model = mnist_net.build_model(dims, [w.shape[1] for w in weights[:-1]], weights[-1].shape[1])
+	model.set_weights(weights)
+	dense = model.layers[1:]
+	sparsity = np.broadcast_to(sparsity, len(weights))
+	steps = max(1, epochs * -(-len(images) // batch_size) // 2) # reach the target half way, then fine-tune at it
+	masks = [np.ones(w.shape, dtype=bool) for w in weights]
+
+	class Prune(tf.keras.callbacks.Callback):
+		step = 0
+
+		def on_train_batch_begin(self, batch, logs=None):
+			## Recompute the masks on the ramp, from the current magnitudes
+			if self.step < steps:
+				for n, layer in enumerate(dense):
+					w = layer.get_weights()[0]
+					masks[n] = prune_mask(w, polynomial_sparsity(sparsity[n], self.step, steps))
+			self.step += 1
+
+		def on_train_batch_end(self, batch, logs=None):
+			for layer, mask in zip(dense, masks):
+				layer.set_weights([layer.get_weights()[0] * mask])
+
+	model.fit(images, labels, epochs=epochs, batch_size=batch_size, callbacks=[Prune()], verbose=2)
+	return prune([layer.get_weights()[0] for layer in dense], sparsity)
+
+
+def sparse_cycles(layers, sizes):
+	"""hls_estimate latency of a sparse kernel computing one column at a time
+
+	Each output needs colnnz back-to-back fadds instead of n_in, the activations
+	are unchanged.
+	"""
+	cycles = 0
+	for n, layer in enumerate(layers):
+		cycles += int(np.sum(layer.column_nnz() * hls_estimate.FADD_LATENCY + hls_estimate.FMUL_LATENCY + 1))
+		cycles += hls_estimate.relu_cycles(sizes[n + 1]) if n < len(layers) - 1 else hls_estimate.argmax_cycles(sizes[n + 1])
+	return cycles
+
+
+def save_csc(filename, layers):
+	"""Write every layer's colptr/rowidx/values/shape to one .npz"""
+	arrays = {}
+	for n, layer in enumerate(layers, 1):
+		arrays['layer%d_colptr' % n] = layer.colptr
+		arrays['layer%d_rowidx' % n] = layer.rowidx
+		arrays['layer%d_values' % n] = layer.values
+		arrays['layer%d_shape' % n] = np.asarray(layer.shape)
+	np.savez(filename, **arrays)
+
+
+def load_csc(filename):
+	data = np.load(filename)
+	layers = []
+	n = 1
+	while 'layer%d_colptr' % n in data:
+		layers.append(CSCMatrix(data['layer%d_colptr' % n], data['layer%d_rowidx' % n], data['layer%d_values' % n], data['layer%d_shape' % n]))
+		n += 1
+	return layers
+
+
+def _c_array(values, fmt=str):
+	return '{' + ', '.join(fmt(v) for v in values) + '}'
+
+
+def sparse_hpp_text(layers):
+	"""matmul_sparse.hpp: CSC arrays for a column-sparse hwmm_layerN, sizes from the layers"""
+	sizes = [layers[0].shape[0]] + [layer.shape[1] for layer in layers]
+	lines = ['#include "ap_int.h"', '', '#define n_inputs %d' % sizes[0]]
+	lines += ['#define n_layer%d %d' % (n, size) for n, size in enumerate(sizes[1:], 1)]
+	lines += ['#define nnz_layer%d %d' % (n, layer.nnz) for n, layer in enumerate(layers, 1)]
+	lines += ['', '// output j of layer N: sum of values[i] * input[rowidx[i]] for colptr[j] <= i < colptr[j+1]', 'namespace sparse_weights{', '']
+	for n, layer in enumerate(layers, 1):
+		index_type = 'unsigned char' if layer.shape[0] <= 256 else 'unsigned short'
+		lines.append('\tconst unsigned short layer%d_colptr[n_layer%d + 1] = %s;' % (n, n, _c_array(layer.colptr)))
+		lines.append('\tconst %s layer%d_rowidx[nnz_layer%d] = %s;' % (index_type, n, n, _c_array(layer.rowidx)))
+		lines.append('\tconst float layer%d_values[nnz_layer%d] = %s;' % (n, n, _c_array(layer.values)))
+		lines.append('')
+	lines.append('}')
+	return '\n'.join(lines) + '\n'
+
+
+def report(dense_weights, pruned, images, labels):
+	"""Print MACs, accuracy and estimated cycles of the dense and the pruned network"""
+	dense = nn_engine.NNEngine(dense_weights)
+	sparse = SparseEngine.from_dense(pruned)
+	sizes = dense.layer_sizes()
+	dense_macs = sum(w.size for w in dense_weights)
+	dense_acc = np.mean(dense.predict(images) == labels)
+	start_t = time.time()
+	sparse_acc = np.mean(sparse.predict(images) == labels)
+	sparse_t = time.time() - start_t
+
+	print("\n%-8s %10s %10s %9s" % ('layer', 'dense MAC', 'sparse MAC', 'sparsity'))
+	for n, (w, layer) in enumerate(zip(dense_weights, sparse.layers), 1):
+		print("%-8s %10d %10d %8.1f%%" % ('layer%d' % n, w.size, layer.nnz, 100.0 * (1 - layer.nnz / float(w.size))))
+	print("%-8s %10d %10d   -%.1f%% MACs" % ('total', dense_macs, sparse.macs(), 100.0 * (1 - sparse.macs() / float(dense_macs))))
+	print("\nTest accuracy: dense %.4f  pruned %.4f  (%+.4f), sparse engine %.2f s for %d images"
+		% (dense_acc, sparse_acc, sparse_acc - dense_acc, sparse_t, len(images)))
+	dense_cycles = hls_estimate.nn_inference_cycles(sizes, {n: 1 for n in range(1, len(sizes))})
+	cycles = sparse_cycles(sparse.layers, sizes)
+	print("Estimated cycles, one column at a time: dense %d  sparse %d  (%.1fx)" % (dense_cycles, cycles, dense_cycles / float(cycles)))
+	return sparse
+
+
+def main():
+	## e.g. python3 prune.py -sparsity 0.8 -finetune_epochs 5   (needs TensorFlow)
+	##      python3 prune.py -sparsity 0.5 0.5 0.2 -finetune_epochs 0
+	import argparse
+	import dataset
+	parser = argparse.ArgumentParser(description='Magnitude-prune the network and export the survivors as CSC')
+	parser.add_argument('-sparsity', type=float, nargs='+', default=[0.8], help='target fraction of zero weights, one value or one per layer')
+	parser.add_argument('-finetune_epochs', type=int, default=5, help='0 = one-shot pruning without TensorFlow')
+	parser.add_argument('-weights_dir', default=None, help='directory with layer_N_weights.txt files')
+	parser.add_argument('-hpp', nargs='?', const=nn_engine.DEFAULT_HPP, default=None, help='take the weights from matmul.hpp instead')
+	parser.add_argument('-dataset_dir', default=None)
+	parser.add_argument('-out_dir', default='.')
+	args = parser.parse_args()
+
+	weights = nn_engine.load_weights_hpp(args.hpp) if args.hpp else nn_engine.load_weights_txt(args.weights_dir)
+	if len(args.sparsity) not in (1, len(weights)):
+		sys.exit("Give one -sparsity or one per layer (%d)" % len(weights))
+	sparsity = args.sparsity[0] if len(args.sparsity) == 1 else args.sparsity
+
+	if args.finetune_epochs > 0:
+		pruned = fine_tune(weights, sparsity, args.finetune_epochs, dataset_dir=args.dataset_dir)
+	else:
+		pruned = prune(weights, sparsity)
+
+	n_inputs = weights[0].shape[0]
+	side = int(round(np.sqrt(n_inputs)))
+	images, labels = dataset.load_dataset('testing', (side, side), dataset_dir=args.dataset_dir)
+	sparse = report(weights, pruned, dataset.normalize(images), labels)
+
+	os.makedirs(args.out_dir, exist_ok=True)
+	save_csc(os.path.join(args.out_dir, 'weights_sparse.npz'), sparse.layers)
+	weight_export.write_weights_bin(os.path.join(args.out_dir, 'weights_pruned.nnw'), pruned)
+	with open(os.path.join(args.out_dir, SPARSE_HPP), 'w') as file:
+		file.write(sparse_hpp_text(sparse.layers))
+	print("\nWrote weights_sparse.npz, weights_pruned.nnw (dense, for weight_export.py -bin) and", SPARSE_HPP, "to", args.out_dir)
+
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,247 @@
+import numpy as np
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+import nn_engine
+import weight_export
+
+# Post-training fixed-point quantization of the dense network.
+# Weights and pixels are converted to ap_fixed<W,I,AP_RND,AP_SAT> (W total bits,
+# I integer bits incl. sign, F = W - I fractional bits). The simulator keeps the
+# raw integers, accumulates each dot product exactly in a wide acc_t and converts
+# every layer output back to data_t with the same rounding and saturation.
+# With a calibration file from calibrate.py every layer gets its own weights,
+# output and accumulator format instead of one data_t for everything, and the
+# exported header declares every layer with its own types.
+
+
+def frac_bits(W, I):
+	return W - I
+
+
+def to_fixed(values, W, I):
+	"""Quantize to raw ap_fixed<W,I,AP_RND,AP_SAT> integers (value = raw * 2^-F)"""
+	F = frac_bits(W, I)
+	raw = np.floor(np.asarray(values, dtype=np.float64) * (2.0 ** F) + 0.5) # AP_RND: round half up
+	return np.clip(raw, -2 ** (W - 1), 2 ** (W - 1) - 1).astype(np.int64) # AP_SAT
+
+
+def from_fixed(raw, W, I):
+	"""Convert raw ap_fixed<W,I> integers back to float"""
+	return np.asarray(raw, dtype=np.float64) * (2.0 ** -frac_bits(W, I))
+
+
+def requantize(acc, W, I, acc_frac=None):
+	"""acc_t (acc_frac fractional bits, default 2F) -> data_t (F fractional bits) with AP_RND and AP_SAT"""
+	F = frac_bits(W, I)
+	shift = (2 * F if acc_frac is None else acc_frac) - F
+	if shift > 0:
+		acc = (acc + (1 << (shift - 1))) >> shift
+	elif shift < 0:
+		acc = acc << -shift
+	return np.clip(acc, -2 ** (W - 1), 2 ** (W - 1) - 1)
+
+
+def acc_bits(W, fan_in):
+	"""Accumulator width that holds a sum of fan_in full W x W products without overflow"""
+	return 2 * W + int(np.ceil(np.log2(fan_in)))
+
+
+def mac_width(weights, W):
+	"""Estimated MAC (accumulator) width for the widest layer"""
+	return max(acc_bits(W, w.shape[0]) for w in weights)
+
+
+class FixedPointEngine:
+	"""Integer simulation of the network with ap_fixed<W,I> weights and activations
+
+	formats: optional per-layer [((W, I) of the weights, (W, I) of the output)], the
+	pixels then use ap_fixed<W,I> of the constructor arguments
+	"""
+
+	def __init__(self, weights, W, I, formats=None):
+		self.W = W
+		self.I = I
+		self.formats = formats or [((W, I), (W, I))] * len(weights)
+		if max(max(wf[0], of[0]) for wf, of in self.formats + [((W, I), (W, I))]) > 24:
+			raise ValueError("W > 24 would overflow the int64 accumulator simulation")
+		self.weights = [to_fixed(w, *wf) for w, (wf, of) in zip(weights, self.formats)]
+
+	def forward(self, images):
+		"""Return raw data_t integers of the output layer for N images"""
+		x = to_fixed(np.asarray(images).reshape(-1, self.weights[0].shape[0]), self.W, self.I)
+		x_frac = frac_bits(self.W, self.I)
+		for n, (w, (wf, of)) in enumerate(zip(self.weights, self.formats)):
+			x = requantize(x @ w, *of, acc_frac=x_frac + frac_bits(*wf))
+			x_frac = frac_bits(*of)
+			if n < len(self.weights) - 1:
+				x = np.maximum(x, 0) # ReLU
+		return x
+
+	def predict(self, images):
+		return np.argmax(self.forward(images), axis=1)
+
+
+def load_keras_weights(model_path):
+	"""Return the kernel of every Dense layer in a model saved by mnist_net.py"""
+	import tensorflow as tf
+	model = tf.keras.models.load_model(model_path)
+	return [layer.get_weights()[0] for layer in model.layers if layer.get_weights()]
+
+
+def write_int_weights(weights, formats, out_dir):
+	"""Write raw integer weights as layer_N_weights_W_I.txt in mnist_net.py's brace format, one (W, I) per layer"""
+	for n, (w, (W, I)) in enumerate(zip(weights, formats)):
+		filename = os.path.join(out_dir, "layer_%d_weights_%d_%d.txt" % (n + 1, W, I))
+		with open(filename, 'w') as file:
+			file.write(nn_engine.format_weight_text(to_fixed(w, W, I)))
+
+
+def _c_decimal(value):
+	"""Shortest decimal that reads back as the same double, exact for ap_fixed values"""
+	return repr(float(value))
+
+
+def write_hpp(weights, W, I, filename):
+	"""Write a matmul.hpp variant declaring data_t/acc_t and ap_fixed weight arrays
+
+	Weight values are written as the exact decimal of each fixed-point value, so the
+	ap_fixed constructor reproduces the raw integers. matmul.cpp must use data_t for
+	its arrays and acc_t for the running sums to match this header.
+	"""
+	acc_w = mac_width(weights, W)
+	acc_i = acc_w - 2 * frac_bits(W, I)
+	typedefs = ['typedef ap_fixed<%d,%d,AP_RND,AP_SAT> data_t;\t// weights, pixels and activations' % (W, I),
+		'typedef ap_fixed<%d,%d> acc_t;\t\t\t// exact multiply-accumulate' % (acc_w, acc_i)]
+	values = [from_fixed(to_fixed(w, W, I), W, I) for w in weights]
+	with open(filename, 'w') as file:
+		file.write(weight_export.hpp_text(values, 'data_t', ('#include "ap_fixed.h"',), typedefs, fmt=_c_decimal))
+
+
+## Sweep workers share the test set through the pool initializer
+_sweep_data = {}
+
+def _init_sweep(weights, images, labels):
+	_sweep_data['weights'] = weights
+	_sweep_data['images'] = images
+	_sweep_data['labels'] = labels
+
+
+def _eval_config(config):
+	W, I = config
+	engine = FixedPointEngine(_sweep_data['weights'], W, I)
+	acc = np.mean(engine.predict(_sweep_data['images']) == _sweep_data['labels'])
+	return W, I, acc, mac_width(_sweep_data['weights'], W)
+
+
+def sweep(weights, images, labels, word_bits, int_bits, workers=None):
+	"""Evaluate every (W, I) configuration in parallel, returns list of (W, I, acc, mac_width)"""
+	configs = [(W, I) for W in word_bits for I in int_bits if 0 < I <= W]
+	with ProcessPoolExecutor(max_workers=workers, initializer=_init_sweep, initargs=(weights, images, labels)) as pool:
+		return list(pool.map(_eval_config, configs))
+
+
+def cheapest(results, baseline_acc, tolerance):
+	"""Smallest MAC width (then W) whose accuracy is within tolerance of the float baseline"""
+	ok = [r for r in results if r[2] >= baseline_acc - tolerance]
+	return min(ok, key=lambda r: (r[3], r[0], r[1])) if ok else None
+
+
+def write_calibrated_hpp(weights, input_format, formats, accs, filename):
+	"""Write a matmul.hpp variant with the per-layer ap_fixed types of a calibrate.py file
+
+	input_t holds the pixels, layerN_weights_t and layerN_output_t the weights and
+	outputs of layer N, and the declarations and weight arrays use them. hwmm_layerN
+	in matmul.cpp must keep its running sum in layerN_acc_t to match FixedPointEngine
+	with these formats.
+	"""
+	typedefs = ['typedef ap_fixed<%d,%d,AP_RND,AP_SAT> input_t;' % input_format]
+	for n, ((wf, of), acc) in enumerate(zip(formats, accs), 1):
+		typedefs += ['typedef ap_fixed<%d,%d,AP_RND,AP_SAT> layer%d_weights_t;' % (wf + (n,)),
+			'typedef ap_fixed<%d,%d,AP_RND,AP_SAT> layer%d_output_t;' % (of + (n,)),
+			'typedef ap_fixed<%d,%d> layer%d_acc_t;' % (acc + (n,))]
+	values = [from_fixed(to_fixed(w, *wf), *wf) for w, (wf, of) in zip(weights, formats)]
+	layer_types = [('layer%d_weights_t' % n, 'layer%d_output_t' % n) for n in range(1, len(weights) + 1)]
+	with open(filename, 'w') as file:
+		file.write(weight_export.hpp_text(values, preamble=('#include "ap_fixed.h"',), typedefs=typedefs, fmt=_c_decimal,
+			input_type='input_t', layer_types=layer_types))
+
+
+def main():
+	## Sweep fixed-point formats and export the chosen one (-export alone: the cheapest), e.g.
+	## python3 quantize.py -W 6 16 -I 1 6 -export 10 3
+	import argparse
+	import dataset
+	parser = argparse.ArgumentParser(description='Post-training ap_fixed quantization sweep and export')
+	parser.add_argument('-weights_dir', default=None, help='directory with layer_N_weights.txt files')
+	parser.add_argument('-keras_model', default=None, help='model saved by mnist_net.py instead of the text files')
+	parser.add_argument('-W', type=int, nargs=2, default=[4, 16], help='word width range (inclusive)')
+	parser.add_argument('-I', type=int, nargs=2, default=[1, 8], help='integer width range (inclusive)')
+	parser.add_argument('-tolerance', type=float, default=0.005, help='accepted accuracy drop vs float')
+	parser.add_argument('-export', type=int, nargs='*', default=None, metavar='W I',
+		help='write integer weights and matmul_fixed_W_I.hpp to -out_dir for this format, or for the cheapest one without W I')
+	parser.add_argument('-out_dir', default='.')
+	parser.add_argument('-csv', default=None, help='also write the sweep table to this file')
+	parser.add_argument('-dataset_dir', default=None)
+	parser.add_argument('-dims', type=int, nargs=2, default=[10, 10])
+	parser.add_argument('-workers', type=int, default=None)
+	parser.add_argument('-calibration', default=None, help='per-layer formats from calibrate.py instead of the sweep')
+	args = parser.parse_args()
+	if args.export is not None and len(args.export) not in (0, 2):
+		parser.error("-export takes no values (cheapest format) or W I")
+
+	weights = load_keras_weights(args.keras_model) if args.keras_model else nn_engine.load_weights_txt(args.weights_dir)
+	test_images, test_labels = dataset.load_dataset('testing', args.dims, dataset_dir=args.dataset_dir)
+	test_images = dataset.normalize(test_images).reshape(len(test_images), -1)
+
+	baseline_acc = np.mean(nn_engine.NNEngine(weights).predict(test_images) == test_labels)
+	print("float32 acc: ", baseline_acc)
+
+	if args.calibration:
+		import calibrate
+		input_format, formats, accs = calibrate.load_formats(args.calibration)
+		acc = np.mean(FixedPointEngine(weights, *input_format, formats=formats).predict(test_images) == test_labels)
+		print("Per-layer formats from %s: acc %.4f (%+.4f)" % (args.calibration, acc, acc - baseline_acc))
+		for n, ((wf, of), acc_t) in enumerate(zip(formats, accs), 1):
+			print("  layer %d: weights ap_fixed<%d,%d>, output ap_fixed<%d,%d>, acc_t ap_fixed<%d,%d>" % ((n,) + wf + of + acc_t))
+		filename = os.path.join(args.out_dir, "matmul_calibrated.hpp")
+		os.makedirs(args.out_dir, exist_ok=True)
+		write_int_weights(weights, [wf for wf, of in formats], args.out_dir)
+		write_calibrated_hpp(weights, input_format, formats, accs, filename)
+		print("Wrote layer_N_weights_W_I.txt (each layer in its weights format) and %s" % filename)
+		return
+
+	start_t = time.time()
+	results = sweep(weights, test_images, test_labels, range(args.W[0], args.W[1] + 1), range(args.I[0], args.I[1] + 1), args.workers)
+	print("Sweep of ", len(results), " configurations took ", time.time() - start_t, " seconds\n")
+
+	print("   W   I  F   acc     delta   MAC width")
+	for W, I, acc, mac in results:
+		print("%4d %3d %2d  %.4f  %+.4f  %4d" % (W, I, W - I, acc, acc - baseline_acc, mac))
+	if args.csv:
+		with open(args.csv, 'w') as file:
+			file.write("W,I,F,accuracy,delta,mac_width\n")
+			for W, I, acc, mac in results:
+				file.write("%d,%d,%d,%.6f,%.6f,%d\n" % (W, I, W - I, acc, acc - baseline_acc, mac))
+
+	best = cheapest(results, baseline_acc, args.tolerance)
+	if best:
+		print("\nCheapest within %.2f%% of float: ap_fixed<%d,%d> acc %.4f, MAC width %d" % (args.tolerance * 100, best[0], best[1], best[2], best[3]))
+	else:
+		print("\nNo configuration within %.2f%% of float" % (args.tolerance * 100))
+
+	if args.export is None:
+		return
+	export = args.export or (best[:2] if best else None)
+	if not export:
+		print("Nothing to export, give -export W I")
+	else:
+		W, I = export
+		os.makedirs(args.out_dir, exist_ok=True)
+		write_int_weights(weights, [(W, I)] * len(weights), args.out_dir)
+		write_hpp(weights, W, I, os.path.join(args.out_dir, "matmul_fixed_%d_%d.hpp" % (W, I)))
+		print("Wrote layer_N_weights_%d_%d.txt and matmul_fixed_%d_%d.hpp to %s" % (W, I, W, I, args.out_dir))
+
+
+if __name__=="__main__":
+	main()
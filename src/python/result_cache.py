@@ -0,0 +1,185 @@
+import numpy as np
+import collections
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+
+# Content-addressed cache of inference results. An image is keyed by a hash of
+# its pixels quantized to uint8 (what the framed protocol sends, and what the
+# 0 - 255 JPGs held before normalisation) together with a namespace naming the
+# engine and the digest of the weights it ran with, so retraining or a different
+# engine never returns stale results. Every entry holds the prediction and,
+# where the engine provides them, the softmax scores and the board cycle count.
+#
+# Recently used entries stay in an in-memory LRU of `capacity` results; with a
+# path, every result is also written to an SQLite file that later runs (and
+# other processes) read on a memory miss.
+
+DEFAULT_CAPACITY = 65536
+DEFAULT_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', '..', 'MNIST_Dataset_JPG', 'cache', 'results.sqlite')
+KEY_SIZE = 16 # bytes of blake2b digest
+
+CachedResult = collections.namedtuple('CachedResult', 'prediction scores cycles', defaults=(None, None))
+
+
+def weights_digest(weights):
+	"""Digest of a list of weight arrays (shapes and float32 values)"""
+	h = hashlib.blake2b(digest_size=KEY_SIZE)
+	for w in weights:
+		w = np.ascontiguousarray(w, dtype='<f4')
+		h.update(np.asarray(w.shape, dtype='<u4').tobytes())
+		h.update(w.tobytes())
+	return h.hexdigest()
+
+
+def file_digest(path):
+	"""Digest of a file's contents, e.g. a saved Keras model or matmul.hpp"""
+	h = hashlib.blake2b(digest_size=KEY_SIZE)
+	with open(path, 'rb') as file:
+		for block in iter(lambda: file.read(1 << 20), b''):
+			h.update(block)
+	return h.hexdigest()
+
+
+def quantize_pixels(images):
+	"""N images with 0 - 1 pixels as an N x n_inputs uint8 array"""
+	images = np.asarray(images, dtype=np.float32)
+	images = images.reshape(len(images), -1) if images.ndim > 1 else images.reshape(1, -1)
+	return np.clip(np.rint(images * 255), 0, 255).astype(np.uint8)
+
+
+class ResultCache:
+	"""Two-tier (LRU in memory, optional SQLite on disk) cache of per-image results
+
+	namespace: engine and weights the results belong to, e.g.
+	'keras:' + file_digest('mnist_net.h5'). Safe to use from several threads.
+	"""
+
+	def __init__(self, namespace, path=None, capacity=DEFAULT_CAPACITY):
+		self.namespace = namespace.encode()
+		self.capacity = capacity
+		self.entries = collections.OrderedDict()
+		self.lock = threading.Lock()
+		self.hits = self.disk_hits = self.misses = 0
+		self.db = None
+		if path:
+			os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+			self.db = sqlite3.connect(path, check_same_thread=False)
+			self.db.execute('CREATE TABLE IF NOT EXISTS results (key BLOB PRIMARY KEY, prediction INTEGER, cycles INTEGER, scores BLOB)')
+
+	def close(self):
+		if self.db:
+			with self.lock:
+				self.db.commit()
+				self.db.close()
+				self.db = None
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def keys(self, images):
+		"""Cache key of each image"""
+		prefix = hashlib.blake2b(self.namespace, digest_size=KEY_SIZE).digest()
+		return [hashlib.blake2b(row.tobytes(), digest_size=KEY_SIZE, key=prefix).digest() for row in quantize_pixels(images)]
+
+	def _remember(self, key, result):
+		self.entries[key] = result
+		self.entries.move_to_end(key)
+		if len(self.entries) > self.capacity:
+			self.entries.popitem(last=False)
+
+	def _get(self, key, require=None):
+		result = self.entries.get(key)
+		tier = 'memory'
+		if result is not None:
+			self.entries.move_to_end(key)
+		elif self.db:
+			row = self.db.execute('SELECT prediction, cycles, scores FROM results WHERE key = ?', (key,)).fetchone()
+			if row:
+				prediction, cycles, scores = row
+				result = CachedResult(prediction, None if scores is None else np.frombuffer(scores, dtype='<f4'), cycles)
+				self._remember(key, result)
+				tier = 'disk'
+		if result is None or (require and getattr(result, require) is None):
+			self.misses += 1
+			return None
+		if tier == 'memory':
+			self.hits += 1
+		else:
+			self.disk_hits += 1
+		return result
+
+	def get_key(self, key, require=None):
+		"""CachedResult stored under a key, None on a miss
+
+		require: 'scores' or 'cycles', an entry without that field counts as a miss
+		"""
+		with self.lock:
+			return self._get(key, require)
+
+	def put_key(self, key, prediction, scores=None, cycles=None, commit=True):
+		result = CachedResult(int(prediction), None if scores is None else np.asarray(scores, dtype='<f4'),
+			None if cycles is None else int(cycles))
+		with self.lock:
+			self._remember(key, result)
+			if self.db:
+				self.db.execute('INSERT OR REPLACE INTO results VALUES (?, ?, ?, ?)', (key, result.prediction, result.cycles,
+					None if result.scores is None else result.scores.tobytes()))
+				if commit:
+					self.db.commit()
+
+	def get(self, img):
+		return self.get_key(self.keys([img])[0])
+
+	def put(self, img, prediction, scores=None, cycles=None):
+		self.put_key(self.keys([img])[0], prediction, scores, cycles)
+
+	def predict_proba(self, images, compute):
+		"""Scores for N images, calling compute(images) -> N x K scores only for the misses, in one batch"""
+		images = np.asarray(images)
+		keys = self.keys(images)
+		cached = [self.get_key(key, 'scores') for key in keys]
+		missing = [n for n, result in enumerate(cached) if result is None]
+		computed = compute(images[missing]) if missing else []
+		for n, scores in zip(missing, computed):
+			self.put_key(keys[n], np.argmax(scores), scores, commit=False)
+			cached[n] = CachedResult(int(np.argmax(scores)), np.asarray(scores, dtype=np.float32))
+		if self.db and missing:
+			with self.lock:
+				self.db.commit()
+		return np.stack([result.scores for result in cached]) if cached else np.zeros((0, 0), dtype=np.float32)
+
+	def summary(self):
+		lookups = self.hits + self.disk_hits + self.misses
+		return ("Cache: %d lookups, %d memory hits, %d disk hits, %d misses (%.1f%% hit rate), %d entries in memory"
+			% (lookups, self.hits, self.disk_hits, self.misses, 100.0 * (self.hits + self.disk_hits) / max(1, lookups), len(self.entries)))
+
+
+def main():
+	## Show how much a warm cache saves, e.g. python3 result_cache.py -path /tmp/results.sqlite
+	import argparse
+	import dataset
+	import nn_engine
+	parser = argparse.ArgumentParser(description='Time the NumPy engine on the test set with a cold and a warm result cache')
+	parser.add_argument('-path', default=None, help='SQLite file of the disk tier, default memory only')
+	parser.add_argument('-capacity', type=int, default=DEFAULT_CAPACITY)
+	args = parser.parse_args()
+
+	engine = nn_engine.NNEngine.from_hpp()
+	images, labels = dataset.load_dataset('testing', (10, 10))
+	images = dataset.normalize(images)
+	with ResultCache('numpy:' + weights_digest(engine.weights), args.path, args.capacity) as cache:
+		for run in ('first', 'second'):
+			start_t = time.time()
+			scores = cache.predict_proba(images, engine.predict_proba)
+			print("%s pass: %.3f s, acc %.4f" % (run, time.time() - start_t, np.mean(np.argmax(scores, axis=1) == labels)))
+		print(cache.summary())
+
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,168 @@
+import itertools
+import json
+import multiprocessing
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+import dataset
+import hls_estimate
+
+# Training sweep over input resolutions and hidden-layer widths. Every
+# configuration trains in its own spawned CPU process (TensorFlow is only
+# imported there) from the streaming tf.data pipeline over the uint8 cache, and
+# reports test accuracy, parameter and MAC count per inference and the latency
+# of the fastest HLS configuration that fits the xc7z020 (hls_estimate.py).
+# Configurations are ranked along the accuracy / MAC Pareto frontier: a network
+# is on the frontier when no other one is at least as accurate with fewer MACs.
+# The weights of every run are kept as .nnw so the chosen one can be exported
+# with `weight_export.py -bin <file>` without retraining.
+
+
+def layer_sizes(dims, hidden, n_classes=10):
+	return [dims[0] * dims[1]] + list(hidden) + [n_classes]
+
+
+def mac_count(sizes):
+	"""Multiply-accumulates per inference of the bias-free dense network"""
+	return sum(a * b for a, b in zip(sizes, sizes[1:]))
+
+
+def config_name(dims, hidden):
+	return '%dx%d_%s' % (dims[0], dims[1], '-'.join(str(n) for n in hidden) or 'none')
+
+
+def hls_cycles(sizes):
+	"""Cycles of the fastest configuration that fits the xc7z020, None if nothing fits"""
+	best = hls_estimate.search(sizes, top=1)
+	return best[0].cycles if best else None
+
+
+def train_config(job):
+	"""Train and evaluate one configuration, meant to run in a fresh process"""
+	os.environ['CUDA_VISIBLE_DEVICES'] = '-1' # CPU only
+	os.environ['TF_CPP_MIN_LOG_LEVEL'] = '2'
+	import tensorflow as tf
+	import mnist_net
+	import weight_export
+	tf.config.threading.set_intra_op_parallelism_threads(job['threads'])
+	tf.config.threading.set_inter_op_parallelism_threads(job['threads'])
+	tf.keras.utils.set_random_seed(job['seed'])
+
+	dims, hidden = tuple(job['dims']), tuple(job['hidden'])
+	train_ds, val_ds = dataset.tf_dataset('training', dims, job['batch_size'], 'cache', validation_split=0.1,
+		seed=job['seed'], dataset_dir=job['dataset_dir'])
+	test_ds = dataset.tf_dataset('testing', dims, job['batch_size'], 'cache', dataset_dir=job['dataset_dir'])
+
+	model = mnist_net.build_model(dims, hidden)
+	start_t = time.time()
+	history = model.fit(train_ds, epochs=job['epochs'], validation_data=val_ds, verbose=0)
+	train_s = time.time() - start_t
+	loss, accuracy = model.evaluate(test_ds, verbose=0)
+
+	weights = [layer.weights[0].numpy() for layer in model.layers[1:]]
+	weights_file = os.path.join(job['out_dir'], config_name(dims, hidden) + '.nnw')
+	weight_export.write_weights_bin(weights_file, weights)
+	return {
+		'name': config_name(dims, hidden),
+		'dims': list(dims),
+		'hidden': list(hidden),
+		'accuracy': float(accuracy),
+		'val_accuracy': float(history.history['val_accuracy'][-1]),
+		'train_s': train_s,
+		'weights': weights_file,
+	}
+
+
+def pareto_frontier(results):
+	"""Mark results that no other result beats on both MACs (fewer) and accuracy (higher)"""
+	by_cost = sorted(results, key=lambda r: (r['macs'], -r['accuracy']))
+	best_acc = -1.0
+	for r in by_cost:
+		r['frontier'] = r['accuracy'] > best_acc
+		best_acc = max(best_acc, r['accuracy'])
+	return [r for r in by_cost if r['frontier']]
+
+
+def rank(results):
+	"""Frontier configurations first, cheapest first; then the rest by accuracy per MAC"""
+	pareto_frontier(results)
+	for r in results:
+		r['acc_per_kmac'] = r['accuracy'] / (r['macs'] / 1000.0)
+	return sorted(results, key=lambda r: (not r['frontier'], r['macs'] if r['frontier'] else -r['acc_per_kmac']))
+
+
+def run(grid, epochs=50, batch_size=2000, workers=None, seed=0, dataset_dir=None, out_dir='sweep'):
+	"""Train every (dims, hidden) pair of the grid in parallel processes, returns the ranked results"""
+	os.makedirs(out_dir, exist_ok=True)
+	for dims in sorted({dims for dims, hidden in grid}):
+		dataset.load_dataset('training', dims, dataset_dir=dataset_dir) # build caches once, before the workers race for them
+		dataset.load_dataset('testing', dims, dataset_dir=dataset_dir)
+
+	workers = workers or max(1, min(len(grid), (os.cpu_count() or 1) // 2))
+	threads = max(1, (os.cpu_count() or 1) // workers)
+	jobs = [{'dims': dims, 'hidden': hidden, 'epochs': epochs, 'batch_size': batch_size, 'seed': seed,
+		'threads': threads, 'dataset_dir': dataset_dir, 'out_dir': out_dir} for dims, hidden in grid]
+
+	results = []
+	context = multiprocessing.get_context('spawn') # fresh TensorFlow per process
+	with ProcessPoolExecutor(max_workers=workers, mp_context=context, max_tasks_per_child=1) as pool:
+		futures = {pool.submit(train_config, job): job for job in jobs}
+		for future in as_completed(futures):
+			result = future.result()
+			sizes = layer_sizes(result['dims'], result['hidden'])
+			result['params'] = result['macs'] = mac_count(sizes) # bias-free: one weight per MAC
+			result['hls_cycles'] = hls_cycles(sizes)
+			results.append(result)
+			print("%-16s acc %.4f  MACs %6d  (%.0f s)" % (result['name'], result['accuracy'], result['macs'], result['train_s']))
+	return rank(results)
+
+
+def print_table(results):
+	print("\n%-16s %8s %8s %8s %10s %10s  %s" % ('config', 'acc', 'params', 'MACs', 'acc/kMAC', 'HLS cyc', 'frontier'))
+	for r in results:
+		cycles = '%d' % r['hls_cycles'] if r['hls_cycles'] else 'no fit'
+		print("%-16s %8.4f %8d %8d %10.4f %10s  %s" % (r['name'], r['accuracy'], r['params'], r['macs'],
+			r['acc_per_kmac'], cycles, '*' if r['frontier'] else ''))
+
+
+def parse_hidden(spec):
+	"""'32,16' -> (32, 16), '' or 'none' -> ()"""
+	return tuple(int(n) for n in spec.split(',') if n and n != 'none')
+
+
+def main():
+	## e.g. python3 sweep.py -dims 8 10 14 -hidden 16 32,16 64,32 -epochs 20 -min_acc 0.95
+	import argparse
+	parser = argparse.ArgumentParser(description='Train a grid of input resolutions and hidden layers and rank them by accuracy per MAC')
+	parser.add_argument('-dims', type=int, nargs='+', default=[8, 10, 14], help='square input sizes')
+	parser.add_argument('-hidden', nargs='+', default=['16', '32,16', '64,32'], help='hidden layer widths per network, e.g. 32,16')
+	parser.add_argument('-epochs', type=int, default=50)
+	parser.add_argument('-batch_size', type=int, default=2000)
+	parser.add_argument('-workers', type=int, default=None, help='parallel training processes')
+	parser.add_argument('-seed', type=int, default=0)
+	parser.add_argument('-dataset_dir', default=None)
+	parser.add_argument('-out_dir', default='sweep', help='where the .nnw weights and sweep_results.json go')
+	parser.add_argument('-min_acc', type=float, default=None, help='report the cheapest network at or above this accuracy')
+	args = parser.parse_args()
+
+	grid = [((d, d), parse_hidden(h)) for d, h in itertools.product(args.dims, args.hidden)]
+	results = run(grid, args.epochs, args.batch_size, args.workers, args.seed, args.dataset_dir, args.out_dir)
+	print_table(results)
+
+	out_file = os.path.join(args.out_dir, 'sweep_results.json')
+	with open(out_file, 'w') as f:
+		json.dump(results, f, indent=2)
+	print("\nWrote", out_file)
+
+	if args.min_acc is not None:
+		ok = [r for r in results if r['accuracy'] >= args.min_acc]
+		if not ok:
+			sys.exit("No network reached %.4f" % args.min_acc)
+		best = min(ok, key=lambda r: r['macs'])
+		print("Cheapest network with acc >= %.4f: %s (%d MACs), export with: python3 weight_export.py -bin %s"
+			% (args.min_acc, best['name'], best['macs'], best['weights']))
+
+
+if __name__=="__main__":
+	main()
@@ -0,0 +1,313 @@
+import serial
+import numpy as np
+import collections
+import random
+import re
+import threading
+import time
+import protocol
+import result_cache
+
+# Streaming UART client. Keeps the serial port open, sends every image as one
+# 400-byte write and keeps up to `window` images in flight while a reader thread,
+# running for as long as the port is open, matches the board's replies to the
+# images that were sent.
+#
+# helloworld.c polls its UART byte by byte and then prints every received value,
+# so with a real board keep window=1; larger windows are for the board emulator.
+# With framed=<pixel format> images are sent in protocol.py frames, `batch` per frame.
+# With a result_cache.ResultCache, images the board already answered are not sent
+# again: their cached (prediction, cycles) reply is passed on straight away.
+
+BAUD_RATE = 115200
+BRAM_LINE = re.compile(rb'BRAM\[(\d+)\]:(\S+)')
+RESULT_LINE = re.compile(rb'RESULT:(-?\d+),(\d+)')
+
+
+def pack_image(img):
+	"""Return an image as NUM_INPUTS little-endian float32 values in a single buffer"""
+	return np.asarray(img, dtype='<f4').tobytes()
+
+
+class LineParser:
+	"""Splits the received bytes into lines and passes each to feed()"""
+
+	def __init__(self):
+		self._buf = b''
+
+	def feed_bytes(self, data):
+		"""Return the list of replies completed by data"""
+		self._buf += data
+		lines = self._buf.split(b'\n')
+		self._buf = lines.pop()
+		replies = []
+		for line in lines:
+			reply = self.feed(line)
+			if reply is not None:
+				replies.append(reply)
+		return replies
+
+
+class BramEchoParser(LineParser):
+	"""Parses helloworld.c's "BRAM[i]:value" lines, one reply per NUM_INPUTS lines"""
+
+	def __init__(self, n_inputs=100):
+		super().__init__()
+		self.n_inputs = n_inputs
+		self.values = []
+
+	def feed(self, line):
+		"""Return the echoed pixel values once a frame is complete, else None"""
+		m = BRAM_LINE.search(line)
+		if not m:
+			return None # banner or other print
+		if int(m.group(1)) == 0:
+			self.values = []
+		self.values.append(float(m.group(2)))
+		if int(m.group(1)) == self.n_inputs - 1:
+			return np.asarray(self.values, dtype=np.float32)
+		return None
+
+
+class ResultParser(LineParser):
+	"""Parses the board emulator's "RESULT:<prediction>,<cycles>" line"""
+
+	def feed(self, line):
+		"""Return (prediction, cycles) for a result line, else None"""
+		m = RESULT_LINE.search(line)
+		if not m:
+			return None
+		return int(m.group(1)), int(m.group(2))
+
+
+class FrameParser:
+	"""Decodes protocol.py results frames, one (prediction, cycles) reply per image"""
+
+	def __init__(self):
+		self.decoder = protocol.FrameDecoder()
+
+	def feed_bytes(self, data):
+		replies = []
+		for frame in self.decoder.feed(data):
+			if frame.type == protocol.TYPE_RESULTS:
+				predictions, cycles = protocol.decode_results(frame)
+				replies += zip(predictions.tolist(), cycles.tolist())
+		return replies
+
+
+PARSERS = {'bram': BramEchoParser, 'result': ResultParser, 'frame': FrameParser}
+FORMATS = {'uint8': protocol.FMT_UINT8, 'q15': protocol.FMT_Q15, 'float32': protocol.FMT_FLOAT32}
+
+
+class StreamStats:
+	"""Throughput and per-image round-trip latency of one stream() call"""
+
+	def __init__(self, latencies, elapsed, cached=0):
+		self.latencies = np.asarray(latencies)
+		self.count = len(latencies)
+		self.elapsed = elapsed
+		self.cached = cached
+
+	def images_per_s(self):
+		return self.count / self.elapsed if self.elapsed > 0 else 0.0
+
+	def summary(self):
+		cached = "  |  %d answered from cache" % self.cached if self.cached else ""
+		if not self.count:
+			return "No images sent" + cached
+		ms = self.latencies * 1000
+		return ("Images: %d  |  %.1f images/s  |  latency ms: mean %.2f  p50 %.2f  p95 %.2f  max %.2f"
+			% (self.count, self.images_per_s(), ms.mean(), np.percentile(ms, 50), np.percentile(ms, 95), ms.max())) + cached
+
+
+class _Stream:
+	"""State of one stream() call, shared with the reader thread through the pending entries"""
+
+	def __init__(self, window, on_reply, cache):
+		self.in_flight = threading.Semaphore(window)
+		self.latencies = []
+		self.on_reply = on_reply
+		self.cache = cache
+
+
+class StreamClient:
+	"""Open serial link to the board that streams images back-to-back
+
+	One reader thread per client matches the replies to the images of the current
+	stream() call for as long as the port is open.
+	"""
+
+	def __init__(self, port, baudrate=BAUD_RATE, parser=None, timeout=5.0, framed=None):
+		self.ser = serial.Serial(port, baudrate, serial.EIGHTBITS, serial.PARITY_NONE, serial.STOPBITS_ONE, timeout=0.05)
+		self.framed = framed
+		self.parser = parser or (FrameParser() if framed is not None else BramEchoParser())
+		self.timeout = timeout
+		self.seq = 0
+		self.error = None # exception that stopped the reader, raised by stream()
+		self.pending = collections.deque() # (index, sent_t, cache key, _Stream) per image in flight
+		self.drained = threading.Event() # set by the reader when the last pending image is answered
+		self.drained.set()
+		self.closed = threading.Event()
+		self.reader = threading.Thread(target=self._read_replies, daemon=True)
+		self.reader.start()
+
+	def close(self):
+		self.closed.set()
+		self.reader.join()
+		self.ser.close()
+
+	def __enter__(self):
+		return self
+
+	def __exit__(self, *exc):
+		self.close()
+
+	def send(self, img):
+		"""Send one image with a single write"""
+		self.send_batch([img])
+
+	def send_batch(self, images):
+		"""Send a batch of images with a single write (one frame when framed)"""
+		if self.framed is not None:
+			self.ser.write(protocol.encode_images(np.asarray(images), self.seq, self.framed))
+			self.seq = (self.seq + 1) & 0xFFFF
+		else:
+			self.ser.write(b''.join(pack_image(img) for img in images))
+
+	def _read_replies(self):
+		try:
+			while not self.closed.is_set():
+				data = self.ser.read(max(1, self.ser.in_waiting))
+				if data:
+					self._dispatch(self.parser.feed_bytes(data))
+		except Exception as e: # serial.SerialException (board unplugged), a parser or on_reply error
+			self.error = e
+			self.drained.set() # wakes stream() waiting for the last replies
+
+	def _dispatch(self, replies):
+		for reply in replies:
+			try:
+				index, sent_t, key, state = self.pending.popleft()
+			except IndexError:
+				continue # reply to something sent before this stream
+			latency = time.perf_counter() - sent_t
+			state.latencies.append(latency)
+			state.in_flight.release()
+			if state.cache and isinstance(reply, tuple): # (prediction, cycles); helloworld.c echoes are not results
+				state.cache.put_key(key, reply[0], cycles=reply[1])
+			if state.on_reply:
+				state.on_reply(index, reply, latency)
+			if not self.pending:
+				self.drained.set()
+
+	def _no_reply(self, message):
+		return self.error or TimeoutError(message)
+
+	def stream(self, images, window=1, on_reply=None, batch=1, cache=None):
+		"""Send images from an iterable keeping at most `window` in flight
+
+		Images are sent `batch` at a time; when the window fills up first, the partial
+		batch is sent as it is (keep window a multiple of batch for full frames).
+		on_reply(index, reply, latency_s) is called from the reader thread for every reply,
+		and right away with latency 0 for images found in the result cache. All calls
+		have returned when stream() returns a StreamStats.
+		"""
+		if self.error:
+			raise self.error
+		state = _Stream(window, on_reply, cache)
+		cached = 0
+		start_t = time.perf_counter()
+		try:
+			chunk = []
+			for index, img in enumerate(images):
+				key = None
+				if cache:
+					key = cache.keys([img])[0]
+					result = cache.get_key(key, 'cycles')
+					if result is not None:
+						cached += 1
+						if on_reply:
+							on_reply(index, (result.prediction, result.cycles), 0.0)
+						continue
+				if not state.in_flight.acquire(blocking=False):
+					if chunk: # the window is full: send the partial frame, its replies free the slots
+						self._send_chunk(chunk, state)
+						chunk = []
+					if self.error:
+						raise self.error
+					if not state.in_flight.acquire(timeout=self.timeout):
+						raise self._no_reply("No reply from board within %.1f s" % self.timeout)
+				chunk.append((index, img, key))
+				if len(chunk) == batch:
+					self._send_chunk(chunk, state)
+					chunk = []
+			if chunk:
+				self._send_chunk(chunk, state)
+			deadline = time.perf_counter() + self.timeout
+			while self.pending:
+				remaining = deadline - time.perf_counter()
+				if remaining <= 0 or self.error:
+					raise self._no_reply("%d images still unanswered after %.1f s" % (len(self.pending), self.timeout))
+				self.drained.wait(remaining)
+		finally:
+			self.pending.clear()
+		return StreamStats(state.latencies, time.perf_counter() - start_t, cached)
+
+	def _send_chunk(self, chunk, state):
+		sent_t = time.perf_counter()
+		self.drained.clear()
+		self.pending.extend((index, sent_t, key, state) for index, img, key in chunk)
+		self.send_batch([img for index, img, key in chunk])
+
+
+def open_board_cache(path=None, hpp_path=None, framed=None):
+	"""ResultCache for board replies, keyed by the weights in matmul.hpp (those of the bitstream)
+	and the pixel format on the wire (framed, None for raw float32 images)"""
+	import nn_engine
+	wire = 'raw' if framed is None else {code: name for name, code in FORMATS.items()}[framed]
+	return result_cache.ResultCache('board:%s:%s' % (result_cache.file_digest(hpp_path or nn_engine.DEFAULT_HPP), wire), path)
+
+
+def test_images(count, dims=(10,10), shuffle=True):
+	"""Yield (label, image) pairs from the test set"""
+	import dataset
+	images, labels = dataset.load_dataset('testing', dims)
+	order = list(range(len(images)))
+	if shuffle:
+		random.shuffle(order)
+	for i in order[:count]:
+		yield labels[i], dataset.normalize(images[i])
+
+
+def main():
+	## Stream test images, e.g. python3 uart_stream.py -port /dev/ttyUSB1 -count 100 -window 1
+	import argparse
+	parser = argparse.ArgumentParser(description='Stream MNIST test images to the board over UART')
+	parser.add_argument('-port', required=True)
+	parser.add_argument('-baud', type=int, default=BAUD_RATE)
+	parser.add_argument('-count', type=int, default=100)
+	parser.add_argument('-window', type=int, default=1, help='images in flight (keep 1 for helloworld.c)')
+	parser.add_argument('-timeout', type=float, default=5.0)
+	parser.add_argument('-reply', choices=sorted(PARSERS), default='bram', help='bram: helloworld.c echo, result: board emulator prediction, frame: framed protocol')
+	parser.add_argument('-framed', choices=sorted(FORMATS), default=None, help='send protocol.py frames with this pixel format')
+	parser.add_argument('-batch', type=int, default=1, help='images per write/frame')
+	parser.add_argument('-cache', nargs='?', const=result_cache.DEFAULT_PATH, default=None,
+		help='reuse board results of images already sent (SQLite file, default in the dataset cache directory)')
+	parser.add_argument('-hpp', default=None, help='matmul.hpp of the bitstream on the board, keys the cache')
+	args = parser.parse_args()
+	if args.window < args.batch:
+		parser.error("-window must be at least -batch, e.g. -batch 8 -window 16")
+
+	framed = FORMATS[args.framed] if args.framed else None
+	reply_parser = FrameParser() if framed is not None else PARSERS[args.reply]()
+	cache = open_board_cache(args.cache, args.hpp, framed) if args.cache else None
+	with StreamClient(args.port, args.baud, reply_parser, args.timeout, framed) as client:
+		stats = client.stream((img for label, img in test_images(args.count)), args.window, batch=args.batch, cache=cache)
+	print(stats.summary())
+	if cache:
+		print(cache.summary())
+		cache.close()
+
+
+if __name__=="__main__":
+	main()
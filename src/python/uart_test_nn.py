@@ -1,33 +1,30 @@
-import serial
-import os
 import random
-import cv2
+import dataset
+import uart_stream
 import numpy as np
-import struct
-import time
-import sys
 def main():
-	args = sys.argv[1:]
-	if len(args) == 2 and args[0] == '-port':
-		port = str(args[1])	
+	## e.g. python3 uart_test_nn.py -port /dev/ttyUSB1
+	import argparse
+	import serial
+	parser = argparse.ArgumentParser(description='Send one random test image to the board over UART')
+	parser.add_argument('-port', required=True)
+	args = parser.parse_args()
+	port = args.port
 
 
 	dims = (10,10) # dimensions of images to train/test with
 
+	test_images, test_labels = dataset.load_dataset('testing', dims)
+
 	randomint = random.randrange(10)
-	read_dir = os.path.expanduser("~") + '/Downloads/MNIST_Dataset_JPG/MNIST_JPG_testing/' + str(randomint) + '/'
-	read_file = random.choice(os.listdir(read_dir)) # choose random test image
-	img = cv2.imread(os.path.join(read_dir,read_file),0) # read img as grayscale
-	img = cv2.resize(img, dims, interpolation = cv2.INTER_AREA)	# resize img to fit dims
-	img = np.asarray((img / 255)).astype('float32')
-	print("Label: ", str(randomint), " Filename: ", read_file, " Serialport: ", port) # print test image label
+	index = random.choice(np.flatnonzero(test_labels == randomint)) # choose random test image
+	img = dataset.normalize(test_images[index])
+	print("Label: ", str(randomint), " Test index: ", index, " Serialport: ", port) # print test image label
 	# define serial connection
 	ser = serial.Serial(port, 115200, serial.EIGHTBITS, serial.PARITY_NONE, serial.STOPBITS_ONE)
 
-	for i in range(dims[1]):
-		for j in range(dims[0]):
-			values = bytearray(struct.pack("f", img[i][j])) # turn pixel values into bytearray
-			ser.write(values) # send bytearray over UART
+	ser.write(uart_stream.pack_image(img)) # send all pixel values as one float32 buffer over UART
+	ser.close()
 
 	
 if __name__=="__main__":
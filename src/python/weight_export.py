@@ -0,0 +1,208 @@
+import numpy as np
+import os
+import struct
+import sys
+import nn_engine
+
+# Versioned binary weight format and code generation for the HLS and Vitis sources.
+#
+# .nnw layout (little-endian):
+#   header  : magic b'NNWT', uint16 version, uint16 dtype code, uint16 layer count
+#   shapes  : uint32 rows, uint32 cols for every layer
+#   data    : every layer's row-major array, back to back
+# Each layer is dumped with a single tofile() call and read back with np.frombuffer.
+
+MAGIC = b'NNWT'
+VERSION = 1
+HEADER = struct.Struct('<4sHHH')
+SHAPE = struct.Struct('<II')
+DTYPES = {0: np.dtype('<f4'), 1: np.dtype('<i2'), 2: np.dtype('<i4')}
+
+HLS_DIR = os.path.join(nn_engine.REPO_DIR, 'src', 'hls')
+VITIS_DIR = os.path.join(nn_engine.REPO_DIR, 'src', 'vitis')
+DEFAULT_BIN = os.path.join(nn_engine.REPO_DIR, 'weights.nnw')
+DEFAULT_VITIS_HEADER = os.path.join(VITIS_DIR, 'nn_config.h')
+
+
+def _dtype_code(dtype):
+	for code, dt in DTYPES.items():
+		if np.dtype(dtype).newbyteorder('<') == dt:
+			return code
+	raise ValueError("Unsupported weight dtype " + str(dtype))
+
+
+def write_weights_bin(filename, weights):
+	"""Write a list of 2D weight arrays (all of the same dtype) to a .nnw file"""
+	weights = [np.asarray(w) for w in weights]
+	code = _dtype_code(weights[0].dtype)
+	with open(filename, 'wb') as file:
+		file.write(HEADER.pack(MAGIC, VERSION, code, len(weights)))
+		for w in weights:
+			file.write(SHAPE.pack(*w.shape))
+		for w in weights:
+			np.ascontiguousarray(w, dtype=DTYPES[code]).tofile(file)
+
+
+def read_weights_bin(filename):
+	"""Read a .nnw file back into a list of 2D arrays"""
+	with open(filename, 'rb') as file:
+		data = file.read()
+	magic, version, code, n_layers = HEADER.unpack_from(data, 0)
+	if magic != MAGIC:
+		raise ValueError(filename + " is not a .nnw weight file")
+	if version != VERSION:
+		raise ValueError("Unsupported .nnw version %d in %s" % (version, filename))
+	if code not in DTYPES:
+		raise ValueError("Unsupported dtype code %d in %s" % (code, filename))
+	dtype = DTYPES[code]
+	offset = HEADER.size
+	shapes = []
+	for n in range(n_layers):
+		shapes.append(SHAPE.unpack_from(data, offset))
+		offset += SHAPE.size
+	weights = []
+	for rows, cols in shapes:
+		weights.append(np.frombuffer(data, dtype=dtype, count=rows * cols, offset=offset).reshape(rows, cols))
+		offset += rows * cols * dtype.itemsize
+	if offset != len(data):
+		raise ValueError("Trailing or missing data in " + filename)
+	return weights
+
+
+def layer_sizes(weights):
+	"""Return [(name, size)] for n_inputs, n_layer1, n_layer2, ..."""
+	sizes = [weights[0].shape[0]] + [w.shape[1] for w in weights]
+	names = ['n_inputs'] + ['n_layer%d' % (n + 1) for n in range(len(weights))]
+	return list(zip(names, sizes))
+
+
+def hpp_text(weights, data_type='float', preamble=('#include "ap_int.h"',), typedefs=(), fmt=None, input_type=None, layer_types=None):
+	"""Return matmul.hpp source with #defines, declarations and the weights namespace
+
+	input_type and layer_types, [(weights type, output type)] per layer, replace
+	data_type for the pixels and for each layer's weights and output arrays.
+	"""
+	names = [name for name, size in layer_sizes(weights)]
+	layer_types = layer_types or [(data_type, data_type)] * len(weights)
+	in_t = input_type or data_type
+	lines = list(preamble) + ['']
+	for name, size in layer_sizes(weights):
+		lines.append('#define %s %d' % (name, size))
+	lines.append('')
+	if typedefs:
+		lines += list(typedefs) + ['']
+	lines.append('void hwmm_layer1(%s input[n_inputs], const %s weights[n_inputs][n_layer1], %s output[1][n_layer1]);' % ((in_t,) + layer_types[0]))
+	for n in range(1, len(weights)):
+		t = layer_types[n - 1][1]
+		lines.append('void hw_act_layer%d(%s input[1][%s], %s output[1][%s]);' % (n, t, names[n], t, names[n]))
+		lines.append('void hwmm_layer%d(%s input[1][%s], const %s weights[%s][%s], %s output[1][%s]);'
+			% (n + 1, t, names[n], layer_types[n][0], names[n], names[n + 1], layer_types[n][1], names[n + 1]))
+	lines.append('void hw_act_layer%d(%s input[1][%s], int &pred);' % (len(weights), layer_types[-1][1], names[-1]))
+	lines += ['int nn_inference(%s input_img[n_inputs]);' % in_t, '', '', 'namespace weights{', '']
+
+	for n in reversed(range(len(weights))): # last layer first, as in the original matmul.hpp
+		text = nn_engine.format_weight_text(weights[n], fmt)
+		lines.append('\tconst %s layer%d_weights[%s][%s] = %s;' % (layer_types[n][0], n + 1, names[n], names[n + 1], text.replace('\n', '\n\t\t\t')))
+		lines.append('')
+	lines.append('}')
+	return '\n'.join(lines) + '\n'
+
+
+def vitis_header_text(weights, bytes_pr_input=4):
+	"""Return nn_config.h with the network constants used by helloworld.c"""
+	lines = ['/* Generated by src/python/weight_export.py - do not edit by hand */',
+		'#ifndef NN_CONFIG_H',
+		'#define NN_CONFIG_H',
+		'']
+	for name, size in layer_sizes(weights):
+		lines.append('#define %s\t\t%d' % (name.upper(), size))
+	lines += ['',
+		'#define NUM_INPUTS\t\tN_INPUTS\t\t// number of pixel in input image',
+		'#define BYTES_PR_INPUT\t\t%d\t\t\t// 32 bit float = 4 bytes' % bytes_pr_input,
+		'',
+		'#endif']
+	return '\n'.join(lines) + '\n'
+
+
+def export(weights, bin_file=DEFAULT_BIN, hpp_file=None, vitis_header=None):
+	"""Write the binary weights and regenerate the HLS and Vitis headers from them"""
+	weights = [np.asarray(w, dtype=np.float32) for w in weights]
+	if bin_file:
+		write_weights_bin(bin_file, weights)
+		if not all(np.array_equal(a, b) for a, b in zip(read_weights_bin(bin_file), weights)):
+			raise ValueError(bin_file + " does not read back to the exported weights")
+	if hpp_file:
+		with open(hpp_file, 'w') as file:
+			file.write(hpp_text(weights))
+	if vitis_header:
+		with open(vitis_header, 'w') as file:
+			file.write(vitis_header_text(weights))
+
+
+def check(weights_dir=None, hpp_file=None, bin_file=DEFAULT_BIN):
+	"""Validate the exported weights, returns a list of problems (empty when everything matches)
+
+	Parses layer_N_weights.txt without the cache and checks their shapes against the
+	#defines of hpp_file, that the text format and the .nnw sidecar round-trip to the
+	same float32 values, and that the header's weight arrays equal the text files.
+	A missing sidecar is a problem as well.
+	"""
+	hpp_file = hpp_file or os.path.join(HLS_DIR, 'matmul.hpp')
+	try:
+		weights = nn_engine.load_weights_txt(weights_dir, hpp_file, cache=False)
+	except (OSError, ValueError) as e:
+		return [str(e)]
+	problems = []
+	for n, w in enumerate(weights, 1):
+		if not np.array_equal(nn_engine.parse_weight_text(nn_engine.format_weight_text(w)), w):
+			problems.append("layer %d: the text format does not round-trip" % n)
+	try:
+		for n, (a, b) in enumerate(zip(nn_engine.load_weights_hpp(hpp_file, cache=False), weights), 1):
+			if not np.array_equal(a, b):
+				problems.append("layer %d: %s differs from layer_%d_weights.txt" % (n, hpp_file, n))
+	except (OSError, ValueError) as e:
+		problems.append(str(e))
+	if not os.path.exists(bin_file):
+		problems.append("%s does not exist, the .nnw round trip was not checked (python3 weight_export.py writes it)" % bin_file)
+	else:
+		try:
+			sidecar = read_weights_bin(bin_file)
+			if len(sidecar) != len(weights) or not all(np.array_equal(a, b) for a, b in zip(sidecar, weights)):
+				problems.append("%s differs from the layer_N_weights.txt files" % bin_file)
+		except (OSError, ValueError, struct.error) as e:
+			problems.append("%s: %s" % (bin_file, e))
+	return problems
+
+
+def main():
+	## Regenerate matmul.hpp and nn_config.h, e.g. python3 weight_export.py -bin ../../weights.nnw
+	import argparse
+	parser = argparse.ArgumentParser(description='Generate matmul.hpp and the Vitis nn_config.h from exported weights')
+	parser.add_argument('-bin', default=None, help='.nnw weight file (default: read layer_N_weights.txt and write weights.nnw)')
+	parser.add_argument('-weights_dir', default=None, help='directory with layer_N_weights.txt files')
+	parser.add_argument('-hpp', default=os.path.join(HLS_DIR, 'matmul.hpp'))
+	parser.add_argument('-vitis_header', default=DEFAULT_VITIS_HEADER)
+	parser.add_argument('-check', action='store_true', help='only validate the text files against -hpp and the .nnw sidecar, exit 1 on a problem')
+	args = parser.parse_args()
+
+	if args.check:
+		problems = check(args.weights_dir, args.hpp, args.bin or DEFAULT_BIN)
+		for problem in problems:
+			print(problem)
+		if problems:
+			sys.exit(1)
+		print("Weights OK")
+		return
+
+	if args.bin and os.path.exists(args.bin):
+		weights = read_weights_bin(args.bin)
+		export(weights, None, args.hpp, args.vitis_header)
+	else:
+		weights = nn_engine.load_weights_txt(args.weights_dir)
+		export(weights, args.bin or DEFAULT_BIN, args.hpp, args.vitis_header)
+	print("Layer sizes: ", [size for name, size in layer_sizes(weights)])
+	print("Wrote ", args.hpp, " and ", args.vitis_header)
+
+
+if __name__=="__main__":
+	main()
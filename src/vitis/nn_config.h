@@ -0,0 +1,13 @@
+/* Generated by src/python/weight_export.py - do not edit by hand */
+#ifndef NN_CONFIG_H
+#define NN_CONFIG_H
+
+#define N_INPUTS		100
+#define N_LAYER1		32
+#define N_LAYER2		16
+#define N_LAYER3		10
+
+#define NUM_INPUTS		N_INPUTS		// number of pixel in input image
+#define BYTES_PR_INPUT		4			// 32 bit float = 4 bytes
+
+#endif
@@ -0,0 +1,167 @@
+#include <string.h>
+#include "nn_protocol.h"
+
+/*
+ * Byte-at-a-time parser for the framed protocol, meant to replace the raw
+ * NUM_INPUTS*BYTES_PR_INPUT receive loop in helloworld.c:
+ *
+ *	nn_parser_init(&parser);
+ *	while (1) {
+ *		if (nn_parser_feed(&parser, XUartPs_RecvByte(XPAR_XUARTPS_0_BASEADDR))) {
+ *			for (int n = 0; n < parser.count; n++) {
+ *				for (int i = 0; i < NUM_INPUTS; i++)
+ *					BRAM(i) = nn_pixel_bits(&parser, n, i);	// write to BRAM
+ *				... run nn_inference, collect pred[n] and cycles[n] ...
+ *			}
+ *			len = nn_encode_results(tx_buf, parser.seq, parser.count, pred, cycles);
+ *			for (int i = 0; i < len; i++)
+ *				XUartPs_SendByte(XPAR_XUARTPS_0_BASEADDR, tx_buf[i]);
+ *		}
+ *	}
+ *
+ * A frame with a bad header or CRC is dropped and the parser hunts for the next
+ * sync word, so a lost byte no longer desynchronises the receive loop forever.
+ */
+
+enum { ST_SYNC0, ST_SYNC1, ST_HEADER, ST_PAYLOAD, ST_CRC0, ST_CRC1 };
+
+static const uint8_t pixel_size[] = {1, 2, 4};	// indexed by NN_FMT_*
+
+
+uint16_t nn_crc16(uint16_t crc, const uint8_t *data, uint32_t len){
+	// CRC-16/CCITT-FALSE, poly 0x1021
+	for (uint32_t i = 0; i < len; i++) {
+		crc ^= (uint16_t)data[i] << 8;
+		for (int b = 0; b < 8; b++)
+			crc = (crc & 0x8000) ? (crc << 1) ^ 0x1021 : (crc << 1);
+	}
+	return crc;
+}
+
+
+void nn_parser_init(nn_parser_t *p){
+	p->state = ST_SYNC0;
+	p->pos = 0;
+	p->crc_errors = 0;
+}
+
+
+static int header_valid(nn_parser_t *p){
+	uint8_t *h = p->header;
+	p->type = h[1];
+	p->seq = h[2] | (h[3] << 8);
+	p->count = h[4] | (h[5] << 8);
+	p->format = h[6];
+	p->n_inputs = h[7] | (h[8] << 8);
+
+	if (h[0] != NN_PROTOCOL_VERSION || p->type != NN_TYPE_IMAGES)
+		return 0;
+	if (p->format > NN_FMT_FLOAT32 || p->n_inputs != NUM_INPUTS)
+		return 0;
+	if (p->count == 0 || p->count > NN_MAX_BATCH)
+		return 0;
+	p->expected = (uint32_t)p->count * p->n_inputs * pixel_size[p->format];
+	return 1;
+}
+
+
+/* Returns 1 when a complete, CRC-checked images frame is in p->payload */
+int nn_parser_feed(nn_parser_t *p, uint8_t byte){
+	switch (p->state) {
+	case ST_SYNC0:
+		if (byte == NN_SYNC0)
+			p->state = ST_SYNC1;
+		break;
+	case ST_SYNC1:
+		if (byte == NN_SYNC1) {
+			p->state = ST_HEADER;
+			p->pos = 0;
+		} else if (byte != NN_SYNC0) {
+			p->state = ST_SYNC0;
+		}
+		break;
+	case ST_HEADER:
+		p->header[p->pos++] = byte;
+		if (p->pos == NN_HEADER_SIZE) {
+			if (header_valid(p)) {
+				p->crc = nn_crc16(0xFFFF, p->header, NN_HEADER_SIZE);
+				p->pos = 0;
+				p->state = ST_PAYLOAD;
+			} else {
+				p->state = ST_SYNC0;
+			}
+		}
+		break;
+	case ST_PAYLOAD:
+		p->payload[p->pos++] = byte;
+		if (p->pos == p->expected) {
+			p->crc = nn_crc16(p->crc, p->payload, p->expected);
+			p->state = ST_CRC0;
+		}
+		break;
+	case ST_CRC0:
+		p->rx_crc = byte;
+		p->state = ST_CRC1;
+		break;
+	case ST_CRC1:
+		p->rx_crc |= (uint16_t)byte << 8;
+		p->state = ST_SYNC0;
+		if (p->rx_crc == p->crc)
+			return 1;
+		p->crc_errors++;
+		break;
+	}
+	return 0;
+}
+
+
+/* Pixel i of image n as the 32-bit float bit pattern nn_inference reads from BRAM */
+uint32_t nn_pixel_bits(const nn_parser_t *p, int image, int i){
+	uint32_t idx = (uint32_t)image * p->n_inputs + i;
+	uint32_t bits;
+	float value;
+
+	switch (p->format) {
+	case NN_FMT_UINT8:
+		value = p->payload[idx] / 255.0f;
+		break;
+	case NN_FMT_Q15:
+		value = (p->payload[idx*2] | (p->payload[idx*2+1] << 8)) / 32768.0f;
+		break;
+	default:
+		memcpy(&bits, &p->payload[idx*4], 4);	// already little-endian float32
+		return bits;
+	}
+	memcpy(&bits, &value, 4);
+	return bits;
+}
+
+
+/* Write a results frame to out (at most NN_MAX_RESULTS_FRAME bytes), returns its length */
+uint32_t nn_encode_results(uint8_t *out, uint16_t seq, uint16_t count, const uint8_t *pred, const uint32_t *cycles){
+	uint32_t len = 0;
+	uint16_t crc;
+
+	out[len++] = NN_SYNC0;
+	out[len++] = NN_SYNC1;
+	out[len++] = NN_PROTOCOL_VERSION;
+	out[len++] = NN_TYPE_RESULTS;
+	out[len++] = seq & 0xFF;
+	out[len++] = seq >> 8;
+	out[len++] = count & 0xFF;
+	out[len++] = count >> 8;
+	out[len++] = 0;		// format
+	out[len++] = 0;		// n_inputs
+	out[len++] = 0;
+	for (int n = 0; n < count; n++) {
+		out[len++] = pred[n];
+		out[len++] = cycles[n] & 0xFF;
+		out[len++] = (cycles[n] >> 8) & 0xFF;
+		out[len++] = (cycles[n] >> 16) & 0xFF;
+		out[len++] = cycles[n] >> 24;
+	}
+	crc = nn_crc16(0xFFFF, &out[2], len - 2);
+	out[len++] = crc & 0xFF;
+	out[len++] = crc >> 8;
+	return len;
+}
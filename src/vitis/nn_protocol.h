@@ -0,0 +1,53 @@
+/*
+ * Framed host <-> board protocol, reference implementation of src/python/protocol.py
+ *
+ * sync(A5 5A) | version | type | seq(u16) | count(u16) | format | n_inputs(u16) | payload | crc16
+ * All multi-byte fields are little-endian. The CRC is CRC-16/CCITT-FALSE over
+ * version..payload. Images frames carry count*n_inputs pixels, results frames carry
+ * count*(uint8 prediction, uint32 cycles).
+ */
+#ifndef NN_PROTOCOL_H
+#define NN_PROTOCOL_H
+
+#include <stdint.h>
+#include "nn_config.h"
+
+#define NN_SYNC0			0xA5
+#define NN_SYNC1			0x5A
+#define NN_PROTOCOL_VERSION	1
+#define NN_TYPE_IMAGES		0x01
+#define NN_TYPE_RESULTS		0x81
+
+#define NN_FMT_UINT8		0		// pixel * 255
+#define NN_FMT_Q15			1		// pixel * 2^15 as uint16
+#define NN_FMT_FLOAT32		2		// raw float32
+
+#define NN_HEADER_SIZE		9
+#define NN_MAX_BATCH		16		// images per frame the parser can buffer
+#define NN_MAX_PAYLOAD		(NN_MAX_BATCH*NUM_INPUTS*4)
+#define NN_RESULT_SIZE		5
+#define NN_MAX_RESULTS_FRAME	(2 + NN_HEADER_SIZE + NN_MAX_BATCH*NN_RESULT_SIZE + 2)
+
+typedef struct {
+	uint8_t		state;
+	uint32_t	pos;
+	uint32_t	expected;
+	uint16_t	crc;
+	uint16_t	rx_crc;
+	uint8_t		header[NN_HEADER_SIZE];
+	uint8_t		type;
+	uint8_t		format;
+	uint16_t	seq;
+	uint16_t	count;
+	uint16_t	n_inputs;
+	uint32_t	crc_errors;
+	uint8_t		payload[NN_MAX_PAYLOAD];
+} nn_parser_t;
+
+uint16_t	nn_crc16(uint16_t crc, const uint8_t *data, uint32_t len);
+void		nn_parser_init(nn_parser_t *p);
+int			nn_parser_feed(nn_parser_t *p, uint8_t byte);
+uint32_t	nn_pixel_bits(const nn_parser_t *p, int image, int i);
+uint32_t	nn_encode_results(uint8_t *out, uint16_t seq, uint16_t count, const uint8_t *pred, const uint32_t *cycles);
+
+#endif